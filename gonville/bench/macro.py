@@ -0,0 +1,38 @@
+# Macro-benchmarks: whole builds, each run by invoking glyphs.py in a
+# scratch directory exactly as a user would.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+gonville = os.path.dirname(here)
+
+# Each build's glyphs.py arguments, and the external programs it needs
+# besides the tracing tools.
+BENCHMARKS = [
+    ("lilymain", ["--lilymain"], ["fontforge"]),
+    ("lilybrace-fast", ["--lilybrace", "--fastbrace"], ["fontforge"]),
+    ("simple", ["--simple"], ["fontforge"]),
+]
+
+def missing_tools(tools, tracer):
+    if tracer == "potrace":
+        tools = tools + ["gs", "potrace"]
+    return [t for t in tools if shutil.which(t) is None]
+
+def build(args, tracer, jobs=None):
+    # Run one build from scratch, returning the wall-clock time it took.
+    with tempfile.TemporaryDirectory(prefix="gonville-bench-") as d:
+        shutil.copy(os.path.join(gonville, "script.ff"), d)
+        command = [sys.executable, os.path.join(gonville, "glyphs.py"),
+                   "--tracer", tracer, "--untuned"] + args
+        if jobs is not None:
+            command += ["-j", str(jobs)]
+        start = time.perf_counter()
+        subprocess.run(command, cwd=d, check=True,
+                       stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
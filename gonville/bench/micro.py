@@ -0,0 +1,96 @@
+# Micro-benchmarks for the inner loops of the glyph pipeline.
+#
+# Each benchmark is a function which does any setup and returns a
+# callable to be timed, so that the setup isn't counted. They're
+# collected in BENCHMARKS in the order run.py runs them.
+
+import curves
+import psrender
+import tracer
+from font import font
+from outline import Outline, MOVETO, LINETO, CURVETO, CLOSEPATH, break_curves
+import glyphs
+
+def first_curve(cls):
+    # Find a curve of the given class in one of the real glyphs, so that
+    # we time it with realistic parameters.
+    for name in dir(font):
+        char = getattr(font, name)
+        for curve in getattr(char, "curves", {}).values():
+            if type(curve) is cls:
+                return curve
+    raise ValueError("no %s in any glyph" % cls.__name__)
+
+def compute_point(cls):
+    curve = first_curve(cls)
+    ts = [i / 1000.0 for i in range(1001)]
+    def run():
+        for t in ts:
+            curve.compute_point(t)
+    return run
+
+def circle_involute():
+    return compute_point(curves.CircleInvolute)
+
+def exponential_involute():
+    return compute_point(curves.ExponentialInvolute)
+
+def makeps(char):
+    return lambda: char.makeps()
+
+def makeps_clefG():
+    return makeps(font.clefG)
+
+def makeps_tailquaverup():
+    return makeps(font.tailquaverup)
+
+def makeps_scaledbrace():
+    # The middle of the range of brace sizes.
+    return makeps(glyphs.brace_glyph(288))
+
+def unbroken_outline():
+    # A traced outline of a complicated glyph, before break_curves.
+    char = font.clefG
+    return tracer.trace(psrender.render(char), char.trace_res)
+
+def break_curve():
+    path = unbroken_outline()
+    return lambda: break_curves(path)
+
+def potrace_output(path, scale):
+    # Write an Outline out the way potrace would: relative moves,
+    # lines and curves in integer units of 1/scale, one per line.
+    lines = ["%!PS-Adobe-3.0 EPSF-3.0", "gsave", "0 0 translate",
+             "0.1 -0.1 scale", "0 setgray", "newpath"]
+    x0 = y0 = 0
+    for op, c in path:
+        c = [round(v / scale) for v in c]
+        if op == MOVETO:
+            lines.append("%d %d moveto" % (c[0], c[1]))
+            x0, y0 = c[0], c[1]
+        elif op == LINETO:
+            lines.append("%d %d rlineto" % (c[2]-x0, c[3]-y0))
+            x0, y0 = c[2], c[3]
+        elif op == CURVETO:
+            lines.append("%d %d %d %d %d %d rcurveto" %
+                         (c[2]-x0, c[3]-y0, c[4]-x0, c[5]-y0, c[6]-x0, c[7]-y0))
+            x0, y0 = c[6], c[7]
+        elif op == CLOSEPATH:
+            lines.append("closepath")
+    lines += ["fill", "grestore", "showpage", "%%EOF"]
+    return "\n".join(lines) + "\n"
+
+def potrace_parser():
+    scale = 4.0 / font.clefG.trace_res
+    text = potrace_output(unbroken_outline(), scale)
+    return lambda: glyphs.parse_potrace_output(text, scale)
+
+BENCHMARKS = [
+    ("CircleInvolute.compute_point", circle_involute),
+    ("ExponentialInvolute.compute_point", exponential_involute),
+    ("makeps[clefG]", makeps_clefG),
+    ("makeps[tailquaverup]", makeps_tailquaverup),
+    ("makeps[scaledbrace]", makeps_scaledbrace),
+    ("break_curves", break_curve),
+    ("parse_potrace_output", potrace_parser),
+]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the font build, for measuring speed-ups (and catching
+# slow-downs) in the glyph pipeline.
+#
+# Run 'python3 bench/run.py' to time everything and compare the results
+# against the baseline file, reporting anything which has got slower
+# by more than the threshold; '--save' records the results as the new
+# baseline. Timings are only comparable on the same machine, so the
+# baseline file isn't meant to be checked in (.gitignore leaves it out).
+
+import os
+import sys
+import json
+import time
+import argparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import micro
+import macro
+
+def time_micro(setup, repeat, min_time):
+    # Return the best time per call over 'repeat' runs of a
+    # benchmark, each run calling it enough times to take at least
+    # 'min_time' seconds.
+    fn = setup()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    best = elapsed / number
+    for r in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the glyph pipeline and compare with a baseline.")
+    parser.add_argument("--baseline", default=os.path.join(here, "baseline.json"),
+                        help="Baseline file to compare with (and --save to).")
+    parser.add_argument("--save", action="store_true",
+                        help="Record these results in the baseline file.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Fractional slow-down counted as a regression "
+                        "(default 0.10).")
+    parser.add_argument("--micro", action="store_true",
+                        help="Run only the micro-benchmarks.")
+    parser.add_argument("--macro", action="store_true",
+                        help="Run only the whole-build benchmarks.")
+    parser.add_argument("--tracer", choices=["potrace", "builtin"],
+                        default="potrace",
+                        help="Tracing backend for the whole-build benchmarks.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Worker processes for the whole-build benchmarks.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each micro-benchmark to take the best "
+                        "of (whole builds are run once).")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="Minimum seconds per micro-benchmark run.")
+    parser.add_argument("only", nargs="*",
+                        help="Names of the benchmarks to run (default all).")
+    args = parser.parse_args()
+    run_micro = args.micro or not args.macro
+    run_macro = args.macro or not args.micro
+
+    results = {}
+    def report(name, seconds):
+        results[name] = seconds
+        print("%-45s %12.6f s" % (name, seconds), flush=True)
+    if run_micro:
+        for name, setup in micro.BENCHMARKS:
+            if not args.only or name in args.only:
+                report("micro:" + name,
+                       time_micro(setup, args.repeat, args.min_time))
+    if run_macro:
+        for name, buildargs, tools in macro.BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            name = "macro:%s[%s]" % (name, args.tracer)
+            missing = macro.missing_tools(tools, args.tracer)
+            if missing:
+                print("%-45s skipped: no %s" % (name, ", ".join(missing)))
+                continue
+            report(name, macro.build(buildargs, args.tracer, args.jobs))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = []
+    for name, seconds in results.items():
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            print("%-45s %+11.1f%%%s" % (name, 100 * change,
+                  "  REGRESSION" if change > args.threshold else ""))
+            if change > args.threshold:
+                regressions.append(name)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+            f.write("\n")
+    if regressions:
+        sys.exit("%d benchmark(s) slower than baseline by more than %g%%" %
+                 (len(regressions), 100 * args.threshold))
+
+if __name__ == '__main__':
+    main()
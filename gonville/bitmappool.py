@@ -0,0 +1,50 @@
+# Shared-memory buffers for handing rendered glyph bitmaps from the
+# process which rendered them to the one which traces them.
+#
+# A bitmap of a big glyph at trace resolution runs to tens of
+# megabytes, which we'd rather not push through a pipe. Instead the
+# parent process makes a buffer of exactly the right size for each
+# glyph as it starts it, and passes its name to the workers: a render
+# task paints straight into the buffer, and the trace task for the
+# same glyph reads it back in place, after which the parent frees it.
+# So the pool only ever holds the bitmaps of the glyphs in progress,
+# and BuildScheduler counts each one against --max-memory for as long
+# as it exists.
+
+import contextlib
+from multiprocessing import shared_memory
+from psrender import Bitmap
+
+class BitmapPool:
+    def __init__(self):
+        self.buffers = {} # buffer name -> SharedMemory
+
+    def allocate(self, size):
+        # Make a new buffer of the given size, which starts out all
+        # zeroes, i.e. a blank bitmap, and return its name.
+        b = shared_memory.SharedMemory(create=True, size=size)
+        self.buffers[b.name] = b
+        return b.name
+
+    def free(self, name):
+        b = self.buffers.pop(name)
+        b.close()
+        b.unlink()
+
+    def close(self):
+        for name in list(self.buffers):
+            self.free(name)
+
+@contextlib.contextmanager
+def bitmap(name, width, height):
+    # In a worker, give access to the named buffer as a Bitmap for the
+    # duration of a with statement. Its data is the buffer's mmap
+    # itself, which has the slice assignment psrender needs and the
+    # find() the tracer uses, so neither copies anything out of it.
+    # Our workers share the parent's resource tracker, so attaching
+    # doesn't make the buffer this process's to clean up.
+    b = shared_memory.SharedMemory(name=name)
+    try:
+        yield Bitmap(width, height, b.buf.obj)
+    finally:
+        b.close()
@@ -0,0 +1,102 @@
+# Bookkeeping for 'glyphs.py --incremental', which only rebuilds the
+# font files whose inputs have changed since the last build.
+#
+# Every output (an .sfd file and the font files FontForge makes from
+# it) gets a fingerprint: a hash over everything that goes into it,
+# i.e. the PostScript of each glyph it contains, the glyphs' entries
+# in the glyph list, the version string and script.ff. A Manifest
+# remembers the fingerprint each output was last built from. If it
+# hasn't changed and the files are all still there, the output needn't
+# be made again.
+#
+# An .sfd which does need rebuilding still needs the outline of every
+# glyph in it, so an OutlineCache keeps each traced outline on disk,
+# keyed by the fingerprint of that glyph alone. Then tweaking one glyph
+# costs one trace rather than a whole font's worth.
+
+import os
+import json
+import hashlib
+import threading
+from array import array
+from outline import Outline
+
+def fingerprint(*parts):
+    # Hash any collection of JSON-serialisable values.
+    data = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("UTF-8")).hexdigest()
+
+def file_contents(filename):
+    # The contents of a file as a string, or None if it doesn't exist,
+    # for including in a fingerprint.
+    try:
+        with open(filename) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def write_atomically(filename, data):
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, filename)
+
+class Manifest:
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock() # FontForge jobs finish on another thread
+        try:
+            with open(filename) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def unchanged(self, key, fp, files):
+        # Return true if the output 'key' was last built from inputs
+        # with fingerprint fp, and all its files still exist.
+        with self.lock:
+            if self.entries.get(key) != fp:
+                return False
+        return all(os.path.exists(f) for f in files)
+
+    def record(self, key, fp):
+        # Note that output 'key' has now been built from inputs with
+        # fingerprint fp. Saved immediately, so that an interrupted
+        # build keeps track of what it did finish.
+        with self.lock:
+            self.entries[key] = fp
+            data = json.dumps(self.entries, indent=1, sort_keys=True) + "\n"
+            write_atomically(self.filename, data.encode("UTF-8"))
+
+class OutlineCache:
+    # Each file holds a header line giving the glyph's fingerprint and
+    # the lengths of its Outline's two arrays, followed by the arrays
+    # themselves in machine format.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, gid):
+        return os.path.join(self.directory, gid + ".outline")
+
+    def load(self, gid, fp):
+        # Return (bbox, path) for the glyph if the cache has an outline
+        # traced from the same inputs, or else None.
+        try:
+            with open(self.filename(gid), "rb") as f:
+                header = f.readline().split()
+                if len(header) != 3 or header[0].decode("ASCII") != fp:
+                    return None
+                ops = array("B")
+                coords = array("d")
+                ops.fromfile(f, int(header[1]))
+                coords.fromfile(f, int(header[2]))
+        except (FileNotFoundError, EOFError):
+            return None
+        path = Outline(ops, coords)
+        return path.bbox(), path
+
+    def save(self, gid, fp, path):
+        header = "%s %d %d\n" % (fp, len(path.ops), len(path.coords))
+        write_atomically(self.filename(gid), header.encode("ASCII") +
+                         path.ops.tobytes() + path.coords.tobytes())
@@ -0,0 +1,192 @@
+# Timing instrumentation for 'glyphs.py --profile', recording where a
+# build's time goes.
+#
+# Work on a glyph is divided into named stages (makeps, gs, potrace,
+# parse and so on), timed with stage() and collected in a dict of
+# stats for that glyph; note() adds other figures, such as the size of
+# its PostScript. A worker process starts a fresh dict with begin()
+# for each task and hands it back with the task's result, and the
+# parent combines them all with merge(). The dict being added to is
+# kept per thread, so a worker can carry on with one glyph on another
+# thread (see resume()) while its main thread begins the next. Phases of the build that
+# happen in the parent, such as writing an .sfd or running FontForge,
+# are timed with phase(), which also records the phase's peak Python
+# allocation if tracemalloc is running.
+#
+# Every stage and phase is also kept as a span with its start and end
+# time, so that save_timeline() can draw the whole build as a Chrome
+# trace-event timeline (viewable in Perfetto or chrome://tracing),
+# with one track for each worker process. perf_counter() reads the
+# same system-wide monotonic clock in every process, so spans from
+# different workers line up.
+
+import os
+import time
+import json
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+local = threading.local() # .stats: those of the glyph this thread is on
+glyphs = {} # glyph name -> merged stats, in the parent
+phases = [] # one dict per timed phase, in the order they finished
+spans = [] # (process id, thread name, name, glyph, start, end), in the parent
+lock = threading.Lock() # FontForge phases finish on another thread
+peaks = [] # peak allocation so far of each phase open on the main thread
+
+# Stats which are the most of any task's rather than a sum or a
+# single value.
+MAXIMA = {"peak_rss", "memory"}
+
+def begin():
+    return resume({"pid": os.getpid(), "spans": []})
+
+def resume(stats):
+    # Add whatever this thread times from now on to stats, a dict
+    # begin() returned on some thread.
+    local.stats = stats
+    return stats
+
+def current():
+    return getattr(local, "stats", None)
+
+@contextmanager
+def stage(name):
+    # Add the time taken by the body of the with statement to the
+    # named stage of the current glyph.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stats = current()
+        if stats is not None:
+            stats[name] = stats.get(name, 0) + end - start
+            stats["spans"].append((name, start, end, thread_name()))
+
+def note(name, value):
+    stats = current()
+    if stats is not None:
+        stats[name] = value
+
+def add(name, seconds):
+    # Add time measured some other way to a stage.
+    stats = current()
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + seconds
+
+def thread_name():
+    # Which track of a worker's a span goes on: None for its main
+    # thread, or the name of the thread.
+    thread = threading.current_thread()
+    return None if thread is threading.main_thread() else thread.name
+
+def merge(glyphname, stats):
+    # Combine stats for a glyph from a worker into the parent's record.
+    # Times for the same stage (from, say, the render and trace tasks
+    # of one glyph) add up, memory use is the most of either, and
+    # anything else is simply replaced.
+    record = glyphs.setdefault(glyphname, {})
+    stats = dict(stats)
+    pid = stats.pop("pid", None)
+    for name, start, end, thread in stats.pop("spans", ()):
+        spans.append((pid, thread, name, glyphname, start, end))
+    for k, v in stats.items():
+        if k in MAXIMA and k in record:
+            record[k] = max(record[k], v)
+        elif type(v) == float and k in record:
+            record[k] += v
+        else:
+            record[k] = v
+
+@contextmanager
+def phase(name, detail=None):
+    # Phases can nest, so before resetting tracemalloc's peak for this
+    # one we fold the peak so far into the enclosing phase's, and
+    # afterwards pass this one's up to it.
+    traced = (tracemalloc.is_tracing() and
+              threading.current_thread() is threading.main_thread())
+    if traced:
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        peaks.append(0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record = {"phase": name, "detail": detail, "seconds": end - start}
+        if traced:
+            peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            record["peak_bytes"] = peak
+        with lock:
+            phases.append(record)
+            spans.append((os.getpid(), threading.current_thread().name,
+                          name, detail, start, end))
+
+def timed(name):
+    # Decorator timing every call of a function as a phase, with its
+    # first argument (typically the file it writes) as the detail.
+    def decorator(fn):
+        def wrapper(*args, **kws):
+            with phase(name, args[0] if args else None):
+                return fn(*args, **kws)
+        return wrapper
+    return decorator
+
+def save(filename, extra={}):
+    # Write everything recorded to a JSON file, with totals over all
+    # glyphs for each stage and over all phases of each kind.
+    stages = {}
+    for stats in glyphs.values():
+        for k, v in stats.items():
+            if type(v) == float and k not in MAXIMA:
+                stages[k] = stages.get(k, 0) + v
+    totals = {}
+    with lock:
+        for p in phases:
+            totals[p["phase"]] = totals.get(p["phase"], 0) + p["seconds"]
+        profile = dict(extra, glyphs=glyphs, phases=phases,
+                       stage_totals=stages, phase_totals=totals)
+        with open(filename, "w") as f:
+            json.dump(profile, f, indent=1, sort_keys=True)
+            f.write("\n")
+
+def save_timeline(filename):
+    # Write all the spans recorded as a Chrome trace-event file: the
+    # parent's threads first, then one track per worker process, in
+    # the order each one started work (and a track for each other
+    # thread it used).
+    with lock:
+        recorded = sorted(spans, key=lambda span: span[4])
+    if not recorded:
+        return
+    origin = recorded[0][4]
+    parent = os.getpid()
+    tracks = {}
+    workers = {}
+    events = []
+    for pid, thread, name, detail, start, end in recorded:
+        key = (pid, thread)
+        if key not in tracks:
+            tracks[key] = len(tracks) + 1
+            if pid == parent:
+                label = "build" if thread == "MainThread" else thread
+            else:
+                label = "worker %d" % workers.setdefault(pid, len(workers) + 1)
+                if thread is not None:
+                    label = "%s %s" % (label, thread)
+            events.append({"ph": "M", "name": "thread_name", "pid": 1,
+                           "tid": tracks[key], "args": {"name": label}})
+        event = {"ph": "X", "name": name, "pid": 1, "tid": tracks[key],
+                 "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6}
+        if detail is not None:
+            event["name"] = "%s %s" % (name, detail)
+            event["args"] = {"glyph" if pid != parent else "detail": detail}
+        events.append(event)
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        f.write("\n")
@@ -1,7 +1,9 @@
 import sys
+import copy
 import types
 from math import *
 from crosspoint import crosspoint
+from nibs import Nib
 
 def transform(matrix, x, y, affine=1):
     # 6-element matrix like PostScript's: applying [a,b,c,d,e,f] to
@@ -22,6 +24,10 @@ def atanh(x):
     return 0.5*log((1+x)/(1-x))
 
 class Curve:
+    # The range of t which makeps() draws the curve over: all of it,
+    # unless this is a copy made by truncated().
+    trange = (0, 1)
+
     def __init__(self, cont = None):
         self.tkitems = []
         self.welds = [None, None]
@@ -106,6 +112,14 @@ class Curve:
         self.setenddata(end, sx, sy, sdx, sdy)
         other.setenddata(oend, ox, oy, odx, ody)
 
+    def truncated(self, t0, t1):
+        # A copy of the curve which only draws the part from t0 to t1.
+        # Its nib is still evaluated at the original curve's t, so
+        # nibs which depend on t draw just what they did.
+        part = copy.copy(self)
+        part.trange = (t0, t1)
+        return part
+
     def compute_direction(self, t):
         x0, y0 = self.compute_point(t-0.0001)
         x2, y2 = self.compute_point(t+0.0001)
@@ -123,9 +137,28 @@ class Curve:
             nibfn = self.cont.default_nib
         if type(nibfn) == types.FunctionType:
             return nibfn(self, x, y, t, theta)
+        elif isinstance(nibfn, Nib):
+            return nibfn.at(self, x, y, t, theta)
         else:
             return nibfn
 
+    def compute_nibs(self, ts, points):
+        # compute_nib for a whole list of parameter values at once,
+        # given the points on the curve at each.
+        nibfn = self.nib
+        if nibfn == None:
+            nibfn = self.cont.default_nib
+        if isinstance(nibfn, Nib):
+            thetas = None
+            if nibfn.needs_theta:
+                thetas = [self.compute_theta(t) for t in ts]
+            return nibfn.evaluate(self, ts, points, thetas)
+        elif type(nibfn) == types.FunctionType:
+            return [nibfn(self, x, y, t, self.compute_theta(t))
+                    for t, (x, y) in zip(ts, points)]
+        else:
+            return [nibfn] * len(ts)
+
     def compute_x(self, t):
         return self.compute_point(t)[0]
 
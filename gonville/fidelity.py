@@ -0,0 +1,103 @@
+# Measures of how far apart two traced outlines of the same glyph
+# are, used to decide how cheaply a glyph can be rendered and traced
+# without visibly changing the result.
+#
+# Both measures work directly on Outlines, in whatever coordinate
+# system they share; glyphs.py converts to font units.
+
+import math
+from outline import MOVETO, LINETO, CURVETO
+from psrender import polygon_spans, spans_to_rows, intersect_runs
+
+def bezier_point(c, t):
+    mt = 1 - t
+    b0, b1, b2, b3 = mt*mt*mt, 3*mt*mt*t, 3*mt*t*t, t*t*t
+    return (b0*c[0] + b1*c[2] + b2*c[4] + b3*c[6],
+            b0*c[1] + b1*c[3] + b2*c[5] + b3*c[7])
+
+def flatten(path, step):
+    # Return a list of closed polygons approximating the outline,
+    # with vertices no more than about 'step' apart.
+    polys = []
+    cur = None
+    for op, c in path:
+        if op == MOVETO:
+            cur = [(c[0], c[1])]
+            polys.append(cur)
+        elif op == LINETO:
+            n = max(1, int(math.ceil(math.hypot(c[2]-c[0], c[3]-c[1]) / step)))
+            for i in range(1, n+1):
+                cur.append((c[0] + (c[2]-c[0])*i/n, c[1] + (c[3]-c[1])*i/n))
+        elif op == CURVETO:
+            # The control polygon is never shorter than the curve.
+            length = sum(math.hypot(c[k+2]-c[k], c[k+3]-c[k+1]) for k in (0, 2, 4))
+            n = max(1, int(math.ceil(length / step)))
+            for i in range(1, n+1):
+                cur.append(bezier_point(c, i / float(n)))
+    return [p for p in polys if len(p) > 2]
+
+def directed_hausdorff(a, b, cell):
+    # The greatest distance from any point in a to the nearest point
+    # in b. The points of b are bucketed into a grid of the given
+    # cell size, and each nearest-neighbour search looks outwards
+    # through rings of cells until nothing closer can turn up.
+    grid = {}
+    for x, y in b:
+        grid.setdefault((int(x // cell), int(y // cell)), []).append((x, y))
+    worst = 0.0
+    for x, y in a:
+        cx, cy = int(x // cell), int(y // cell)
+        best = None
+        ring = 0
+        while best is None or (ring - 1) * cell < best:
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in (range(cy - ring, cy + ring + 1)
+                           if gx in (cx - ring, cx + ring) else (cy - ring, cy + ring)):
+                    for px, py in grid.get((gx, gy), ()):
+                        d = (px-x)*(px-x) + (py-y)*(py-y)
+                        if best is None or d < best*best:
+                            best = math.sqrt(d)
+            ring += 1
+            if best is None and ring > 1000:
+                return float("inf")
+        if best > worst:
+            worst = best
+    return worst
+
+def hausdorff(path1, path2, step):
+    # Symmetric Hausdorff distance between two outlines, accurate to
+    # about 'step'.
+    a = [p for poly in flatten(path1, step) for p in poly]
+    b = [p for poly in flatten(path2, step) for p in poly]
+    if not a or not b:
+        return 0.0 if not a and not b else float("inf")
+    cell = 8 * step
+    return max(directed_hausdorff(a, b, cell), directed_hausdorff(b, a, cell))
+
+def rows(path, step):
+    # Scan-convert an outline at one pixel per 'step' units, into a
+    # dict mapping each row to its runs of inside pixels.
+    polys = [[(x/step, y/step) for x, y in poly] for poly in flatten(path, step)]
+    bottom = min(y for poly in polys for x, y in poly)
+    top = max(y for poly in polys for x, y in poly)
+    off = int(math.floor(bottom)) - 1
+    polys = [[(x, y - off) for x, y in poly] for poly in polys]
+    return spans_to_rows(polygon_spans(polys, int(math.ceil(top)) - off + 2)), off
+
+def area_difference(path1, path2, step):
+    # Area of the symmetric difference between two outlines, measured
+    # by rasterising both with pixels 'step' units across. Returns the
+    # pair (difference, area of path1), in square units. If only one
+    # outline is empty, the difference is the whole of the other.
+    r1, o1 = rows(path1, step) if len(path1) else ({}, 0)
+    r2, o2 = rows(path2, step) if len(path2) else ({}, 0)
+    area1 = diff = 0
+    for j in set(j + o1 for j in r1) | set(j + o2 for j in r2):
+        runs1 = r1.get(j - o1, [])
+        runs2 = r2.get(j - o2, [])
+        a1 = sum(x1 - x0 for x0, x1 in runs1)
+        a2 = sum(x1 - x0 for x0, x1 in runs2)
+        both = sum(x1 - x0 for x0, x1 in intersect_runs(runs1, runs2))
+        area1 += a1
+        diff += a1 + a2 - 2*both
+    return diff * step * step, area1 * step * step
@@ -1,5 +1,8 @@
 from curves import *
+from nibs import *
 import collections
+import copy
+import time
 
 class GlyphContext:
     def __init__(self):
@@ -31,19 +34,11 @@ class GlyphContext:
     def makeps(self):
         out = "gsave 1 setlinecap\n"
         out = out + self.before + "\n"
+        ts = [it / float(self.curve_res-1) for it in range(self.curve_res)]
         for cid, curve in self.curves.items():
-            for it in range(self.curve_res):
-                t = it / float(self.curve_res-1)
-                x, y = curve.compute_point(t)
-                nib = curve.compute_nib(t)
-                if type(nib) == tuple:
-                    radius, angle, fdist, bdist = nib
-                    c = cos(angle)
-                    s = -sin(angle)
-                    out = out + "newpath %g %g moveto %g %g lineto %g setlinewidth stroke\n" % \
-                    (x+c*fdist, y+s*fdist, x-c*bdist, y-s*bdist, 2*radius)
-                elif nib != 0:
-                    out = out + "newpath %g %g %g 0 360 arc fill\n" % (x, y, nib)
+            cts = sample_ts(ts, curve.trange)
+            points = [curve.compute_point(t) for t in cts]
+            out = out + strokes(points, curve.compute_nibs(cts, points))
         e = self.extra
         if not (type(e) == tuple or type(e) == list):
             e = (e,)
@@ -60,9 +55,85 @@ class GlyphContext:
         print(self.makeps())
         print("grestore showpage")
 
+# The collection of all the glyphs, as attributes. Glyphs are only
+# constructed when something first asks for them, so that a command
+# which needs one glyph (or none) doesn't wait for all of them; until
+# then 'factories' holds a function to make each one. Glyphs defined
+# in terms of others, such as the small clefs, simply look their
+# parents up in 'font' as before, which builds those on demand too.
+#
+# Each glyph is given a 'name' attribute when it's built, so that a
+# glyph which draws another through 'extra' can tell which one (see
+# affine_variant in glyphs.py).
+#
+# If glyphs.py has found an up-to-date glyph bundle (see
+# glyphbundle.py), glyphs are loaded from that instead, already
+# lowered to GlyphIRs, and none of the code below runs at all.
 class container:
-    pass
+    def __getattribute__(self, name):
+        # Every glyph read while another is being built is one it
+        # depends on: through 'extra', or for its dimensions.
+        if building and name[0] != "_":
+            dependencies[building[-1]].add(name)
+        return object.__getattribute__(self, name)
+
+    def __getattr__(self, name):
+        # Only called for attributes not yet in the instance dict.
+        factory = factories.pop(name, None)
+        if factory is None:
+            raise AttributeError(name)
+        start = time.perf_counter()
+        if bundle is not None and name in bundle:
+            glyph = bundle.load(name)
+            dependencies[name] = set(bundle.dependencies[name])
+            amendments.pop(name, None)
+        else:
+            dependencies[name] = set()
+            building.append(name)
+            try:
+                glyph = factory()
+                for amendment in amendments.pop(name, ()):
+                    amendment(glyph)
+            finally:
+                building.pop()
+            glyph.name = name
+        construction_time[name] = time.perf_counter() - start
+        setattr(self, name, glyph)
+        return glyph
+
+    def __dir__(self):
+        return sorted(set(vars(self)) | set(factories))
+
 font = container()
+factories = {} # glyph name -> function returning its GlyphContext
+amendments = {} # glyph name -> functions to apply once it's built
+bundle = None # glyphbundle.Bundle to load glyphs from, if any
+
+# Seconds spent constructing each glyph (including any other glyphs
+# it caused to be constructed), for glyphs.py --profile.
+construction_time = {}
+
+# The other glyphs each glyph read from font while it was being
+# constructed, and the stack of glyphs under construction.
+dependencies = {}
+building = []
+
+def use_bundle(b):
+    global bundle
+    bundle = b
+
+def closure(names):
+    # The named glyphs and everything they depend on, directly or not.
+    result = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in result:
+            result.add(name)
+            if name in factories:
+                getattr(font, name)
+            todo.extend(dependencies.get(name, ()))
+    return result
 
 # 2x2 matrix multiplication.
 def matmul(m1, m2):
@@ -81,23 +152,13 @@ def depress(t,k):
     return t - t*(1-t)*4*k
 
 # Nib helper function which sets up a chisel nib with one end on the
-# curve and the other end at a specified other point.
+# curve and the other end at a specified other point. (For a fixed
+# point, the PointToPoint descriptor in nibs.py does the same job.)
 def ptp_nib(c,x,y,t,theta,x1,y1,nr):
     angle = atan2(y-y1, x1-x)
     dist = sqrt((y-y1)**2 + (x1-x)**2)
     return nr, angle, dist, 0
 
-# Nib helper function which sets up a chisel nib with one end
-# following the curve and the other end following a completely
-# different curve or chain of curves.
-def follow_curveset_nib(c,x,y,t,theta,carray,i,n,r):
-    tt = (t + i) * len(carray) / n
-    ti = int(tt)
-    if ti == len(carray):
-        ti = ti - 1
-    x1, y1 = carray[ti].compute_point(tt-ti)
-    return ptp_nib(c,x,y,t,theta,x1,y1,r)
-
 # Function which draws a blob on the end of a line.
 def blob(curve, end, whichside, radius, shrink, nibradius=None):
     if nibradius == None:
@@ -131,12 +192,12 @@ def blob(curve, end, whichside, radius, shrink, nibradius=None):
         newy = cy - r*ny - radius*newny
         newcurve = CircleInvolute(curve.cont, x, y, dx, dy, newx, newy, nx, ny)
         x, y, dx, dy, nx, ny = newx, newy, nx, ny, newnx, newny
-        newcurve.nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,cx,cy,nibradius)
+        newcurve.nib = PointToPoint(cx, cy, nibradius)
 
 # Construct a PostScript path description which follows the centre
 # of some series of curve objects and visits other points in
-# between. Used to arrange that one quaver tail doesn't go past
-# another, and similar.
+# between. Used to cut one clef off where it meets another, and
+# similar.
 Reversed = collections.namedtuple("Reversed", "curve")
 def clippath(elements):
     coords = []
@@ -167,21 +228,69 @@ def make_glyph(fn, args=(), postprocess=lambda x: x):
 
 # Decorator to make it convenient to define a lot of glyphs inside
 # 'font' by actually writing a function that returns their
-# GlyphContext.
-def define_glyph(name, **kws):
+# GlyphContext. The glyph isn't made until it's first used.
+#
+# Several define_glyph decorators stacked on one function with the
+# same args (such as a clef and its small version, or the multiple
+# tails) only run the function once: each one's postprocess is
+# applied to the same base GlyphContext. If one of them has no
+# postprocess, the base is that glyph itself, fetched from 'font', so
+# that the others depend on it like any other glyph they embed;
+# otherwise the base is made the first time one of them needs it and
+# kept in 'bases'. Postprocessors mustn't modify the base.
+def define_glyph(name, args=(), postprocess=None):
     def decorator(fn):
-        setattr(font, name, make_glyph(fn, **kws))
+        if postprocess is None:
+            plain_glyphs[fn, args] = name
+            factories[name] = lambda: make_glyph(fn, args)
+        else:
+            factories[name] = lambda: postprocess(base_glyph(fn, args))
         # Pass through the function itself unchanged, so that we can
         # chain multiple decorators
         return fn
     return decorator
 
-# Another decorator that just defines a name in this module's global
-# namespace, for making subcomponents that are reused in glyphs but
-# are not glyphs in their own right.
+plain_glyphs = {} # (function, args) -> name of the glyph they make unprocessed
+bases = {} # (function, args) -> GlyphContext, when there's no such glyph
+
+def base_glyph(fn, args):
+    key = fn, args
+    if key in plain_glyphs:
+        return getattr(font, plain_glyphs[key])
+    if key not in bases:
+        bases[key] = make_glyph(fn, args)
+    return bases[key]
+
+# Decorator to apply a function to each of a list of glyphs after
+# it's constructed, for adjustments made to several glyphs at once.
+def amend_glyphs(names):
+    def decorator(fn):
+        for name in names:
+            if name in factories:
+                amendments.setdefault(name, []).append(fn)
+            else:
+                fn(getattr(font, name))
+        return fn
+    return decorator
+
+# Another decorator that defines a subcomponent which is reused in
+# glyphs but is not a glyph in its own right, as an attribute of
+# 'components'. Like a glyph, it isn't made until it's first used.
+class componentset:
+    def __getattr__(self, name):
+        factory = component_factories.pop(name, None)
+        if factory is None:
+            raise AttributeError(name)
+        component = factory()
+        setattr(self, name, component)
+        return component
+
+components = componentset()
+component_factories = {} # component name -> function returning it
+
 def define_component(name, **kws):
     def decorator(fn):
-        globals()[name] = make_glyph(fn, **kws)
+        component_factories[name] = lambda: make_glyph(fn, **kws)
         return fn
     return decorator
 
@@ -276,16 +385,14 @@ def _(cont_main):
     cont.left_side_path = [c2, c3, c4, c5, c6]
     cont.right_side_path = [Reversed(c9), Reversed(c8), Reversed(c7)]
 
-    cont.default_nib = lambda c,x,y,t,theta: 17+11*cos(theta-c.nibdir(t))
-    c0.nibdir = c1.nibdir = c2.nibdir = lambda t: 0
     phi = c4.compute_theta(1)
-    c3.nibdir = lambda t: phi*t
-    c4.nibdir = lambda t: phi
     gamma = c5.compute_theta(1) - pi
-    c5.nibdir = lambda t: phi + (gamma-phi)*t
-    c5.nib = lambda c,x,y,t,theta: 18+10*cos(theta-c.nibdir(t))
-    c6.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],0,2,8)
-    c7.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],1,2,8)
+    c0.nib = c1.nib = c2.nib = Angle(17, 11, "cos")
+    c3.nib = Angle(17, 11, "cos", (0, phi))
+    c4.nib = Angle(17, 11, "cos", phi)
+    c5.nib = Angle(18, 10, "cos", (phi, gamma))
+    c6.nib = FollowCurve([tc0,tc1], 0, 2, 8)
+    c7.nib = FollowCurve([tc0,tc1], 1, 2, 8)
     c8.nib = c9.nib = c10.nib = 8
     blob(c10, 1, 'r', 45, 9)
 
@@ -322,14 +429,15 @@ def _(cont, scale = 1.0):
                     [(559, 0), (1000, 0), (1000, 1000), (598, 1000)] +
                     font.clefG.right_side_path +
                     [(559, 0), (1000, 0), (1000, 1000), (666, 1000)])
+    right = components.clefCstraightright
     cont.scale = font.clefG.scale
     cont.extra = ("%g dup scale" % scale, font.clefG,
                   "gsave newpath", clip, "clip",
                   "0 %g translate" % font.clefG.hy,
-                  "%g dup scale" % (cont.scale / clefCstraightright.scale),
-                  "0 %g translate" % (-clefCstraightright.hy),
+                  "%g dup scale" % (cont.scale / right.scale),
+                  "0 %g translate" % (-right.hy),
                   "40 %g translate" % (-2375/18 * 2 / scale),
-                  clefCstraightright, "grestore")
+                  right, "grestore")
     cont.hy = font.clefG.hy * scale
 
 # ----------------------------------------------------------------------
@@ -431,14 +539,14 @@ def _(cont_main):
     c3.nib = lambda c,x,y,t,theta: mad_cclef_points(c,x,y,t,theta,c0.nib,tc0)
     cx0,cy0 = tc0.compute_point(0)
     r0 = c3.compute_nib(1)[0]
-    c4.nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,cx0,cy0,r0)
+    c4.nib = PointToPoint(cx0, cy0, r0)
 
     c5.nib = lambda c,x,y,t,theta: 6
     c6.nib = c7.nib = lambda c,x,y,t,theta: (lambda x1,x2: ((lambda k: (6, pi, k, 0))(44*((x-min(x1,x2))/abs(x2-x1))**2)))(c.compute_x(0),c.compute_x(1))
     c8.nib = lambda c,x,y,t,theta: mad_cclef_points(c,x,y,t,theta,c5.nib,tc1)
     cx1,cy1 = tc1.compute_point(0)
     r1 = c8.compute_nib(1)[0]
-    c9.nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,cx1,cy1,r1)
+    c9.nib = PointToPoint(cx1, cy1, r1)
 
     blob(c0, 0, 'l', 28, 6)
     blob(c5, 0, 'r', 28, 6)
@@ -454,7 +562,7 @@ def _(cont):
     cont.extra = (font.clefC.extra,
                   "gsave newpath 641 0 moveto 0 1000 rlineto 1000 1000 lineto "
                   "1000 0 lineto closepath clip",
-                  clefCstraightright, "grestore")
+                  components.clefCstraightright, "grestore")
 
 # ----------------------------------------------------------------------
 # Percussion 'clefs'.
@@ -530,13 +638,13 @@ def _(cont):
 
     # Stave lines as guides used when I was drawing it
     c0.nib = c1.nib = c2.nib = c3.nib = 0
-    cont.default_nib = lambda c,x,y,t,theta: 12+10*sin(theta)**2
+    cont.default_nib = Angle(12, 10, "sin", 0, 2)
 
     # Vertical of T needs not to overlap top of T
     c6.nib = lambda c,x,y,t,theta: (12, theta+pi/2, 10*sin(theta)**2, 10*sin(theta)**2)
 
     # Special nib for crossbar of A
-    c11.nib = lambda c,x,y,t,theta: 12-6*t
+    c11.nib = Profile(12, -6)
 
     cont.hy = (c1.compute_y(0) + c2.compute_y(0)) / 2.0
 
@@ -554,13 +662,99 @@ def _(cont):
 quavertaildispdn = 105
 quavertaildispup = 115
 
+# The first t at which a curve crosses the chain of curves
+# 'edge' moved down by dy, or None if it never does. Crossings of
+# chords between a few points on each are found with crosspoint(),
+# and each is then refined by Newton's method: crossing the two
+# curves' tangents gives the next estimate.
+def tail_crossing(curve, edge, dy, steps=32):
+    def point(c, t, yoff):
+        x, y = c.compute_point(t)
+        return x, y + yoff
+    def along(x0, y0, x1, y1, x, y):
+        # How far (x,y) is along the line from (x0,y0) to (x1,y1).
+        dx, dy = x1-x0, y1-y0
+        return ((x-x0)*dx + (y-y0)*dy) / (dx*dx + dy*dy)
+    first = None
+    pts = [point(curve, i / float(steps), 0) for i in range(steps+1)]
+    for e in edge:
+        epts = [point(e, j / float(steps), dy) for j in range(steps+1)]
+        for i in range(steps):
+            for j in range(steps):
+                p = crosspoint(*(pts[i] + pts[i+1] + epts[j] + epts[j+1]))
+                if p is None:
+                    continue
+                f = along(*(pts[i] + pts[i+1] + p))
+                g = along(*(epts[j] + epts[j+1] + p))
+                if not (0 <= f < 1 and 0 <= g < 1):
+                    continue
+                t, u = (i + f) / steps, (j + g) / steps
+                for it in range(20):
+                    x, y = point(curve, t, 0)
+                    cdx, cdy = curve.compute_direction(t)
+                    ex, ey = point(e, u, dy)
+                    edx, edy = e.compute_direction(u)
+                    p = crosspoint(x, y, x+cdx, y+cdy, ex, ey, ex+edx, ey+edy)
+                    if p is None:
+                        break
+                    dt = along(x, y, x+cdx, y+cdy, *p)
+                    du = along(ex, ey, ex+edx, ey+edy, *p)
+                    t, u = t + dt, u + du
+                    if abs(dt) < 1e-12 and abs(du) < 1e-12:
+                        break
+                if 0 <= t <= 1 and (first is None or t < first):
+                    first = t
+    return first
+
+# The path followed by one end of the strokes a curve draws: the front
+# (sign 1) or back (sign -1) end of its chisel nib, or the curve itself
+# wherever its nib is round.
+class StrokeEnd(Curve):
+    def __init__(self, curve, sign):
+        self.curve, self.sign = curve, sign
+
+    def compute_point(self, t):
+        x, y = self.curve.compute_point(t)
+        nib = self.curve.compute_nib(t)
+        if type(nib) == tuple:
+            radius, angle, fdist, bdist = nib
+            d = fdist if self.sign > 0 else -bdist
+            x, y = x + cos(angle)*d, y - sin(angle)*d
+        return x, y
+
+# Copy of a tail to be stacked on another identical one, dy further
+# down, with each of its curves cut short at the first stroke which
+# reaches that tail's 'edge' (a list of curves): where the curve, or
+# either end of its chisel nib, first crosses the edge. A tail's
+# curves all start at the stem, clear of the other tail, so what's
+# left is what would be drawn inside a clip path along that edge. The
+# truncated curves keep their own nibs. (The tail's 'extra' is the
+# white-out to the left of the stem, which is safe to draw in full.)
+def cliptail(tail, edge, dy):
+    cont = GlyphContext()
+    for curve in tail.curves.values():
+        nib = curve.nib
+        if nib == None:
+            nib = tail.default_nib
+        if nib == 0:
+            continue
+        curve = copy.copy(curve)
+        curve.nib = nib
+        curve.cont = cont
+        cuts = [tail_crossing(path, edge, dy) for path in
+                (curve, StrokeEnd(curve, 1), StrokeEnd(curve, -1))]
+        cuts = [t for t in cuts if t is not None]
+        if cuts:
+            curve = curve.truncated(0, min(cuts))
+        cont.curves[len(cont.curves)] = curve
+    cont.before = tail.before
+    cont.extra = tail.extra
+    return cont
+
 def clipup(tail):
     # Clipped version of an up-quaver-tail designed to fit above
     # another identical tail and stop where it crosses the latter.
-    cont = GlyphContext()
-    clip = clippath([tail.c0, tail.c1, (900,1900), (900,100), (100,100), (100,1900)])
-    cont.extra = "gsave 0 %g translate newpath" % quavertaildispup, clip, \
-    "clip 0 -%g translate" % quavertaildispup, tail, "grestore"
+    cont = cliptail(tail, [tail.c0, tail.c1], quavertaildispup)
     cont.ox = tail.ox
     cont.oy = tail.oy
     return cont
@@ -568,10 +762,7 @@ def clipup(tail):
 def clipdn(tail):
     # Clipped version of a down-quaver-tail designed to fit below
     # another identical tail and stop where it crosses the latter.
-    cont = GlyphContext()
-    clip = clippath([tail.c0, tail.c1, (900,100), (900,1900), (100,1900), (100,900)])
-    cont.extra = "gsave 0 -%g translate newpath" % quavertaildispdn, clip, \
-    "clip 0 %g translate" % quavertaildispdn, tail, "grestore"
+    cont = cliptail(tail, [tail.c0, tail.c1], -quavertaildispdn)
     cont.ox = font.tailquaverdn.ox
     cont.oy = font.tailquaverdn.oy
     return cont
@@ -619,8 +810,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -653,8 +844,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -687,8 +878,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -721,8 +912,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -758,8 +949,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -789,8 +980,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -823,8 +1014,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -857,8 +1048,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -891,8 +1082,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -928,8 +1119,8 @@ def _(cont):
     c4.nib = 0 # guide line to get the width the same across all versions
 
     c0.nib = c1.nib = 0
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],0,2,8)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c0,c1],1,2,8)
+    c2.nib = FollowCurve([c0,c1], 0, 2, 8)
+    c3.nib = FollowCurve([c0,c1], 1, 2, 8)
 
     cont.c0 = c0 # for tailshortdn
     cont.c1 = c1 # for tailshortdn
@@ -1169,7 +1360,7 @@ def _(cont):
     # End saved data
 
     # Fill the diamond.
-    cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,527,472,6)
+    cont.default_nib = PointToPoint(527, 472, 6)
 
 @define_glyph("trianglesemi")
 def _(cont):
@@ -1222,7 +1413,7 @@ def _(cont):
     # End saved data
 
     # Fill the triangle.
-    cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,527,472,6)
+    cont.default_nib = PointToPoint(527, 472, 6)
 
     cont.ay = c0.compute_y(0)
     cont.iy = 2*472 - cont.ay
@@ -1383,8 +1574,8 @@ def _(cont_main):
     # same place heading in the same direction, and tc1 and c1 must
     # end at the same place heading in the same direction.
 
-    c0.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],0,2,6)
-    c1.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],1,2,6)
+    c0.nib = FollowCurve([tc0,tc1], 0, 2, 6)
+    c1.nib = FollowCurve([tc0,tc1], 1, 2, 6)
     phi0 = c2.compute_theta(0)
     phi1 = c3.compute_theta(1) + pi
     phia = (phi0 + phi1) / 2
@@ -1564,8 +1755,8 @@ def _(cont_main): # two
 
     xr = c0.compute_x(0)
     xl = c1.compute_x(1)
-    c0.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],0,2,6)
-    c1.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0,tc1],1,2,6)
+    c0.nib = FollowCurve([tc0,tc1], 0, 2, 6)
+    c1.nib = FollowCurve([tc0,tc1], 1, 2, 6)
     c4.nib = lambda c,x,y,t,theta: (lambda x1,x2: ((lambda k: (6, 0, k, k))(22*((x-min(x1,x2))/abs(x2-x1)))))(c.compute_x(0),c.compute_x(1))
     c3.nib = c2.nib = lambda c,x,y,t,theta: (lambda x1,x2: ((lambda k: (6, 0, k, k))(22*((x-min(x1,x2))/abs(x2-x1)))))(c2.compute_x(0),c3.compute_x(1))
 
@@ -1577,7 +1768,7 @@ def _(cont): # three
     # thickness of the right-hand curves c1-c4 leaves a nasty corner
     # at the very top and bottom, which I solve by drawing an
     # independent inner curve at each end (c6-c9). Normally I would
-    # solve this using follow_curveset_nib, filling the area between
+    # solve this using FollowCurve, filling the area between
     # c6-c7 and c0-c1 and that between c8-c9 and c2-c3; however,
     # that gets the inner curve right but destroys the outer curve
     # from the x-based formula. So instead I just do the simplest
@@ -1634,7 +1825,7 @@ def _(cont_main): # four
     c0.weld_to(1, c1, 0, 1)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[tc0],0,1,6)
+    c0.nib = FollowCurve([tc0], 0, 1, 6)
     c1.nib = 6
     gradient = tan(c0.compute_theta(0))
     y0 = c2.compute_y(0)
@@ -1744,10 +1935,10 @@ def _(cont): # seven
     c6.weld_to(1, c7, 0)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c4,c5,c6,c7],0,4,6)
-    c1.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c4,c5,c6,c7],1,4,6)
-    c2.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c4,c5,c6,c7],2,4,6)
-    c3.nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,[c4,c5,c6,c7],3,4,6)
+    c0.nib = FollowCurve([c4,c5,c6,c7], 0, 4, 6)
+    c1.nib = FollowCurve([c4,c5,c6,c7], 1, 4, 6)
+    c2.nib = FollowCurve([c4,c5,c6,c7], 2, 4, 6)
+    c3.nib = FollowCurve([c4,c5,c6,c7], 3, 4, 6)
     c4.nib = c5.nib = c6.nib = c7.nib = 1 # essentially ignore these
     x2 = c7.compute_x(1)
     x0 = c7.compute_x(0)
@@ -1796,8 +1987,7 @@ def _(cont): # eight
     for i in range(len(tcurves)):
         tcurves[i].nib = 0
     for i in range(len(curves)):
-        curves[i].i = i
-        curves[i].nib = lambda c,x,y,t,theta: follow_curveset_nib(c,x,y,t,theta,tcurves,c.i,len(curves),8)
+        curves[i].nib = FollowCurve(tcurves, i, len(curves), 8)
 
     c3.nib = lambda c,x,y,t,theta: (lambda x1,x2: ((lambda k: (8, 0, 0, k))(9*((x-min(x1,x2))/abs(x2-x1)))))(c.compute_x(0),c.compute_x(1))
     c7.nib = lambda c,x,y,t,theta: (lambda x1,x2: ((lambda k: (8, 0, k, 0))(9*((max(x1,x2)-x)/abs(x2-x1)))))(c.compute_x(0),c.compute_x(1))
@@ -1866,16 +2056,16 @@ def _(cont):
     c0 = CircleInvolute(cont, 573, 435, 0.843662, 0.536875, 548, 535, -0.894427, 0.447214)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 4+25*cos(pi/2*t)**2
+    c0.nib = Profile(4, 25, "cos", pi/2, 2)
 
     blob(c0, 0, 'l', 5, 0)
 
 @define_glyph("asciiperiod")
 def _(cont):
     cont.extra = "newpath 500 439 34 0 360 arc fill"
-for x in [getattr(font, name) for name in
-          ['big0','big1','big2','big3','big5','big6','big7','big8','big9',
-           'asciiplus','asciiminus','asciicomma','asciiperiod']]:
+@amend_glyphs(['big0','big1','big2','big3','big5','big6','big7','big8','big9',
+               'asciiplus','asciiminus','asciicomma','asciiperiod'])
+def _(x):
     x.ty,x.by,x.gy = (font.big4.ty, font.big4.by,
                       font.big4.gy)
 
@@ -2134,7 +2324,7 @@ def _(cont): # s
     # End saved data
 
     phi = c1.compute_theta(1)
-    cont.default_nib = lambda c,x,y,t,theta: 15+6*cos(theta-phi)
+    cont.default_nib = Angle(15, 6, "cos", phi)
     blob(c0, 0, 'r', 12, 7)
     blob(c3, 1, 'r', 12, 7)
 
@@ -2185,7 +2375,8 @@ def _(cont): # z
     cont.by = font.dynamicm.by
     cont.lx = 533 + (-0.2 - 22.8) * cont.scale / 3600.0
     cont.rx = 650.1 - (-65.44 - -42.44) * cont.scale / 3600.0
-for x in [getattr(font, "dynamic"+letter) for letter in "fmprsz"]:
+@amend_glyphs(["dynamic"+letter for letter in "fmprsz"])
+def _(x):
     x.origin = (x.by * 3600. / x.scale, x.lx * 3600. / x.scale)
     x.width = x.rx - x.lx
 
@@ -2277,15 +2468,13 @@ def _(cont):
 
     c4.nib = 10
 
-    cont.default_nib = lambda c,x,y,t,theta: 8+16*cos(theta-c.nibdir(t))**2
-
     phi0 = c0.compute_theta(0)
     phi1 = c1.compute_theta(0) + 3*pi/2
     phi2 = c1.compute_theta(1) + pi
-    c0.nibdir = lambda t: phi0 + (phi1-phi0)*t
-    c1.nibdir = lambda t: phi1 + (phi2-phi1)*t
-    c2.nibdir = lambda t: phi2 + (phi1-phi2)*t
-    c3.nibdir = lambda t: phi1 + (phi0-phi1)*t
+    c0.nib = Angle(8, 16, "cos", (phi0, phi1), 2)
+    c1.nib = Angle(8, 16, "cos", (phi1, phi2), 2)
+    c2.nib = Angle(8, 16, "cos", (phi2, phi1), 2)
+    c3.nib = Angle(8, 16, "cos", (phi1, phi0), 2)
 
     # Draw the two dots.
     cont.extra = \
@@ -2339,17 +2528,18 @@ def _(cont):
     c3.weld_to(1, c4, 0)
     # End saved data
 
-    cont.default_nib = varsegnoend.default_nib
+    cont.default_nib = components.varsegnoend.default_nib
     cont.centre = c0.compute_x(0.5), c0.compute_y(0.5)
 
 @define_glyph("varsegno")
 def _(cont):
-    cont.extra = ("0 -100 translate", varsegnoend, varsegnomiddle,
-                  "0 177 translate", varsegnomiddle,
+    end, middle = components.varsegnoend, components.varsegnomiddle
+    cont.extra = ("0 -100 translate", end, middle,
+                  "0 177 translate", middle,
                   "%g %g translate 180 rotate %g %g translate" % (
-                      varsegnomiddle.centre[0], varsegnomiddle.centre[1],
-                      -varsegnomiddle.centre[0], -varsegnomiddle.centre[1]),
-                  varsegnoend)
+                      middle.centre[0], middle.centre[1],
+                      -middle.centre[0], -middle.centre[1]),
+                  end)
     cont.canvas_size = 1000, 1400
 
 # ----------------------------------------------------------------------
@@ -2371,7 +2561,7 @@ def _(cont):
     # End saved data
 
     c0.nib = c1.nib = 10
-    cont.default_nib = lambda c,x,y,t,theta: 8+12*abs(sin(theta))**2.5
+    cont.default_nib = Angle(8, 12, "sin", 0, 2.5, absolute=True)
 
 @define_glyph("varcoda")
 def _(cont): # variant square form used by Lilypond
@@ -2450,7 +2640,7 @@ def _(cont):
     # End saved data
 
     theta_thin = c0.compute_theta(1)
-    cont.default_nib = lambda c,x,y,t,theta: 10+16*sin(theta-theta_thin)**2
+    cont.default_nib = Angle(10, 16, "sin", theta_thin, 2)
     c2.nib = 10
 
     cont.curve_res *= 10
@@ -2671,7 +2861,7 @@ def _(cont):
     c0.weld_to(1, c1, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 8+18*cos(theta)**2
+    cont.default_nib = Angle(8, 18, "cos", 0, 2)
 
     # Draw the dot.
     cont.extra = "newpath 527 437 36 0 360 arc fill "
@@ -2685,7 +2875,7 @@ def _(cont):
     c0 = CircleInvolute(cont, 364, 465, 0, -1, 527, 313, 1, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 8+18*cos(theta)**2
+    cont.default_nib = Angle(8, 18, "cos", 0, 2)
 
     # Draw the dot.
     cont.extra = "newpath 527 437 36 0 360 arc fill "
@@ -2701,7 +2891,7 @@ def _(cont):
     c0.weld_to(1, c1, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 8+18*cos(theta)**2
+    cont.default_nib = Angle(8, 18, "cos", 0, 2)
 
     # Draw the dots.
     cont.extra = ("newpath 477 437 36 0 360 arc fill "
@@ -2814,7 +3004,7 @@ def _(cont):
     c0 = CircleInvolute(cont, 367, 334, -0.478852, 0.877896, 367, 604, 0.478852, 0.877896)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 6+8*sin(pi*t)
+    c0.nib = Profile(6, 8, "sin", pi)
 
     cont.rx = c0.compute_x(0) + c0.compute_nib(0) + 10
 
@@ -2836,8 +3026,8 @@ def _(cont):
     c0.weld_to(1, c1, 0)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 2+30*sin(pi/2*t)**2
-    c1.nib = lambda c,x,y,t,theta: 2+30*cos(pi/2*t)**2
+    c0.nib = Profile(2, 30, "sin", pi/2, 2)
+    c1.nib = Profile(2, 30, "cos", pi/2, 2)
 
     cont.scale = 1600
     cont.origin = 1000, 10
@@ -2850,8 +3040,8 @@ def _(cont):
     c0.weld_to(1, c1, 0)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 2+30*sin(pi/2*t)**2
-    c1.nib = lambda c,x,y,t,theta: 2+30*cos(pi/2*t)**2
+    c0.nib = Profile(2, 30, "sin", pi/2, 2)
+    c1.nib = Profile(2, 30, "cos", pi/2, 2)
 
     cont.scale = 1600
     cont.origin = 1000, 2170
@@ -2886,10 +3076,10 @@ def scaledbrace(cont, span): # arbitrarily sized brace
     nibmax = (8 + (32-8)*sqrt((span-525)/(4000.-525))) * cont.scale / 1600
     nibdiff = nibmax - nibmin
 
-    c0.nib = lambda c,x,y,t,theta: nibmin+nibdiff*sin(pi/2*t)**2
-    c1.nib = lambda c,x,y,t,theta: nibmin+nibdiff*cos(pi/2*t)**2
-    c2.nib = lambda c,x,y,t,theta: nibmin+nibdiff*sin(pi/2*t)**2
-    c3.nib = lambda c,x,y,t,theta: nibmin+nibdiff*cos(pi/2*t)**2
+    c0.nib = Profile(nibmin, nibdiff, "sin", pi/2, 2)
+    c1.nib = Profile(nibmin, nibdiff, "cos", pi/2, 2)
+    c2.nib = Profile(nibmin, nibdiff, "sin", pi/2, 2)
+    c3.nib = Profile(nibmin, nibdiff, "cos", pi/2, 2)
 
     cont.canvas_size = 105, 930
 
@@ -2918,9 +3108,10 @@ def _(cont, vwid):
 
     cont.hy = c1.compute_y(0)
 
-@define_glyph("bracketupper", args=(font.bracketlower,))
-@define_glyph("bracketupperlily", args=(font.bracketlowerlily,))
-def _(cont, x):
+@define_glyph("bracketupper", args=("bracketlower",))
+@define_glyph("bracketupperlily", args=("bracketlowerlily",))
+def _(cont, lower):
+    x = getattr(font, lower)
     cont.extra = "0 946 translate 1 -1 scale", x
 
     cont.hy = 946 - x.hy
@@ -2960,7 +3151,7 @@ def _(cont):
     c2.weld_to(1, c3, 0, 1)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,527,472,2)
+    cont.default_nib = PointToPoint(527, 472, 2)
 
     cont.ay = c1.compute_y(0)
 
@@ -2986,7 +3177,7 @@ def _(cont, thumb):
     c2.weld_to(1, c3, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 6 + 4*sin(theta)**2
+    cont.default_nib = Angle(6, 4, "sin", 0, 2)
     if thumb:
         c4.nib = 10
     else:
@@ -3040,7 +3231,7 @@ def _(cont):
     c0 = CircleInvolute(cont, 577, 341, 0.843661, 0.536875, 548, 466, -0.894427, 0.447214)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 4+30*cos(pi/2*t)**2
+    c0.nib = Profile(4, 30, "cos", pi/2, 2)
 
     blob(c0, 0, 'l', 5, 0)
 
@@ -3050,7 +3241,7 @@ def _(cont):
     c0 = StraightLine(cont, 547, 466, 587, 341)
     # End saved data
 
-    c0.nib = lambda c,x,y,t,theta: 4+14*t
+    c0.nib = Profile(4, 14)
 
 @define_glyph("revbreath")
 def _(cont):
@@ -3067,7 +3258,7 @@ def _(cont):
     c1 = CircleInvolute(cont, 500.5, 486.5, 0.247004, -0.969015, 640, 280, 0.910366, -0.413803)
     c0.weld_to(1, c1, 0, 1)
     # End saved data
-    c0.nib = lambda c,x,y,t,theta: 4+12*t
+    c0.nib = Profile(4, 12)
     c1.nib = lambda c,x,y,t,theta: 4+12*(1-t)**2
     cont.ox = c0.compute_x(1)
 
@@ -3113,7 +3304,7 @@ def _(cont):
     c2.weld_to(1, c3, 1, 1)
 
     x0, y0 = c0.compute_x(1), c0.compute_y(1)
-    cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,x0,y0,10)
+    cont.default_nib = PointToPoint(x0, y0, 10)
 
     cont.ox = 500 - half_width
     cont.cy = y_tip + 10 + translate_up # y_tip + 10 alignes downarrow tip with baseline
@@ -3158,7 +3349,7 @@ def _(cont):
     c2.weld_to(1, c3, 1, 1)
 
     x0, y0 = c0.compute_x(1), c0.compute_y(1)
-    cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,x0,y0,10)
+    cont.default_nib = PointToPoint(x0, y0, 10)
 
     cont.ox = 500 - half_width
     cont.cy = y_tip - 10 + translate_up2 # y_tip - 10 alignes downarrow tip with baseline
@@ -3209,7 +3400,7 @@ def _(cont, rotate, is_open):
         c2.nib = 0
     else:
         x0, y0 = c0.compute_x(0.5), c0.compute_y(1)
-        cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,x0,y0,10)
+        cont.default_nib = PointToPoint(x0, y0, 10)
 
     if rotate:
         cont.before = "500 500 translate %g rotate -500 -500 translate" % rotate
@@ -3266,7 +3457,7 @@ def _(cont, rotate, is_open):
         c2.nib = 0
     else:
         x0, y0 = c0.compute_x(0.5), c0.compute_y(1)
-        cont.default_nib = lambda c,x,y,t,theta: ptp_nib(c,x,y,t,theta,x0,y0,10)
+        cont.default_nib = PointToPoint(x0, y0, 10)
 
     if rotate:
         cont.before = "500 500 translate %g rotate -500 -500 translate" % rotate
@@ -3813,7 +4004,7 @@ def _(cont):
     c2.weld_to(1, c3, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 4+14*abs(cos(theta + 3*pi/4))**1.5
+    cont.default_nib = Angle(4, 14, "cos", -3*pi/4, 1.5, absolute=True)
 
 @define_glyph("arpeggioshort")
 def _(cont):
@@ -3823,7 +4014,7 @@ def _(cont):
     c0.weld_to(1, c1, 0)
     # End saved data
 
-    cont.default_nib = lambda c,x,y,t,theta: 4+14*abs(cos(theta + 3*pi/4))**1.5
+    cont.default_nib = Angle(4, 14, "cos", -3*pi/4, 1.5, absolute=True)
 
     cont.ty = c0.compute_y(0)
     cont.oy = c1.compute_y(1)
@@ -3943,14 +4134,14 @@ def _(cont):
 
 @define_glyph("acciaccatura")
 def _(cont):
-    cont.extra = font.appoggiatura, accslashup
+    cont.extra = font.appoggiatura, components.accslashup
 
 @define_glyph("accslashbigup")
 def _(cont):
-    cont.extra = "-500 0 translate 1 .45 div dup scale", accslashup
+    cont.extra = "-500 0 translate 1 .45 div dup scale", components.accslashup
 
-    cont.ox = -500 + accslashup.ox / .45
-    cont.oy = accslashup.oy / .45
+    cont.ox = -500 + components.accslashup.ox / .45
+    cont.oy = components.accslashup.oy / .45
 
 @define_glyph("accslashbigdn")
 def _(cont):
@@ -4006,7 +4197,7 @@ def _(cont):
     c2.nib = c3.nib = lambda c,x,y,t,theta: 6+10*quintic(0.6, (shift(theta, shift23)-end2)/(end3-end2))
 
     theta45 = (c4.compute_theta(0) + c5.compute_theta(1))/2
-    c4.nib = c5.nib = lambda c,x,y,t,theta: 6 + 15*sin(theta-theta45)**2
+    c4.nib = c5.nib = Angle(6, 15, "sin", theta45, 2)
 
     theta7 = c7.compute_theta(0)
     c6.nib = lambda c,x,y,t,theta: (6, theta7, 18*t**2, 18*t**2)
@@ -4095,9 +4286,10 @@ def _(cont):
 
 @define_glyph("pedstar")
 def _(cont):
-    cx, cy, r = pedstarcomponent.cx, pedstarcomponent.cy, pedstarcomponent.r
+    star = components.pedstarcomponent
+    cx, cy, r = star.cx, star.cy, star.r
 
-    cont.extra = "8 {", pedstarcomponent, \
+    cont.extra = "8 {", star, \
     "%g %g translate 45 rotate %g %g translate } repeat" % (cx,cy, -cx,-cy) + \
     " newpath %g %g %g 0 360 arc closepath 12 setlinewidth stroke" % (cx,cy, r-5)
 
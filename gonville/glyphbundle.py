@@ -0,0 +1,124 @@
+# A precompiled bundle of glyphs, so that a build can start without
+# running all of font.py.
+#
+# 'glyphs.py --compile' lowers every glyph in font.py to a GlyphIR (see
+# glyphir.py) and writes them all to one file, along with the glyphs
+# each one depends on (for --only) and a key identifying the sources
+# it was made from. Builds which find a bundle with the right key load
+# glyphs from it instead of constructing them.
+#
+# The file is a short header, a JSON index, and then one data section
+# holding every nib table as raw doubles, followed by each glyph's
+# GlyphIR pickled with its nib tables replaced by references into the
+# data section. The file is mapped into memory, and the references are
+# resolved to memoryviews of the mapping, so loading a glyph copies
+# nothing but its (small) pickle, and worker processes started by fork
+# share the nib tables with the parent.
+
+import io
+import os
+import sys
+import json
+import mmap
+import pickle
+import struct
+import hashlib
+from array import array
+
+MAGIC = b"Gonville glyph bundle 1\n"
+
+def key(sources, extra=()):
+    # Identifies the source files and any other inputs a bundle was
+    # compiled from, and the Python that compiled it, whose pickles
+    # and doubles the bundle holds.
+    h = hashlib.sha256()
+    for fname in sources:
+        with open(fname, "rb") as f:
+            h.update(f.read())
+    h.update(json.dumps([sys.version, sys.byteorder] + list(extra),
+                        sort_keys=True).encode("UTF-8"))
+    return h.hexdigest()
+
+def aligned(n):
+    return (n + 7) & ~7
+
+class Pickler(pickle.Pickler):
+    def __init__(self, file, data):
+        pickle.Pickler.__init__(self, file, 4)
+        self.data = data
+
+    def persistent_id(self, obj):
+        if type(obj) is array and obj.typecode == "d":
+            offset = len(self.data)
+            self.data += obj.tobytes()
+            return offset, len(obj)
+        return None
+
+class Unpickler(pickle.Unpickler):
+    def __init__(self, file, data):
+        pickle.Unpickler.__init__(self, file)
+        self.data = data
+
+    def persistent_load(self, pid):
+        offset, n = pid
+        return self.data[offset:offset + 8*n].cast("d")
+
+def write(fname, bundlekey, glyphs, dependencies):
+    # Write a dict of GlyphIRs to a bundle, atomically.
+    data = bytearray()
+    pickles = []
+    for name, ir in glyphs.items():
+        f = io.BytesIO()
+        Pickler(f, data).dump(ir)
+        pickles.append((name, f.getvalue()))
+    index = {}
+    offset = len(data)
+    for name, p in pickles:
+        index[name] = [offset, offset + len(p)]
+        offset += len(p)
+    header = json.dumps({
+        "key": bundlekey, "glyphs": index,
+        "dependencies": {name: sorted(deps)
+                         for name, deps in dependencies.items()},
+    }, sort_keys=True).encode("UTF-8")
+    start = len(MAGIC) + 8 + len(header)
+    tmp = fname + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(bytes(aligned(start) - start))
+        f.write(data)
+        for name, p in pickles:
+            f.write(p)
+    os.replace(tmp, fname)
+
+class Bundle:
+    def __init__(self, fname):
+        with open(fname, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a glyph bundle" % fname)
+        n, = struct.unpack_from("<Q", self.map, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self.map[start:start + n])
+        self.key = header["key"]
+        self.glyphs = header["glyphs"]
+        self.dependencies = header["dependencies"]
+        self.data = memoryview(self.map)[aligned(start + n):]
+
+    def __contains__(self, name):
+        return name in self.glyphs
+
+    def load(self, name):
+        start, end = self.glyphs[name]
+        return Unpickler(io.BytesIO(self.data[start:end]), self.data).load()
+
+def open_bundle(fname, bundlekey):
+    # The bundle in the named file, or None if there isn't one or it
+    # wasn't made from the same sources.
+    try:
+        bundle = Bundle(fname)
+    except (OSError, ValueError):
+        return None
+    return bundle if bundle.key == bundlekey else None
@@ -0,0 +1,160 @@
+# A picklable intermediate representation of a glyph.
+#
+# A GlyphContext can't be pickled: its curves are welded to each
+# other, point back at the context, and above all carry nibs which
+# are usually lambdas closed over whatever the glyph's constructor
+# had to hand. So worker processes have always had to inherit their
+# glyphs from the parent by fork. lower() turns a glyph into a
+# GlyphIR holding just what makeps() needs:
+#
+#  - each curve's geometry, as a bare copy of the curve object with
+#    only the parameters compute_point() uses, and the range of t it's
+#    drawn over;
+#  - each curve's nib, kept as it is if it's a constant or a nib
+#    descriptor (see nibs.py), or else evaluated at every point
+#    makeps() will sample, since that's all anyone ever asks of a nib
+#    function;
+#  - the 'before' string, and the 'extra' list with any glyphs in it
+#    lowered in turn;
+#  - the size, scale and trace settings of the glyph, and any other
+#    plain numbers and strings it carries (such as 'hy' or 'width')
+#    for the rest of the build to look at.
+#
+# GlyphIR.makeps() produces exactly the same PostScript as the
+# GlyphContext it came from, so a GlyphIR can stand in for its glyph
+# anywhere in the tracing pipeline, and it can be sent to workers
+# started by spawn or forkserver, or hashed to identify the glyph.
+
+import types
+import pickle
+import hashlib
+from array import array
+from math import isnan
+from nibs import Nib, strokes, sample_ts
+
+# Attributes of a GlyphContext, besides its curves and extras, which
+# the tracing pipeline looks at.
+SETTINGS = ("before", "scale", "origin", "canvas_size",
+            "trace_res", "curve_res")
+
+# The attributes of each kind of curve that compute_point() uses.
+GEOMETRY = ("inparams", "params")
+
+NAN = float("nan")
+
+def plain(v):
+    if type(v) == tuple:
+        return all(plain(vv) for vv in v)
+    return type(v) in (int, float, str)
+
+def geometry(curve):
+    copy = type(curve).__new__(type(curve))
+    for attr in GEOMETRY:
+        if attr in curve.__dict__:
+            setattr(copy, attr, curve.__dict__[attr])
+    return copy
+
+def sample_nibs(curve, res):
+    # A nib function's value at each of the points makeps() samples,
+    # four numbers apiece: a chisel nib's radius, angle, fdist and
+    # bdist, or a round nib's radius followed by a NaN.
+    table = array("d")
+    ts = sample_ts([it / float(res-1) for it in range(res)], curve.trange)
+    points = [curve.compute_point(t) for t in ts]
+    for nib in curve.compute_nibs(ts, points):
+        if type(nib) == tuple:
+            table.extend(nib)
+        else:
+            table.extend((nib, NAN, 0, 0))
+    return table
+
+class CurveIR:
+    def __init__(self, curve, res):
+        self.geometry = geometry(curve)
+        self.trange = curve.trange
+        nib = curve.nib
+        if nib == None:
+            nib = curve.cont.default_nib
+        if type(nib) == types.FunctionType:
+            self.nib, self.nibs = None, sample_nibs(curve, res)
+        elif isinstance(nib, Nib):
+            self.nib, self.nibs = nib.lowered(geometry), None
+        else:
+            self.nib, self.nibs = nib, None
+
+    def __getstate__(self):
+        # A nib table loaded from a glyphbundle is a view of the bundle
+        # file, which only this process has mapped.
+        state = dict(self.__dict__)
+        if isinstance(self.nibs, memoryview):
+            state["nibs"] = array("d", self.nibs.tobytes())
+        return state
+
+    def compute_point(self, t):
+        return self.geometry.compute_point(t)
+
+    def compute_nibs(self, ts, points):
+        if isinstance(self.nib, Nib):
+            thetas = None
+            if self.nib.needs_theta:
+                thetas = [self.geometry.compute_theta(t) for t in ts]
+            return self.nib.evaluate(self.geometry, ts, points, thetas)
+        elif self.nibs is None:
+            return [self.nib] * len(ts)
+        nibs = []
+        table = self.nibs
+        for i in range(0, len(table), 4):
+            radius, angle, fdist, bdist = table[i:i+4]
+            if isnan(angle):
+                nibs.append(radius)
+            else:
+                nibs.append((radius, angle, fdist, bdist))
+        return nibs
+
+class GlyphIR:
+    def __init__(self, char):
+        for attr, v in vars(char).items():
+            if attr != "curveid" and plain(v):
+                setattr(self, attr, v)
+        for attr in SETTINGS:
+            setattr(self, attr, getattr(char, attr))
+        self.curves = [CurveIR(curve, char.curve_res)
+                       for curve in char.curves.values()]
+        e = char.extra
+        if not (type(e) == tuple or type(e) == list):
+            e = (e,)
+        self.extra = [ee if type(ee) == str else lower(ee) for ee in e]
+
+    def makeps(self):
+        # This must match GlyphContext.makeps() character for character.
+        out = "gsave 1 setlinecap\n"
+        out = out + self.before + "\n"
+        ts = [it / float(self.curve_res-1) for it in range(self.curve_res)]
+        for curve in self.curves:
+            cts = sample_ts(ts, curve.trange)
+            points = [curve.compute_point(t) for t in cts]
+            out = out + strokes(points, curve.compute_nibs(cts, points))
+        for ee in self.extra:
+            if type(ee) == str:
+                out = out + ee + "\n"
+            else:
+                out = out + ee.makeps()
+        out = out + "\ngrestore\n"
+        return out
+
+    def testdraw(self):
+        print("gsave clippath flattenpath pathbbox 0 exch translate")
+        print("1 -1 scale pop pop pop")
+        print(self.makeps())
+        print("grestore showpage")
+
+    def fingerprint(self):
+        # A hash of everything about the glyph: its PostScript, how
+        # it's traced, and its metadata.
+        return hashlib.sha256(pickle.dumps(self, 4)).hexdigest()
+
+def lower(char):
+    # Lowering a GlyphIR again just returns it.
+    if isinstance(char, GlyphIR):
+        return char
+    return GlyphIR(char)
@@ -10,8 +10,25 @@ import subprocess
 import multiprocessing
 import argparse
 import shutil
+import json
+import queue
+import threading
+import fnmatch
 from curves import *
-from font import font, scaledbrace, GlyphContext
+from font import font, scaledbrace, GlyphContext, construction_time, closure
+from font import dependencies, use_bundle
+from outline import Outline, MOVETO, LINETO, CURVETO, CLOSEPATH, break_curves
+import psrender
+import tracer
+import fidelity
+import interpolate
+import bitmappool
+import toolrunner
+import buildmanifest
+import buildprofile
+import glyphir
+import glyphbundle
+import memusage
 
 # UTF-7 encoding, ad-hocked to do it the way Fontforge wants it done
 # (encoding control characters and double quotes, in particular).
@@ -47,82 +64,16 @@ def update_bbox(bbox, x, y):
         y1 = max(y1, y)
     return x0,y0,x1,y1
 
-def bezfn(x0, x1, x2, x3, t):
-    return x0*(1-t)**3 + 3*x1*(1-t)**2*t + 3*x2*(1-t)*t**2 + x3*t**3
-
-def break_curve(x0,y0, x1,y1, x2,y2, x3,y3):
-    # We must differentiate the separate cubics for the curve's x and
-    # y coordinates, find any stationary points in [0,1], and break
-    # the curve at those points.
-    #
-    # A single coordinate of a Bezier curve has the equation
-    #
-    #  x = x0 (1-t)^3 + 3 x1 (1-t)^2 t + 3 x2 (1-t) t^2 + x3 t^3
-    #    = x0 (1-3t+3t^2-t^3) + 3 x1 (t-2t^2+t^3) + 3 x2 (t^2-t^3) + x3 t^3
-    #    = t^3 (x3-3x2+3x1-x0) + t^2 (3x2-6x1+3x0) + t (3x1-3x0) + x0
-    #
-    # and hence its derivative is at^2+bt+c where
-    #  a = 3(x3-3x2+3x1-x0)
-    #  b = 6(x2-2x1+x0)
-    #  c = 3(x1-x0)
-    breakpts = [(0,0),(1,0)]
-    for (axis,c0,c1,c2,c3) in ((1,x0,x1,x2,x3),(2,y0,y1,y2,y3)):
-        a = 3*(c3-3*c2+3*c1-c0)
-        b = 6*(c2-2*c1+c0)
-        c = 3*(c1-c0)
-        #sys.stderr.write("%d: a=%g b=%g c=%g\n" % (axis, a, b, c))
-        tlist = ()
-        if a == 0:
-            if b != 0:
-                breakpts.append((-c/b,axis))
-        else:
-            disc = b*b-4*a*c
-            if disc >= 0:
-                rdisc = math.sqrt(disc)
-                breakpts.append(((-b + rdisc)/(2*a),axis))
-                breakpts.append(((-b - rdisc)/(2*a),axis))
-    breakpts.sort()
-    curves = []
-    #sys.stderr.write("break %g,%g %g,%g %g,%g %g,%g:\n" % (x0,y0,x1,y1,x2,y2,x3,y3))
-    #sys.stderr.write("   at %s\n" % repr(breakpts))
-    for i in range(len(breakpts)-1):
-        (t0, axis0) = breakpts[i]
-        (t1, axis1) = breakpts[i+1]
-        if 0 <= t0 and t0 < t1 and t1 <= 1:
-            nx0 = bezfn(x0,x1,x2,x3,t0)
-            ny0 = bezfn(y0,y1,y2,y3,t0)
-            nx3 = bezfn(x0,x1,x2,x3,t1)
-            ny3 = bezfn(y0,y1,y2,y3,t1)
-            nx1 = nx0 + (t1-t0) * ((x3-3*x2+3*x1-x0)*t0**2 + 2*(x2-2*x1+x0)*t0 + (x1-x0))
-            ny1 = ny0 + (t1-t0) * ((y3-3*y2+3*y1-y0)*t0**2 + 2*(y2-2*y1+y0)*t0 + (y1-y0))
-            nx2 = nx3 - (t1-t0) * ((x3-3*x2+3*x1-x0)*t1**2 + 2*(x2-2*x1+x0)*t1 + (x1-x0))
-            ny2 = ny3 - (t1-t0) * ((y3-3*y2+3*y1-y0)*t1**2 + 2*(y2-2*y1+y0)*t1 + (y1-y0))
-            if axis0 == 1:
-                nx1 = nx0
-            elif axis0 == 2:
-                ny1 = ny0
-            if axis1 == 1:
-                nx2 = nx3
-            elif axis1 == 2:
-                ny2 = ny3
-            curves.append((nx0,ny0,nx1,ny1,nx2,ny2,nx3,ny3))
-            #sys.stderr.write("  got %g,%g %g,%g %g,%g %g,%g\n" % curves[-1])
-    return curves
-
-def check_call_devnull(*args, **kws):
+def check_call_devnull(command):
     # Wrapper on subprocess.check_call which prints the standard error
     # of the process if it fails.
-    p = subprocess.Popen(*args, **kws, stdout=subprocess.DEVNULL,
-                         stderr=subprocess.PIPE)
-    _, err = p.communicate()
-    status = p.wait()
-    if status != 0:
-        sys.stderr.write(err)
-        raise subprocess.CalledProcessError(status, args[0])
+    toolrunner.run(command)
 
 # Use potrace to compute the PS path outline of any glyph.
-def get_ps_path(char, debug=None):
-    path = []
+def get_ps_path_potrace(char, debug=None):
+    return run_potrace(char, potrace_commands(char, debug), glyph_ps(char))
+
+def potrace_commands(char, debug=None):
     xsize, ysize = char.canvas_size
     res = char.trace_res
     commands = []
@@ -137,15 +88,26 @@ def get_ps_path(char, debug=None):
                      "-M", "1000", "-O", "1", "-o", "-", "-"])
     if debug is not None:
         commands.append(["tee", "z2."+debug])
-    procs = [None] * len(commands)
-    for i, command in enumerate(commands):
-        procs[i] = subprocess.Popen(command,
-                                    stdin=(procs[i-1].stdout if i>0
-                                           else subprocess.PIPE),
-                                    stdout=subprocess.PIPE, close_fds=True)
-    procs[0].stdin.write(("0 %d translate 1 -1 scale\n" % ysize + char.makeps() + "showpage").encode("ASCII"))
-    procs[0].stdin.close()
-    # Now we read and parse potrace's PostScript output. This is easy
+    return commands
+
+def run_potrace(char, commands, ps):
+    # Feed a glyph's PostScript through gs and potrace and parse the
+    # result. This part of the work is mostly waiting for the two
+    # programs, so PotraceThread does it alongside the next glyph's
+    # makeps.
+    times = {}
+    with buildprofile.stage("pipeline"):
+        output = toolrunner.pipeline(commands, ps.encode("ASCII"), times=times)
+    for tool, seconds in times.items():
+        buildprofile.add(tool, seconds)
+    with buildprofile.stage("parse"):
+        path = parse_potrace_output(output.decode("ASCII"), 4.0 / char.trace_res)
+    # Split all the curves at their x and y extrema in one go.
+    path = finish_path(path)
+    return path.bbox(), path
+
+def parse_potrace_output(output, scale):
+    # Parse potrace's PostScript output into an Outline. This is easy
     # enough if we've configured potrace to output as simply as
     # possible (which we did) and are also ignoring most of the fiddly
     # bits, which we are. I happen to know that potrace (as of v1.8 at
@@ -154,13 +116,10 @@ def get_ps_path(char, debug=None):
     # I'm going to ignore the scale and translate commands and just
     # skip straight to parsing the actual lines and curves on that
     # basis.
+    path = Outline()
     psstack = []
     pscurrentpoint = None, None
-    output = "newpath"
-    scale = 4.0 / char.trace_res
-    while 1:
-        s = procs[-1].stdout.readline().decode("ASCII")
-        if s == "": break
+    for s in output.splitlines():
         if s[:1] == "%":
             continue # comment
         ss = s.split()
@@ -191,7 +150,7 @@ def get_ps_path(char, debug=None):
                     assert x0 != None
                     x1, y1 = x1 + x0, y1 + y0
                 pscurrentpoint = x1, y1
-                path.append(('m', x1*scale, y1*scale))
+                path.moveto(x1*scale, y1*scale)
             elif word == "lineto" or word == "rlineto":
                 y1 = psstack.pop(); x1 = psstack.pop()
 
@@ -202,7 +161,7 @@ def get_ps_path(char, debug=None):
                     assert x0 != None
                     x1, y1 = x1 + x0, y1 + y0
                 pscurrentpoint = x1, y1
-                path.append(('l', x0*scale, y0*scale, x1*scale, y1*scale))
+                path.lineto(x0*scale, y0*scale, x1*scale, y1*scale)
             elif word == "curveto" or word == "rcurveto":
                 y3 = psstack.pop(); x3 = psstack.pop()
                 y2 = psstack.pop(); x2 = psstack.pop()
@@ -218,26 +177,866 @@ def get_ps_path(char, debug=None):
                     x2, y2 = x2 + x0, y2 + y0
                     x3, y3 = x3 + x0, y3 + y0
                 pscurrentpoint = x3, y3
-                for c in break_curve(x0*scale,y0*scale,x1*scale,y1*scale,\
-                x2*scale,y2*scale,x3*scale,y3*scale):
-                    path.append(('c',) + c)
+                path.curveto(x0*scale,y0*scale,x1*scale,y1*scale,
+                             x2*scale,y2*scale,x3*scale,y3*scale)
             elif word == "closepath":
-                path.append(('cp',))
-    procs[-1].stdout.close()
-    for p in procs:
-        p.wait()
-    bbox = None, None, None, None
-    for c in path:
-        if c[0] != 'cp':
-            bbox = update_bbox(bbox, c[-2], c[-1])
+                path.closepath()
+    return path
+
+def glyph_ps(char):
+    # The PostScript we render to trace a glyph.
+    with buildprofile.stage("makeps"):
+        ps = "0 %d translate 1 -1 scale\n" % char.canvas_size[1] + \
+             char.makeps() + "showpage"
+    buildprofile.note("ps_bytes", len(ps))
+    return ps
+
+def finish_path(path):
+    with buildprofile.stage("break_curves"):
+        path = break_curves(path)
+    buildprofile.note("segments", len(path))
+    return path
+
+# Compute the PS path outline of any glyph without any external
+# tools, using our own PostScript renderer and tracer. The output is
+# in the same coordinate system as get_ps_path_potrace's, though
+# naturally the curves themselves won't be identical.
+def get_ps_path_builtin(char, debug=None):
+    ps = glyph_ps(char)
+    with buildprofile.stage("render"):
+        bitmap = psrender.render(char, ps=ps)
+    with buildprofile.stage("trace"):
+        path = tracer.trace(bitmap, char.trace_res)
+    path = finish_path(path)
+    return path.bbox(), path
+
+# Which of the above get_ps_path uses; set from the command line.
+trace_backend = "potrace"
+
+def get_ps_path(char, debug=None):
+    if trace_backend == "builtin":
+        return get_ps_path_builtin(char, debug)
+    return get_ps_path_potrace(char, debug)
+
+# Many glyphs are nothing but another glyph moved, scaled or
+# mirrored: the small clefs, bracketupper, and the glyphs whose
+# 'before' reflects another drawn in 'extra'. Rendering and tracing
+# such a glyph is a waste of time, since its outline is just its
+# parent's with the same transformation applied. affine_variant()
+# recognises them: if char has no curves of its own and draws exactly
+# one other glyph, and everything else it says to PostScript is
+# gsave, grestore, translate or scale, it returns the name of that
+# glyph and the matrix taking the parent's traced outline onto
+# char's. Otherwise it returns None.
+AFFINE_OPERATORS = {"gsave", "grestore", "translate", "scale", "dup"}
+
+def affine_variant(char):
+    if char.curves:
+        return None
+    e = char.extra
+    if not (type(e) == tuple or type(e) == list):
+        e = (e,)
+    # The current transformation, as x -> sx*x+tx, y -> sy*y+ty in the
+    # glyph's own coordinates, and what it was when the parent was
+    # drawn.
+    ctm = 1, 1, 0, 0
+    saved = []
+    stack = []
+    parent = drawn = None
+    for item in (char.before,) + tuple(e):
+        if type(item) != str:
+            if parent is not None or getattr(item, "name", None) is None:
+                return None
+            parent, drawn = item, ctm
+            continue
+        for word in item.split():
+            if word not in AFFINE_OPERATORS:
+                try:
+                    stack.append(float(word))
+                except ValueError:
+                    return None
+            elif word == "dup" and stack:
+                stack.append(stack[-1])
+            elif word == "gsave":
+                saved.append(ctm)
+            elif word == "grestore" and saved:
+                ctm = saved.pop()
+            elif word != "dup" and len(stack) >= 2:
+                u, v = stack.pop(-2), stack.pop()
+                sx, sy, tx, ty = ctm
+                if word == "translate":
+                    ctm = sx, sy, sx*u + tx, sy*v + ty
+                else:
+                    ctm = sx*u, sy*v, tx, ty
+            else:
+                return None
+    if parent is None or 0 in drawn[:2]:
+        return None
+    # Traced outlines are in units of 1/40 of the glyph's coordinates,
+    # measured up from the bottom of its canvas.
+    sx, sy, tx, ty = drawn
+    height, pheight = char.canvas_size[1], parent.canvas_size[1]
+    return parent.name, [sx, 0, 0, sy, 40*tx, 40*(height - ty - sy*pheight)]
+
+def derived_outline(char, parent, matrix, outline):
+    # The outline of an affine variant char, given its parent's, or
+    # None if the parent's outline comes so near the edge of its canvas
+    # that it may have been cut off, or the variant's would be, in
+    # which case the variant has to be traced after all.
+    bbox, path = outline
+    if bbox[0] is not None and not inside_canvas(parent, bbox):
+        return None
+    path = path.transform(matrix)
+    if matrix[0] * matrix[3] < 0:
+        path = path.reversed()
+    bbox = path.bbox()
+    if bbox[0] is not None and not inside_canvas(char, bbox):
+        return None
     return bbox, path
 
-def get_ps_path_map_function(glyphname):
-    # Wrapper on get_ps_path suitable for feeding to the unordered
-    # imap function in multiprocessing.Pool. Returns tuples of the
-    # form (name, (bbox, path)), so that you can feed a list of those
-    # tuples directly to dict().
-    return glyphname, get_ps_path(getattr(font, glyphname))
+def transformed(vid, parent, matrix):
+    # The derivation of an affine variant, for BuildScheduler.
+    return lambda outlines: derived_outline(getattr(font, vid), getattr(font, parent),
+                                            matrix, outlines[parent])
+
+def inside_canvas(char, bbox):
+    # Whether an outline's bounding box keeps at least a pixel clear
+    # of every edge of the glyph's canvas.
+    margin = 40.0 / char.trace_res
+    xsize, ysize = char.canvas_size
+    x0, y0, x1, y1 = bbox
+    return (x0 >= margin and y0 >= margin and
+            x1 <= 40*xsize - margin and y1 <= 40*ysize - margin)
+
+# How worker processes are started, from --start-method (None for
+# the platform's default). Workers started by fork inherit every glyph
+# from the parent and can look them up by name; otherwise they can't
+# see glyphs made at run time, such as the braces, or the settings
+# main() puts in globals, so each glyph is sent to them by value as a
+# GlyphIR and the settings are passed to init_worker.
+start_method = None
+
+def pool(jobs, returned=None):
+    context = multiprocessing.get_context(start_method)
+    return context.Pool(jobs, init_worker, (trace_backend, tuning, returned))
+
+def by_value():
+    return multiprocessing.get_context(start_method).get_start_method() != "fork"
+
+def init_worker(backend, settings, returned):
+    global trace_backend, tuning, results
+    trace_backend, tuning, results = backend, settings, returned
+    # Workers inherit tracemalloc under fork, but measure themselves
+    # by RSS instead, and would otherwise run several times slower.
+    memusage.stop_tracing()
+
+def shipped(glyphname):
+    # What to send a worker for it to work on a glyph: None if it can
+    # find the glyph itself.
+    if by_value():
+        return glyphir.lower(tuned(glyphname, getattr(font, glyphname)))
+    return None
+
+def worker_glyph(glyphname, ir):
+    if ir is not None:
+        return ir
+    return tuned(glyphname, getattr(font, glyphname))
+
+# With the builtin backend, BuildScheduler renders and traces each
+# glyph as two separate tasks, which may well run in different worker
+# processes, passing the bitmap between them in a shared buffer.
+def bitmap_size(char):
+    xsize, ysize = char.canvas_size
+    return xsize * char.trace_res, ysize * char.trace_res
+
+# Each task also returns how long it took, so that BuildScheduler can
+# learn what to start first next time, and the buildprofile stats of
+# its stages, including how much memory it needed.
+def render_task(glyphname, ir, buffer):
+    start = time.time()
+    stats = buildprofile.begin()
+    with memusage.Task() as mem:
+        char = worker_glyph(glyphname, ir)
+        width, height = bitmap_size(char)
+        ps = glyph_ps(char)
+        with buildprofile.stage("render"):
+            with bitmappool.bitmap(buffer, width, height) as bitmap:
+                psrender.render(char, bitmap, ps)
+    note_memory(mem)
+    return glyphname, time.time() - start, stats
+
+def trace_task(glyphname, ir, buffer):
+    start = time.time()
+    stats = buildprofile.begin()
+    with memusage.Task() as mem:
+        char = worker_glyph(glyphname, ir)
+        width, height = bitmap_size(char)
+        with bitmappool.bitmap(buffer, width, height) as bitmap:
+            with buildprofile.stage("trace"):
+                path = tracer.trace(bitmap, char.trace_res)
+        path = finish_path(path)
+    note_memory(mem)
+    return glyphname, (path.bbox(), path), time.time() - start, stats
+
+def note_memory(mem):
+    # The most of what this thread's tasks on the glyph measured: they
+    # all see the whole process's peak, so when a PotraceThread is
+    # running too they can only be approximate.
+    stats = buildprofile.current()
+    buildprofile.note("peak_rss", max(mem.peak, stats.get("peak_rss", 0)))
+    buildprofile.note("memory", max(mem.used, stats.get("memory", 0)))
+
+# With potrace, BuildScheduler doesn't have each worker wait for gs
+# and potrace. pipelined_trace_task generates a glyph's PostScript,
+# hands it to a thread of the worker's own which runs the two programs
+# and parses their output, and returns straight away, so that the
+# worker's next task generates the next glyph's PostScript while they
+# run (the thread spends most of its time waiting for them, without
+# holding the GIL). The thread takes one glyph at a time, so a worker
+# has at most two on the go, and sends each outline to the parent on
+# the 'results' queue init_worker was given, in the same form as
+# trace_task's result.
+results = None
+potrace_thread = None
+
+class PotraceThread:
+    def __init__(self):
+        self.free = threading.Semaphore(1)
+        self.todo = queue.Queue()
+        threading.Thread(target=self.run, name="potrace", daemon=True).start()
+
+    def submit(self, *job):
+        # Wait until the thread has finished its last glyph, then give
+        # it this one.
+        self.free.acquire()
+        self.todo.put(job)
+
+    def run(self):
+        while True:
+            glyphname, char, ps, seconds, stats = self.todo.get()
+            start = time.time()
+            buildprofile.resume(stats)
+            try:
+                with memusage.Task() as mem:
+                    outline = run_potrace(char, potrace_commands(char), ps)
+                note_memory(mem)
+                results.put(("traced", (glyphname, outline,
+                                        seconds + time.time() - start, stats)))
+            except Exception as e:
+                results.put(("error", e))
+            finally:
+                self.free.release()
+
+def pipelined_trace_task(glyphname, ir):
+    global potrace_thread
+    start = time.time()
+    stats = buildprofile.begin()
+    with memusage.Task() as mem:
+        char = worker_glyph(glyphname, ir)
+        ps = glyph_ps(char)
+    note_memory(mem)
+    if potrace_thread is None:
+        potrace_thread = PotraceThread()
+    potrace_thread.submit(glyphname, char, ps, time.time() - start, stats)
+
+# Per-glyph tracing times from the last build in this directory, used
+# to predict which glyphs will take longest. A timing only counts if
+# the glyph is still being traced the same way.
+timings_file = "glyph-timings.json"
+
+def trace_settings(char):
+    return {"trace_res": char.trace_res, "curve_res": char.curve_res,
+            "tracer": trace_backend}
+
+def load_timings():
+    if os.path.exists(timings_file):
+        with open(timings_file) as f:
+            return json.load(f)
+    return {}
+
+def predicted_costs(gids):
+    # Return a dict of the expected tracing time of each glyph, in
+    # seconds if we've timed any of them before. Untimed glyphs get
+    # their trace_cost, scaled by the median ratio of time to
+    # trace_cost over the glyphs that have been timed.
+    timings = load_timings()
+    costs = {}
+    measured = {}
+    ratios = []
+    for gid in gids:
+        char = tuned(gid, getattr(font, gid))
+        costs[gid] = trace_cost(char)
+        t = timings.get(gid)
+        if t is not None and t["settings"] == trace_settings(char):
+            measured[gid] = t["seconds"]
+            ratios.append(t["seconds"] / costs[gid])
+    if ratios:
+        ratio = sorted(ratios)[len(ratios)//2]
+        for gid in costs:
+            costs[gid] = measured.get(gid, costs[gid] * ratio)
+    return costs
+
+# Rough bytes of memory per pixel of a glyph's bitmap needed to trace
+# it, for glyphs we haven't measured. For potrace that's Ghostscript's
+# and potrace's own memory, which the worker can't see, so it's always
+# added to whatever the worker measured of its own use.
+memory_per_pixel = {"builtin": 2.0, "potrace": 0.5}
+
+def predicted_memory(gids):
+    # Return a dict of the expected memory needed to trace each glyph,
+    # in bytes, for BuildScheduler to keep within --max-memory.
+    timings = load_timings()
+    memory = {}
+    for gid in gids:
+        char = tuned(gid, getattr(font, gid))
+        width, height = bitmap_size(char)
+        estimate = int(width * height * memory_per_pixel[trace_backend])
+        t = timings.get(gid)
+        measured = None
+        if t is not None and t["settings"] == trace_settings(char):
+            measured = t.get("memory")
+        if measured is None:
+            memory[gid] = estimate
+        elif trace_backend == "potrace":
+            memory[gid] = estimate + measured
+        else:
+            memory[gid] = measured
+    return memory
+
+def save_timings(elapsed, memory):
+    timings = load_timings()
+    for gid, seconds in elapsed.items():
+        char = tuned(gid, getattr(font, gid))
+        timings[gid] = {"seconds": round(seconds, 4),
+                        "settings": trace_settings(char)}
+        if gid in memory:
+            timings[gid]["memory"] = memory[gid]
+    with open(timings_file, "w") as f:
+        json.dump(timings, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+# How many copies of each external program BuildScheduler may run at
+# once, by program name, from --tool-limit. The default for any
+# program not listed is one per CPU (or --jobs). This only governs the
+# programs it runs itself, FontForge and the --svgfilter: gs and
+# potrace run in the worker processes, one pipeline per worker, so
+# --jobs limits those.
+tool_limits = {}
+worker_tools = ("gs", "potrace")
+
+# From --max-memory: if set, the most memory (in bytes) the glyphs
+# being traced at any one time should need between them, going by
+# predicted_memory. A glyph too big for the budget on its own is
+# traced with nothing else running.
+memory_budget = None
+
+class BuildScheduler:
+    # Runs all the work of a build through one pool of worker processes
+    # for tracing glyphs and one event loop (on a thread of its own)
+    # driving external programs such as FontForge. Each batch of glyphs to trace comes
+    # with a callback, run in the main thread as soon as the whole
+    # batch is done, which can queue further commands with call(). So
+    # the main font's conversions proceed while the braces are still
+    # being traced, rather than each phase waiting for the last.
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.batches = []
+        self.watchers = []
+        self.events = queue.Queue()
+        self.derivations = {}
+        self.commands = None
+        self.tools = None
+        self.running = 0
+
+    def trace(self, gidlist, callback, each=None):
+        # Arrange for callback(outlines) to be called once the outlines
+        # of all the named glyphs are ready, with outlines a dict as
+        # returned by get_ps_paths. If 'each' is given, each(gid,
+        # outline) is called as soon as each one arrives, too. Must be
+        # called before run().
+        self.batches.append((list(gidlist), callback))
+        self.watchers.append(each)
+
+    def derive(self, gid, parents, fn):
+        # Arrange for glyph gid, if it's traced in the same build as
+        # all the named parents, to be made instead by fn(outlines)
+        # once they're all ready, with outlines a dict of the parents'.
+        # fn can return None to have the glyph traced after all. Must
+        # be called before run().
+        self.derivations[gid] = (list(parents), fn)
+
+    def call(self, fn, *args, **kws):
+        # Run the coroutine fn(self.tools, *args, **kws) on the event
+        # loop, where it can run programs through the ToolRunner passed
+        # to it; any exception is raised by run().
+        self.running += 1
+        future = self.commands.submit(fn(self.tools, *args, **kws))
+        future.add_done_callback(lambda f: self.events.put(("called", f)))
+
+    def run(self):
+        with buildprofile.phase("trace"):
+            self.run_batches()
+
+    def run_batches(self):
+        nworkers = self.jobs or multiprocessing.cpu_count()
+        owner = {}
+        for n, (gidlist, callback) in enumerate(self.batches):
+            for gid in gidlist:
+                owner.setdefault(gid, []).append(n)
+        # Within each batch, start the most expensive glyphs first, so
+        # that the batch doesn't end with one big one keeping a single
+        # worker busy while the rest sit idle.
+        costs = predicted_costs(owner)
+        # Affine variants of other glyphs in the build aren't traced,
+        # but made from their parent's outline when that arrives, and
+        # likewise anything arranged by derive().
+        derivations = {}
+        for gid in owner:
+            variant = affine_variant(tuned(gid, getattr(font, gid)))
+            if variant is not None:
+                derivations[gid] = [variant[0]], transformed(gid, *variant)
+        derivations.update(self.derivations)
+        children = {} # glyph name -> names of glyphs derived from it
+        for gid, (parents, fn) in derivations.items():
+            if gid in owner and all(p in owner for p in parents):
+                for p in parents:
+                    children.setdefault(p, []).append(gid)
+        todo = []
+        seen = set(gid for vids in children.values() for gid in vids)
+        for gidlist, callback in self.batches:
+            batch = set(gidlist) - seen
+            seen |= batch
+            todo.extend(sorted(batch, key=lambda gid: (-costs[gid], gid)))
+        todo.reverse()
+        elapsed = {}
+        memory = {}
+        reserved = {} # glyph name -> predicted memory, while in progress
+        need = predicted_memory(owner) if memory_budget is not None else {}
+        def next_glyph():
+            # Take the next glyph from the todo list which fits into what
+            # is left of the memory budget, or None if none does.
+            if memory_budget is None:
+                return todo.pop()
+            room = memory_budget - sum(reserved.values())
+            for i in range(len(todo) - 1, -1, -1):
+                if need[todo[i]] <= room or not reserved:
+                    gid = todo.pop(i)
+                    reserved[gid] = need[gid]
+                    return gid
+            return None
+        pending = [set(gidlist) for gidlist, callback in self.batches]
+        results = [{} for batch in self.batches]
+        # If there's nothing to trace (say, an --incremental build with
+        # every outline cached) we needn't start any workers.
+        bitmaps = workers = returned = None
+        if owner and trace_backend == "builtin":
+            # Each glyph gets a shared buffer the size of its bitmap from
+            # when we start rendering it until it's been traced, including
+            # any time it spends waiting for a worker in between, which
+            # the workers' own measurements can't fully see. So it counts
+            # against the memory budget on top of what they need. We
+            # allow a couple of glyphs per worker, so that rendering can
+            # get ahead of tracing.
+            sizes = {}
+            for gid in owner:
+                width, height = bitmap_size(tuned(gid, getattr(font, gid)))
+                sizes[gid] = width * height
+                if gid in need:
+                    need[gid] += sizes[gid]
+            bitmaps = bitmappool.BitmapPool()
+        elif owner:
+            # Outlines from pipelined_trace_task's PotraceThreads, which
+            # are passed on to self.events as they arrive.
+            returned = multiprocessing.get_context(start_method).Queue()
+            def forward():
+                for event in iter(returned.get, None):
+                    self.events.put(event)
+            threading.Thread(target=forward, name="results", daemon=True).start()
+        if owner:
+            workers = pool(self.jobs, returned)
+        self.commands = toolrunner.LoopThread()
+        self.tools = toolrunner.ToolRunner(tool_limits, nworkers)
+        failed = lambda e: self.events.put(("error", e))
+        traced = lambda r: self.events.put(("traced", r))
+        busy = {} # glyph name -> bitmap buffer name
+        lowered = {} # glyph name -> what render_task was sent, for trace_task
+        done = {} # glyph name -> outline, for deriving others from
+        def finished(gid, outline):
+            done[gid] = outline
+            for n in owner[gid]:
+                if self.watchers[n] is not None:
+                    self.watchers[n](gid, outline)
+                results[n][gid] = outline
+                pending[n].discard(gid)
+                if not pending[n]:
+                    self.batches[n][1](results[n])
+            for vid in children.get(gid, ()):
+                parents, fn = derivations[vid]
+                if not all(p in done for p in parents):
+                    continue
+                start = time.time()
+                derived = fn({p: done[p] for p in parents})
+                buildprofile.merge(vid, {"derive": time.time() - start})
+                if derived is None:
+                    todo.append(vid)
+                else:
+                    finished(vid, derived)
+        try:
+            for n, batch in enumerate(pending):
+                if not batch:
+                    self.batches[n][1]({})
+            while todo or busy or self.running:
+                while todo and bitmaps is None:
+                    gid = next_glyph()
+                    if gid is None:
+                        break
+                    busy[gid] = None
+                    workers.apply_async(pipelined_trace_task, (gid, shipped(gid)),
+                                        error_callback=failed)
+                while todo and bitmaps is not None and len(busy) < 2 * nworkers:
+                    gid = next_glyph()
+                    if gid is None:
+                        break
+                    busy[gid] = bitmaps.allocate(sizes[gid])
+                    lowered[gid] = shipped(gid)
+                    workers.apply_async(render_task, (gid, lowered[gid], busy[gid]),
+                                        callback=lambda r: self.events.put(("rendered", r)),
+                                        error_callback=failed)
+                kind, value = self.events.get()
+                if kind == "error":
+                    raise value
+                elif kind == "called":
+                    self.running -= 1
+                    value.result()
+                elif kind == "rendered":
+                    gid, seconds, stats = value
+                    elapsed[gid] = seconds
+                    buildprofile.merge(gid, stats)
+                    workers.apply_async(trace_task, (gid, lowered.pop(gid), busy[gid]),
+                                        callback=traced, error_callback=failed)
+                else:
+                    gid, outline, seconds, stats = value
+                    elapsed[gid] = elapsed.get(gid, 0) + seconds
+                    buildprofile.merge(gid, stats)
+                    memory[gid] = buildprofile.glyphs[gid]["memory"]
+                    reserved.pop(gid, None)
+                    buffer = busy.pop(gid)
+                    if buffer is not None:
+                        bitmaps.free(buffer)
+                    finished(gid, outline)
+            if workers is not None:
+                workers.close()
+                save_timings(elapsed, memory)
+        finally:
+            if workers is not None:
+                workers.terminate()
+                workers.join()
+            if returned is not None:
+                returned.put(None)
+            self.commands.close()
+            if bitmaps is not None:
+                bitmaps.close()
+
+def get_ps_paths(gidlist, jobs):
+    # Compute the PS path outlines of a collection of glyphs in
+    # parallel, returning a dict mapping each name to (bbox, path).
+    outlines = {}
+    scheduler = BuildScheduler(jobs)
+    scheduler.trace(gidlist, outlines.update)
+    scheduler.run()
+    return outlines
+
+def glyph_fingerprint(gid):
+    # Hash of everything that determines a glyph's traced outline (and
+    # how writesfd scales it), for --incremental builds.
+    char = named_glyph(gid)
+    return gid, buildmanifest.fingerprint(
+        glyphir.lower(tuned(gid, char)).fingerprint(), trace_backend)
+
+def glyph_fingerprints(gidlist, jobs):
+    # Fingerprint a collection of glyphs in parallel, since lowering
+    # 576 braces takes a while. Workers which didn't inherit the
+    # braces from us construct them again by name.
+    with pool(jobs) as workers:
+        return dict(workers.imap_unordered(glyph_fingerprint, gidlist, 8))
+
+def select_glyphs(args, names):
+    # With --only, the glyphs in a mode's list which match one of the
+    # patterns, together with any others in the list they depend on;
+    # otherwise all of them.
+    if not args.only:
+        return set(names)
+    matched = [name for name in names
+               if any(fnmatch.fnmatchcase(name, p) for p in args.only)]
+    selected = closure(matched) & set(names)
+    print("%d glyphs match --only, %d with their dependencies" % (
+        len(matched), len(selected)))
+    return selected
+
+def glyph_entry_inputs(g):
+    # The parts of a lilyglyphlist entry that affect the output,
+    # including the values of any glyph attributes its positions
+    # refer to by name.
+    glyph = getattr(font, g[0])
+    resolve = lambda v: [v, getattr(glyph, v)] if type(v) == str else v
+    entry = list(g[:3]) + [resolve(v) for v in g[3:7]]
+    if len(g) > 7:
+        entry.append({k: resolve(v) for k, v in g[7].items()})
+    return entry
+
+# Per-glyph trace_res and curve_res settings found by the --tune mode,
+# which override the hand-picked defaults from font.py. main() loads
+# them from tuning_file if it exists.
+tuning_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "tuning.json")
+tuning = {}
+
+def load_tuning():
+    if not os.path.exists(tuning_file):
+        return {}
+    with open(tuning_file) as f:
+        return json.load(f)
+
+def tuned(glyphname, char):
+    settings = tuning.get(glyphname)
+    if settings is not None:
+        char.trace_res = settings["trace_res"]
+        char.curve_res = settings["curve_res"]
+    return char
+
+# Glyphs precompiled by --compile, kept alongside Python's own
+# compiled bytecode. The bundle is made from these source files and
+# the --tune settings, and is recompiled when any of them changes.
+bundle_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "__pycache__", "glyphs.bundle")
+bundle_sources = ["font.py", "curves.py", "crosspoint.py", "nibs.py",
+                  "glyphir.py", "glyphbundle.py"]
+
+def bundle_key():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return glyphbundle.key([os.path.join(here, f) for f in bundle_sources],
+                           [tuning])
+
+def lower_task(glyphname):
+    # compile_bundle has already constructed and tuned the glyph.
+    char = getattr(font, glyphname)
+    return glyphname, glyphir.lower(char), dependencies[glyphname]
+
+def compile_bundle(jobs, bundlekey):
+    # Construct every glyph with its --tune settings here first, so
+    # that a glyph which draws another finds that one tuned too, no
+    # matter which worker lowers it. Then lower them all in parallel,
+    # if the workers can inherit the glyphs, and write the bundle.
+    glyphs = {}
+    deps = {}
+    names = dir(font)
+    with buildprofile.phase("compile"):
+        for name in names:
+            tuned(name, getattr(font, name))
+        if by_value():
+            for name, ir, d in map(lower_task, names):
+                glyphs[name], deps[name] = ir, d
+        else:
+            with pool(jobs) as workers:
+                for name, ir, d in workers.imap_unordered(lower_task, names, 4):
+                    glyphs[name], deps[name] = ir, d
+    mkdir(os.path.dirname(bundle_file))
+    glyphbundle.write(bundle_file, bundlekey,
+                      {name: glyphs[name] for name in names}, deps)
+
+def compile_glyphs(args):
+    compile_bundle(args.jobs, bundle_key())
+    print("compiled %d glyphs into %s" % (len(dir(font)), bundle_file))
+
+def load_bundle(jobs, recompile=True):
+    # Load glyphs from the bundle, if --compile has ever made one,
+    # compiling it again first if its sources have changed since (or,
+    # without 'recompile', ignoring it until then).
+    if not os.path.exists(bundle_file):
+        return
+    bundlekey = bundle_key()
+    bundle = glyphbundle.open_bundle(bundle_file, bundlekey)
+    if bundle is None:
+        if not recompile:
+            return
+        sys.stderr.write("glyph sources have changed: recompiling %s\n" %
+                         bundle_file)
+        compile_bundle(jobs, bundlekey)
+        bundle = glyphbundle.open_bundle(bundle_file, bundlekey)
+    use_bundle(bundle)
+
+def trace_cost(char):
+    # Rough relative cost of rendering and tracing a glyph: the number
+    # of pixels in its bitmap times the number of points sampled along
+    # each curve.
+    xsize, ysize = char.canvas_size
+    return xsize * ysize * char.trace_res**2 * char.curve_res
+
+def brace_glyph(i):
+    # The i-th of the 576 sizes of brace in the Lilypond brace font.
+    start = time.perf_counter()
+    char = GlyphContext()
+    scaledbrace(char, 525 * (151./150)**i)
+    construction_time["brace%d" % i] = time.perf_counter() - start
+    return char
+
+def named_glyph(glyphname):
+    # Look up a glyph by its source-code name, constructing braces on
+    # demand since they don't otherwise exist until a brace font build.
+    if not hasattr(font, glyphname) and glyphname.startswith("brace") \
+       and glyphname[5:].isdigit():
+        setattr(font, glyphname, brace_glyph(int(glyphname[5:])))
+    return getattr(font, glyphname)
+
+# With --interpolate-braces, most sizes of brace aren't traced. A
+# brace's outline changes only gradually from one size to the next,
+# so we trace the key sizes chosen by brace_keys(), and one check
+# size in the middle of each run of braces between two keys, and
+# interpolate the rest of the run between its keys (see
+# interpolate.py). The check size is interpolated as well and
+# compared with its trace: if the two are more than --tolerance font
+# units apart, the whole run is traced after all.
+brace_key_step = 16
+brace_segments = 64 # cubics in each quarter of a refitted brace
+brace_fit_step = 4.0 # how finely to follow the traced outline, in outline units
+
+def brace_keys(sizes):
+    # The key sizes among a sorted list of brace sizes: the first and
+    # last, every brace_key_step-th, and a few more at the small end,
+    # where the nib's width grows fastest.
+    return [i for n, i in enumerate(sizes)
+            if n in (0, len(sizes)-1) or i % brace_key_step == 0
+            or i in (1, 2, 4, 8)]
+
+def brace_runs(sizes):
+    # Yield (k0, k1, check, others) for each run of sizes between two
+    # keys which has more in it than just the check size.
+    keys = brace_keys(sizes)
+    for k0, k1 in zip(keys, keys[1:]):
+        run = [i for i in sizes if k0 < i < k1]
+        if len(run) > 1:
+            check = run[len(run)//2]
+            yield k0, k1, check, [i for i in run if i != check]
+
+class BraceInterpolator:
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.refitted = {} # key size -> its outline from compatible()
+        self.verified = {} # (k0, k1) -> whether the check size passed
+
+    def refit(self, i, outlines):
+        if i not in self.refitted:
+            self.refitted[i] = interpolate.compatible(
+                outlines["brace%d" % i][1], brace_segments, brace_fit_step)
+        return self.refitted[i]
+
+    def blend(self, i, k0, k1, outlines):
+        path0, path1 = self.refit(k0, outlines), self.refit(k1, outlines)
+        if path0 is None or path1 is None:
+            return None
+        return finish_path(interpolate.blend(path0, path1, (i-k0) / float(k1-k0)))
+
+    def verify(self, k0, k1, check, outlines):
+        path = self.blend(check, k0, k1, outlines)
+        if path is None:
+            print("brace%d or brace%d isn't a single contour: tracing "
+                  "the braces between them" % (k0, k1))
+            return False
+        k = 3600.0 / (40*getattr(font, "brace%d" % check).scale)
+        tol = self.tolerance / k
+        # Both outlines are smooth, so measuring them more coarsely
+        # than --tune does is still accurate enough, and much quicker.
+        dist = fidelity.hausdorff(outlines["brace%d" % check][1], path, tol / 2)
+        if dist > tol:
+            print("brace%d interpolates to %g font units from its trace: "
+                  "tracing the braces between brace%d and brace%d" % (
+                      check, round(dist * k, 3), k0, k1))
+            return False
+        return True
+
+    def derivation(self, i, k0, k1, check):
+        # The derivation of brace i, for BuildScheduler.
+        def derive(outlines):
+            if (k0, k1) not in self.verified:
+                self.verified[k0, k1] = self.verify(k0, k1, check, outlines)
+            if not self.verified[k0, k1]:
+                return None
+            path = self.blend(i, k0, k1, outlines)
+            return path.bbox(), path
+        return derive
+
+def tune_glyph(glyphname, tolerance):
+    # Trace a glyph at twice its default trace_res and curve_res as a
+    # reference, and then find the cheapest settings (by trace_cost)
+    # whose outline is within 'tolerance' font units of the reference
+    # by Hausdorff distance. Returns the dict of settings to record.
+    # The glyph is the one 'font' hands out, which others (such as
+    # clefGsmall) draw, so its settings are put back afterwards.
+    char = named_glyph(glyphname)
+    res0, cres0 = char.trace_res, char.curve_res
+    try:
+        k = 3600.0 / (40*char.scale) # font units per outline unit
+        tol = tolerance / k
+        def trace_at(res, cres):
+            char.trace_res, char.curve_res = res, cres
+            return get_ps_path(char)[1]
+        ref = trace_at(2*res0, 2*cres0-1)
+        resolutions = sorted(set(max(1, int(round(res0*f)))
+                                 for f in (0.25, 1/3., 0.5, 2/3., 0.75, 1, 1.5, 2)))
+        curve_resolutions = sorted(set([(cres0-1)//4+1, (cres0-1)//2+1, cres0, 2*cres0-1]))
+        candidates = []
+        for res in resolutions:
+            for cres in curve_resolutions:
+                char.trace_res, char.curve_res = res, cres
+                candidates.append((trace_cost(char), res, cres))
+        candidates.sort()
+        # If some settings are too coarse, then anything coarser still in
+        # both respects can be assumed to be as well.
+        failed = []
+        for cost, res, cres in candidates:
+            if any(res <= fres and cres <= fcres for fres, fcres in failed):
+                continue
+            path = trace_at(res, cres)
+            dist = fidelity.hausdorff(ref, path, tol / 4)
+            if dist <= tol:
+                break
+            failed.append((res, cres))
+        else:
+            res, cres, path, dist = 2*res0, 2*cres0-1, ref, 0.0
+        diff, area = fidelity.area_difference(ref, path, tol / 4)
+        return {"trace_res": res, "curve_res": cres, "tracer": trace_backend,
+                "hausdorff": round(dist * k, 3),
+                "area_difference": round(diff / area, 6) if area else float(diff > 0)}
+    finally:
+        char.trace_res, char.curve_res = res0, cres0
+
+def tune_map_function(arg):
+    glyphname, tolerance = arg
+    return glyphname, tune_glyph(glyphname, tolerance)
+
+def tune_glyphs(args):
+    # Run tune_glyph on the glyphs named in the (comma-separated)
+    # argument, or all of them, and merge the results into
+    # tuning_file for subsequent builds to use.
+    if args.argument is not None:
+        names = args.argument.split(",")
+    else:
+        names = sorted(name for name in dir(font)
+                       if isinstance(getattr(font, name), GlyphContext))
+        names = sorted(select_glyphs(args, names))
+    results = load_tuning()
+    workers = pool(args.jobs)
+    for name, settings in workers.imap_unordered(
+            tune_map_function, [(name, args.tolerance) for name in names]):
+        sys.stderr.write("%s: trace_res %d, curve_res %d (%g units)\n" % (
+            name, settings["trace_res"], settings["curve_res"],
+            settings["hausdorff"]))
+        results[name] = settings
+    workers.close()
+    workers.join()
+    with open(tuning_file, "w") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.write("\n")
 
 verstring = "version unavailable"
 
@@ -507,6 +1306,7 @@ lilyglyphlist = [
 #("lyrictieshort", "ties.lyric.short",      0, 'ox','oy', 'ox','oy', {"x0":"ox", "x1":"ox", "y1":"oy"}),
 ]
 
+@buildprofile.timed("writesfd")
 def writesfd(filepfx, fontname, encodingname, encodingsize, outlines, glyphlist):
     fname = filepfx + ".sfd"
     f = open(fname, "w")
@@ -559,12 +1359,8 @@ def writesfd(filepfx, fontname, encodingname, encodingsize, outlines, glyphlist)
         ourname, theirname, encoding, ox, oy = glyph[:5]
         bbox, path = outlines[ourname]
         char = getattr(font, ourname)
-        xrt = lambda x: x * (3600.0 / (40*char.scale)) # potrace's factor of ten, ours of four
-        yrt = lambda y: y * (3600.0 / (40*char.scale))
-        xat = lambda x: xrt(x) - char.origin[0]
-        yat = lambda y: yrt(y) - char.origin[1]
-        xt = lambda x: xat(x) - xat(ox)
-        yt = lambda y: yat(y) - yat(oy)
+        k = 3600.0 / (40*char.scale) # potrace's factor of ten, ours of four
+        xt = lambda x: k * (x - ox)
         if len(glyph) > 9 and "xw" in glyph[9]:
             width = xt(glyph[9]["xw"]) # explicitly specified width
         else:
@@ -576,13 +1372,13 @@ def writesfd(filepfx, fontname, encodingname, encodingsize, outlines, glyphlist)
         f.write("LayerCount: 2\n")
         f.write("Fore\n")
         f.write("SplineSet\n")
-        for c in path:
-            if c[0] == 'm':
-                f.write("%g %g m 1\n" % (xt(c[1]), yt(c[2])))
-            elif c[0] == 'l':
-                f.write(" %g %g l 1\n" % (xt(c[3]), yt(c[4])))
-            elif c[0] == 'c':
-                f.write(" %g %g %g %g %g %g c 0\n" % (xt(c[3]), yt(c[4]), xt(c[5]), yt(c[6]), xt(c[7]), yt(c[8])))
+        for op, c in path.transform([k, 0, 0, k, -k*ox, -k*oy]):
+            if op == MOVETO:
+                f.write("%g %g m 1\n" % (c[0], c[1]))
+            elif op == LINETO:
+                f.write(" %g %g l 1\n" % (c[2], c[3]))
+            elif op == CURVETO:
+                f.write(" %g %g %g %g %g %g c 0\n" % tuple(c[2:]))
             # closepath is not given explicitly
         f.write("EndSplineSet\n")
         f.write("EndChar\n")
@@ -602,30 +1398,57 @@ def test_glyph(args):
     glyph.testdraw()
 
 def test_ps(args, scaled=True):
-    char = getattr(font, args.argument)
+    char = tuned(args.argument, named_glyph(args.argument))
     bbox, path = get_ps_path(char)
     if scaled:
         # Compensate for potrace's factor of ten, and ours of four
-        xrt = lambda x: x * (3600.0 / (40*char.scale))
-        yrt = lambda y: y * (3600.0 / (40*char.scale))
-        xat = lambda x: xrt(x) - char.origin[0]
-        yat = lambda y: yrt(y) - char.origin[1]
-    else:
-        xat = yat = lambda x: x
-    print("%% bbox: %g %g %g %g" % (xat(bbox[0]), yat(bbox[1]), xat(bbox[2]), yat(bbox[3])))
-    for c in path:
-        if c[0] == 'm':
-            print("%g %g moveto" % (xat(c[1]), yat(c[2])))
-        elif c[0] == 'l':
-            print("  %g %g lineto" % (xat(c[3]), yat(c[4])))
-        elif c[0] == 'c':
-            print("  %g %g %g %g %g %g curveto" % (xat(c[3]), yat(c[4]), xat(c[5]), yat(c[6]), xat(c[7]), yat(c[8])))
-        elif c[0] == 'cp':
+        k = 3600.0 / (40*char.scale)
+        path = path.transform([k, 0, 0, k, -char.origin[0], -char.origin[1]])
+    print("%% bbox: %g %g %g %g" % path.bbox())
+    for op, c in path:
+        if op == MOVETO:
+            print("%g %g moveto" % (c[0], c[1]))
+        elif op == LINETO:
+            print("  %g %g lineto" % (c[2], c[3]))
+        elif op == CURVETO:
+            print("  %g %g %g %g %g %g curveto" % tuple(c[2:]))
+        elif op == CLOSEPATH:
             print("closepath")
 
 def test_ps_unscaled(args):
     return test_ps(args, scaled=False)
 
+def writepreview(fname, outlines, names):
+    # A PostScript proof sheet of traced outlines, each scaled to fit
+    # a cell and labelled with its name, for looking over the results
+    # of a partial build.
+    cols, rows, cell = 4, 6, 130
+    f = open(fname, "w")
+    f.write("%!PS-Adobe-3.0\n")
+    f.write("/Helvetica findfont 8 scalefont setfont\n")
+    for i, name in enumerate(names):
+        col, row = i % cols, i // cols % rows
+        if i > 0 and col == 0 and row == 0:
+            f.write("showpage\n")
+        (x0, y0, x1, y1), path = outlines[name]
+        k = (cell - 20.0) / max(x1-x0, y1-y0, 1)
+        x, y = 36 + col * cell, 800 - (row+1) * cell
+        f.write("%g %g moveto (%s) show\n" % (x, y, name))
+        f.write("gsave %g %g translate %g dup scale %g %g translate newpath\n" % (
+            x, y + 12, k, -x0, -y0))
+        for op, c in path:
+            if op == MOVETO:
+                f.write("%g %g moveto\n" % tuple(c))
+            elif op == LINETO:
+                f.write("%g %g lineto\n" % tuple(c[2:]))
+            elif op == CURVETO:
+                f.write("%g %g %g %g %g %g curveto\n" % tuple(c[2:]))
+            elif op == CLOSEPATH:
+                f.write("closepath\n")
+        f.write("fill grestore\n")
+    f.write("showpage\n")
+    f.close()
+
 def mus_output(args):
     # Generate a Postscript prologue suitable for use with 'mus'
     glyphlist = [
@@ -716,6 +1539,15 @@ def mus_output(args):
     "turn",
     ]
     encoding = [(i+33, glyphlist[i]) for i in range(len(glyphlist))]
+    if args.only:
+        # The prologue's own procedures use glyphs which may not be
+        # selected, so a partial build writes a proof sheet instead.
+        selected = select_glyphs(args, glyphlist)
+        if not selected:
+            sys.exit("no glyphs match --only")
+        names = [name for name in glyphlist if name in selected]
+        writepreview("preview.ps", get_ps_paths(names, args.jobs), names)
+        return
     f = open("prologue.ps", "w")
     g = open("abspaths.txt", "w")
     f.write("save /m /rmoveto load def /l /rlineto load def\n")
@@ -748,23 +1580,21 @@ def mus_output(args):
     f.write("/CharacterDefs %d dict def\n" % len(encoding))
     fontbbox = (None,)*4
 
-    pool = multiprocessing.Pool(args.jobs)
-    char_data = dict(pool.imap_unordered(get_ps_path_map_function, encoding))
+    char_data = get_ps_paths([name for code, name in encoding], args.jobs)
 
     for code, name in encoding:
         char = getattr(font, name)
-        xrt = lambda x: x * (3600.0 / (40*char.scale)) # potrace's factor of ten, ours of four
-        yrt = lambda y: y * (3600.0 / (40*char.scale))
-        xat = lambda x: round(xrt(x) - char.origin[0])
-        yat = lambda y: round(yrt(y) - char.origin[1])
+        k = 3600.0 / (40*char.scale) # potrace's factor of ten, ours of four
         bbox, path = char_data[name]
+        path = path.transform([k, 0, 0, k, -char.origin[0], -char.origin[1]])
         f.write("CharacterDefs /.%s {\n" % name)
         g.write("# %s\n" % name)
         output = "newpath"
         currentpoint = (None, None)
-        for c in path:
-            if c[0] == 'm':
-                x1, y1 = xat(c[1]), yat(c[2])
+        for op, c in path:
+            c = [round(v) for v in c]
+            if op == MOVETO:
+                x1, y1 = c
                 x0, y0 = currentpoint
                 if x0 == None:
                     output = output + " %g %g mm" % (x1,y1)
@@ -776,9 +1606,8 @@ def mus_output(args):
                     output = output + " %g %g m" % (x1-x0, y1-y0)
                 g.write("  %g %g moveto\n" % (x1,y1))
                 currentpoint = x1,y1
-            elif c[0] == 'l':
-                x0, y0 = xat(c[1]), yat(c[2])
-                x1, y1 = xat(c[3]), yat(c[4])
+            elif op == LINETO:
+                x0, y0, x1, y1 = c
                 if x0 == x1:
                     output = output + " %g vl" % (y1-y0)
                 elif y0 == y1:
@@ -787,11 +1616,8 @@ def mus_output(args):
                     output = output + " %g %g l" % (x1-x0, y1-y0)
                 g.write("  %g %g lineto\n" % (x1,y1))
                 currentpoint = x1,y1
-            elif c[0] == 'c':
-                x0, y0 = xat(c[1]), yat(c[2])
-                x1, y1 = xat(c[3]), yat(c[4])
-                x2, y2 = xat(c[5]), yat(c[6])
-                x3, y3 = xat(c[7]), yat(c[8])
+            elif op == CURVETO:
+                x0, y0, x1, y1, x2, y2, x3, y3 = c
                 if x0 == x1 and y2 == y3:
                     output = output + " %g %g %g %g vhc" % (y1-y0, x2-x1, y2-y1, x3-x2)
                 elif y0 == y1 and x2 == x3:
@@ -800,13 +1626,13 @@ def mus_output(args):
                     output = output + " %g %g %g %g %g %g c" % (x1-x0, y1-y0, x2-x1, y2-y1, x3-x2, y3-y2)
                 g.write("  %g %g %g %g %g %g curveto\n" % (x1,y1,x2,y2,x3,y3))
                 currentpoint = x3,y3
-            elif c[0] == 'cp':
+            elif op == CLOSEPATH:
                 output = output + " cp"
                 g.write("  closepath\n")
                 currentpoint = None, None
         f.write("  " + output + " f\n")
-        x0, y0 = xat(bbox[0]), yat(bbox[1])
-        x1, y1 = xat(bbox[2]), yat(bbox[3])
+        x0, y0 = round(k*bbox[0] - char.origin[0]), round(k*bbox[1] - char.origin[1])
+        x1, y1 = round(k*bbox[2] - char.origin[0]), round(k*bbox[3] - char.origin[1])
         f.write("} put BBox /.%s [%g %g %g %g] put\n" % ((name, x0, y0, x1, y1)))
         g.write("  # bbox: %g %g %g %g\n" % (x0, y0, x1, y1))
         g.write("  # w,h: %g %g\n" % (x1-x0, y1-y0))
@@ -941,19 +1767,25 @@ def symlink(a, b):
     except FileExistsError:
         pass
 
+def main_font_files(size):
+    # The font files FontForge makes from the main .sfd at each size.
+    return ["lilyfonts/gonville-%d.otf" % size,
+            "lilyfonts/gonville-%d.svg" % size,
+            "lilyfonts/gonville-%d.woff" % size]
+
 def lilypond_output(args, do_main_font=True, do_brace_font=True):
     # Generate .sfd files and supporting metadata which we then
     # process with FontForge into a replacement system font set for
     # GNU LilyPond.
 
-    def postprocess_svg_file(outfile):
+    async def postprocess_svg_file(tools, outfile):
         if args.svgfilter is None:
             return
-        data = subprocess.check_output([args.svgfilter, outfile])
+        data = await tools.run([args.svgfilter, outfile], output=True)
         with open(outfile, "wb") as f:
             f.write(data)
 
-    def run_ff(infile, outfile, tableprefix=None, fontname=None):
+    async def run_ff(tools, infile, *outfiles):
         #ffscript = "Open($1); CorrectDirection(); Scale(2.0);"
         #ffscript = "Open($1); CorrectDirection();"
         #if tableprefix is not None:
@@ -966,14 +1798,20 @@ def lilypond_output(args, do_main_font=True, do_brace_font=True):
         #                    ffscript, infile, outfile]))
         #check_call_devnull(["fontforge", "-lang=ff", "-c",
         #                    ffscript, infile, outfile])
+        # script.ff generates every output file named after the input
+        # one, so a single FontForge session loads and corrects the
+        # .sfd once for all of them.
         print(" ".join(["fontforge", "-lang=ff", "-script",
-                            "script.ff", infile, outfile]))
-        check_call_devnull(["fontforge", "-lang=ff", "-script",
-                            "script.ff", infile, outfile])
+                            "script.ff", infile] + list(outfiles)))
+        with buildprofile.phase("run_ff", infile):
+            await tools.run(["fontforge", "-lang=ff", "-script",
+                             "script.ff", infile] + list(outfiles))
 
-        if outfile.endswith(".svg"):
-            postprocess_svg_file(outfile)
+        for outfile in outfiles:
+            if outfile.endswith(".svg"):
+                await postprocess_svg_file(tools, outfile)
 
+    @buildprofile.timed("writetables")
     def writetables(filepfx, size, subfontname, outlines, glyphlist, bracesonly=0):
         #fname = filepfx + ".LILY"
         #f = open(fname, "w")
@@ -996,12 +1834,9 @@ def lilypond_output(args, do_main_font=True, do_brace_font=True):
             ourname, theirname, encoding, ox, oy, ax, ay = glyph[:7]
             char = getattr(font, ourname)
             bbox, path = outlines[ourname]
-            xrt = lambda x: x * (3600.0 / (40*char.scale)) # potrace's factor of ten, ours of four
-            yrt = lambda y: y * (3600.0 / (40*char.scale))
-            xat = lambda x: xrt(x) - char.origin[0]
-            yat = lambda y: yrt(y) - char.origin[1]
-            xt = lambda x: (xat(x) - xat(ox)) * (size/1000.)
-            yt = lambda y: (yat(y) - yat(oy)) * (size/1000.)
+            k = 3600.0 / (40*char.scale) * (size/1000.) # potrace's factor of ten, ours of four
+            xt = lambda x: k * (x - ox)
+            yt = lambda y: k * (y - oy)
             f.write("(%s .\n" % theirname)
             f.write("((bbox . (%.6f %.6f %.6f %.6f))\n" % (xt(bbox[0]), yt(bbox[1]), xt(bbox[2]), yt(bbox[3])))
             f.write("(subfont . \"%s\")\n" % subfontname)
@@ -1013,6 +1848,55 @@ def lilypond_output(args, do_main_font=True, do_brace_font=True):
         f.write(subfontname)
         f.close()
 
+    # With --incremental, fonts whose inputs are unchanged since the
+    # last build are left alone, and only the glyphs which have changed
+    # are traced again; the rest come from the outline cache.
+    #
+    # With --incremental or --resume, brace outlines, which take most
+    # of a full build, are saved to the same cache as they arrive, so
+    # that after an interruption --resume can pick up where the last
+    # build left off. Otherwise the braces aren't fingerprinted or
+    # cached at all.
+    #
+    # With --only, just the selected glyphs are traced and written to
+    # a partial .sfd alongside the full one, and FontForge isn't run.
+    partial = "-partial" if args.only else ""
+    manifest = cache = None
+    if args.incremental and not args.only:
+        mkdir("lilysrc")
+        manifest = buildmanifest.Manifest("lilysrc/manifest.json")
+        script = buildmanifest.file_contents("script.ff")
+    if args.incremental or args.resume:
+        mkdir("lilysrc")
+        cache = buildmanifest.OutlineCache("lilysrc/outlines")
+
+    async def generate(tools, fp, infile, *outfiles):
+        await run_ff(tools, infile, *outfiles)
+        if manifest is not None:
+            manifest.record(infile, fp)
+
+    def trace_cached(gidlist, fps, callback, reuse):
+        # Like scheduler.trace, but saving each outline in the cache as
+        # it arrives, and (if 'reuse' is set) first taking what outlines
+        # we can from the cache instead of tracing them.
+        cached = {}
+        if reuse:
+            for gid in gidlist:
+                outline = cache.load(gid, fps[gid])
+                if outline is not None:
+                    cached[gid] = outline
+            print("%d of %d glyphs already traced" % (len(cached), len(gidlist)))
+        def checkpoint(gid, outline):
+            cache.save(gid, fps[gid], outline[1])
+        def traced(outlines):
+            outlines.update(cached)
+            callback(outlines)
+        scheduler.trace([gid for gid in gidlist if gid not in cached],
+                        traced, checkpoint)
+
+    scheduler = BuildScheduler(args.jobs)
+    nselected = 0
+
     if do_main_font:
         # Allocate sequential Unicode code points in the private use
         # area for all the glyphs that don't already have a specific
@@ -1024,144 +1908,169 @@ def lilypond_output(args, do_main_font=True, do_brace_font=True):
                 lilyglyphlist[i] = g[:2] + (code,) + g[3:]
                 code = code + 1
 
+        selected = select_glyphs(args, [g[0] for g in lilyglyphlist])
+        lilyglyphlist[:] = [g for g in lilyglyphlist if g[0] in selected]
+        nselected += len(selected)
+
+        sizes = [23]
+        main_gids = sorted(set(g[0] for g in lilyglyphlist))
+        fps = {}
+        stale = {}
+        if manifest is not None:
+            fps = glyph_fingerprints(main_gids, args.jobs)
+            entries = [glyph_entry_inputs(g) for g in lilyglyphlist]
+            for size in sizes:
+                fp = buildmanifest.fingerprint(
+                    size, entries, fps, verstring, script)
+                sfd = "lilysrc/gonville-%d.sfd" % size
+                if not manifest.unchanged(sfd, fp, [sfd] + main_font_files(size)):
+                    stale[size] = fp
+                else:
+                    print("%s is up to date" % sfd)
+            sizes = [size for size in sizes if size in stale]
+
         # Construct the PS outlines via potrace, once for each glyph
-        # we're actually using.
-        pool = multiprocessing.Pool(args.jobs)
-        outlines = dict(pool.imap_unordered(get_ps_path_map_function,
-                                            set(g[0] for g in lilyglyphlist)))
-
-        # PAINFUL HACK! Add invisible droppings above and below the
-        # digits. This is because LP draws time signatures by
-        # mushing the digits up against the centre line of the
-        # stave, in the assumption that they'll be big enough to
-        # overlap the top and bottom lines too. Personally I like
-        # time signatures to _not quite_ collide with the stave
-        # lines (except the 2nd and 4th, of course, which they can't
-        # avoid), and that means I need LP to consider the digits'
-        # bounding boxes to be just a bit wider.
-        #
-        # The pathlets appended here are of zero thickness, so they
-        # shouldn't ever actually show up.
-        #digits = ["big%d" % i for i in range(10)]
-        #ymid = (outlines["big4"][0][1] + outlines["big4"][0][3]) / 2.0
-        #for d in digits:
-        #    char = getattr(font, d)
-        #    d250 = 250.0 * (40*char.scale) / 3600.0
-        #    u250 = 236.0 * (40*char.scale) / 3600.0 # empirically chosen
-        #    one = 1.0 * (40*char.scale) / 3600.0
-        #    yone = 0 # set to one to make the droppings visible for debugging
-        #    bbox, path = outlines[d]
-        #    xmid = (bbox[0] + bbox[2]) / 2.0
-        #    path.append(('m', xmid, ymid-d250+yone))
-        #    path.append(('l', xmid, ymid-d250+yone, xmid-one, ymid-d250))
-        #    path.append(('l', xmid-one, ymid-d250, xmid+one, ymid-d250))
-        #    path.append(('l', xmid+one, ymid-d250, xmid, ymid-d250+yone))
-        #    path.append(('m', xmid, ymid+u250-yone))
-        #    path.append(('l', xmid, ymid+u250-yone, xmid-one, ymid+u250))
-        #    path.append(('l', xmid-one, ymid+u250, xmid+one, ymid+u250))
-        #    path.append(('l', xmid+one, ymid+u250, xmid, ymid+u250-yone))
-        #    bbox = (bbox[0], min(bbox[1], ymid-d250), \
-        #            bbox[2], max(bbox[3], ymid+u250))
-        #    outlines[d] = bbox, path
-
-        # Go through the main glyph list and transform the
-        # origin/attachment/width specifications into coordinates in
-        # the potrace coordinate system.
-        for i in range(len(lilyglyphlist)):
-            g = list(lilyglyphlist[i])
-            gid = g[0]
-            glyph = getattr(font, gid)
-            if len(g) > 7:
-                prop = g[7]
-                for k, v in prop.items():
-                    if k[0] == "x":
-                        v = getattr(glyph, v) * 40
-                    elif k[0] == "y":
-                        v = (glyph.canvas_size[1] - getattr(glyph, v)) * 40
-                    else:
-                        raise "Error!"
-                    prop[k] = v
-            else:
-                prop = {}
-            x0, y0, x1, y1 = outlines[gid][0]
-            # Allow manual overriding of the glyph's logical
-            # bounding box as written into the LILC table (used to
-            # make arpeggio and trill elements line up right, and
-            # also - for some reason - used for dynamics glyph
-            # kerning in place of the perfectly good system in the
-            # font format proper). If this happens, the attachment
-            # points are given in terms of the overridden bounding
-            # box.
-            x0 = prop.get("x0", x0)
-            x1 = prop.get("x1", x1)
-            y0 = prop.get("y0", y0)
-            y1 = prop.get("y1", y1)
-            outlines[gid] = ((x0,y0,x1,y1),outlines[gid][1])
-            xo = g[3]
-            if type(xo) == str:
-                xo = getattr(glyph, xo) * 40
-            else:
-                xo = x0 + (x1-x0) * xo
-            g[3] = xo
-            yo = g[4]
-            if type(yo) == str:
-                yo = (glyph.canvas_size[1] - getattr(glyph, yo)) * 40
-            else:
-                yo = y0 + (y1-y0) * yo
-            g[4] = yo
-            xa = g[5]
-            if type(xa) == str:
-                xa = getattr(glyph, xa) * 40
-            else:
-                xa = x0 + (x1-x0) * xa
-            g[5] = xa
-            ya = g[6]
-            if type(ya) == str:
-                ya = (glyph.canvas_size[1] - getattr(glyph, ya)) * 40
+        # we're actually using, and build the font once they're all
+        # ready.
+        def finish_main_font(outlines):
+            # PAINFUL HACK! Add invisible droppings above and below the
+            # digits. This is because LP draws time signatures by
+            # mushing the digits up against the centre line of the
+            # stave, in the assumption that they'll be big enough to
+            # overlap the top and bottom lines too. Personally I like
+            # time signatures to _not quite_ collide with the stave
+            # lines (except the 2nd and 4th, of course, which they can't
+            # avoid), and that means I need LP to consider the digits'
+            # bounding boxes to be just a bit wider.
+            #
+            # The pathlets appended here are of zero thickness, so they
+            # shouldn't ever actually show up.
+            #digits = ["big%d" % i for i in range(10)]
+            #ymid = (outlines["big4"][0][1] + outlines["big4"][0][3]) / 2.0
+            #for d in digits:
+            #    char = getattr(font, d)
+            #    d250 = 250.0 * (40*char.scale) / 3600.0
+            #    u250 = 236.0 * (40*char.scale) / 3600.0 # empirically chosen
+            #    one = 1.0 * (40*char.scale) / 3600.0
+            #    yone = 0 # set to one to make the droppings visible for debugging
+            #    bbox, path = outlines[d]
+            #    xmid = (bbox[0] + bbox[2]) / 2.0
+            #    path.moveto(xmid, ymid-d250+yone)
+            #    path.lineto(xmid, ymid-d250+yone, xmid-one, ymid-d250)
+            #    path.lineto(xmid-one, ymid-d250, xmid+one, ymid-d250)
+            #    path.lineto(xmid+one, ymid-d250, xmid, ymid-d250+yone)
+            #    path.moveto(xmid, ymid+u250-yone)
+            #    path.lineto(xmid, ymid+u250-yone, xmid-one, ymid+u250)
+            #    path.lineto(xmid-one, ymid+u250, xmid+one, ymid+u250)
+            #    path.lineto(xmid+one, ymid+u250, xmid, ymid+u250-yone)
+            #    bbox = (bbox[0], min(bbox[1], ymid-d250), \
+            #            bbox[2], max(bbox[3], ymid+u250))
+            #    outlines[d] = bbox, path
+
+            # Go through the main glyph list and transform the
+            # origin/attachment/width specifications into coordinates in
+            # the potrace coordinate system.
+            for i in range(len(lilyglyphlist)):
+                g = list(lilyglyphlist[i])
+                gid = g[0]
+                glyph = getattr(font, gid)
+                if len(g) > 7:
+                    prop = g[7]
+                    for k, v in prop.items():
+                        if k[0] == "x":
+                            v = getattr(glyph, v) * 40
+                        elif k[0] == "y":
+                            v = (glyph.canvas_size[1] - getattr(glyph, v)) * 40
+                        else:
+                            raise "Error!"
+                        prop[k] = v
+                else:
+                    prop = {}
+                x0, y0, x1, y1 = outlines[gid][0]
+                # Allow manual overriding of the glyph's logical
+                # bounding box as written into the LILC table (used to
+                # make arpeggio and trill elements line up right, and
+                # also - for some reason - used for dynamics glyph
+                # kerning in place of the perfectly good system in the
+                # font format proper). If this happens, the attachment
+                # points are given in terms of the overridden bounding
+                # box.
+                x0 = prop.get("x0", x0)
+                x1 = prop.get("x1", x1)
+                y0 = prop.get("y0", y0)
+                y1 = prop.get("y1", y1)
+                outlines[gid] = ((x0,y0,x1,y1),outlines[gid][1])
+                xo = g[3]
+                if type(xo) == str:
+                    xo = getattr(glyph, xo) * 40
+                else:
+                    xo = x0 + (x1-x0) * xo
+                g[3] = xo
+                yo = g[4]
+                if type(yo) == str:
+                    yo = (glyph.canvas_size[1] - getattr(glyph, yo)) * 40
+                else:
+                    yo = y0 + (y1-y0) * yo
+                g[4] = yo
+                xa = g[5]
+                if type(xa) == str:
+                    xa = getattr(glyph, xa) * 40
+                else:
+                    xa = x0 + (x1-x0) * xa
+                g[5] = xa
+                ya = g[6]
+                if type(ya) == str:
+                    ya = (glyph.canvas_size[1] - getattr(glyph, ya)) * 40
+                else:
+                    ya = y0 + (y1-y0) * ya
+                g[6] = ya
+                lilyglyphlist[i] = tuple(g)
+
+            mkdir("lilysrc")
+            mkdir("lilyfonts")
+            mkdir("lilyfonts-old")
+            mkdir("lilyfonts-old/otf")
+            mkdir("lilyfonts-old/svg")
+
+            # Copy gonville.ily into the new-style output directory.
+            #here = os.path.dirname(os.path.abspath(__file__))
+            #shutil.copyfile(os.path.join(here, "gonville.ily"),
+            #                "lilyfonts/gonville.ily")
+
+            #for size in [11, 13, 14, 16, 18, 20, 23, 26]:
+            #    prefix = "lilysrc/gonville-%d" % size
+            #    sfd = prefix + ".sfd"
+            #
+            #    writesfd(prefix, "Gonville-%d" % size, "UnicodeBmp", 65537, outlines, lilyglyphlist)
+            #    writetables(prefix, size, "gonville%d" % size, outlines, lilyglyphlist)
+            #
+            #    run_ff(sfd, "lilyfonts/gonville-%d.otf" % size, tableprefix=prefix)
+            #    run_ff(sfd, "lilyfonts/gonville-%d.svg" % size)
+            #    run_ff(sfd, "lilyfonts/gonville-%d.woff" % size)
+            #
+            #    run_ff(sfd, "lilyfonts-old/otf/emmentaler-%d.otf" % size, fontname="Emmentaler-%d" % size, tableprefix=prefix)
+            #    run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.svg" % size, fontname="Emmentaler-%d" % size)
+            #    run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.woff" % size, fontname="Emmentaler-%d" % size)
+            for size in sizes:
+                prefix = "lilysrc/gonville-%d%s" % (size, partial)
+                sfd = prefix + ".sfd"
+
+                writesfd(prefix, "Gonville-%d" % size, "UnicodeBmp", 65537, outlines, lilyglyphlist)
+                #writetables(prefix, size, "gonville%d" % size, outlines, lilyglyphlist)
+
+                if not args.only:
+                    scheduler.call(generate, stale.get(size), sfd,
+                                   *main_font_files(size))
+
+                #run_ff(sfd, "lilyfonts-old/otf/emmentaler-%d.otf" % size, fontname="Emmentaler-%d" % size, tableprefix=prefix)
+                #run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.svg" % size, fontname="Emmentaler-%d" % size)
+                #run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.woff" % size, fontname="Emmentaler-%d" % size)
+
+        if sizes and main_gids:
+            if manifest is not None:
+                trace_cached(main_gids, fps, finish_main_font, True)
             else:
-                ya = y0 + (y1-y0) * ya
-            g[6] = ya
-            lilyglyphlist[i] = tuple(g)
-
-        mkdir("lilysrc")
-        mkdir("lilyfonts")
-        mkdir("lilyfonts-old")
-        mkdir("lilyfonts-old/otf")
-        mkdir("lilyfonts-old/svg")
-
-        # Copy gonville.ily into the new-style output directory.
-        #here = os.path.dirname(os.path.abspath(__file__))
-        #shutil.copyfile(os.path.join(here, "gonville.ily"),
-        #                "lilyfonts/gonville.ily")
-
-        #for size in [11, 13, 14, 16, 18, 20, 23, 26]:
-        #    prefix = "lilysrc/gonville-%d" % size
-        #    sfd = prefix + ".sfd"
-        #
-        #    writesfd(prefix, "Gonville-%d" % size, "UnicodeBmp", 65537, outlines, lilyglyphlist)
-        #    writetables(prefix, size, "gonville%d" % size, outlines, lilyglyphlist)
-        #
-        #    run_ff(sfd, "lilyfonts/gonville-%d.otf" % size, tableprefix=prefix)
-        #    run_ff(sfd, "lilyfonts/gonville-%d.svg" % size)
-        #    run_ff(sfd, "lilyfonts/gonville-%d.woff" % size)
-        #
-        #    run_ff(sfd, "lilyfonts-old/otf/emmentaler-%d.otf" % size, fontname="Emmentaler-%d" % size, tableprefix=prefix)
-        #    run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.svg" % size, fontname="Emmentaler-%d" % size)
-        #    run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.woff" % size, fontname="Emmentaler-%d" % size)
-        for size in [23]:
-            prefix = "lilysrc/gonville-%d" % size
-            sfd = prefix + ".sfd"
-
-            writesfd(prefix, "Gonville-%d" % size, "UnicodeBmp", 65537, outlines, lilyglyphlist)
-            #writetables(prefix, size, "gonville%d" % size, outlines, lilyglyphlist)
-
-            run_ff(sfd, "lilyfonts/gonville-%d.otf" % size, tableprefix=prefix)
-            run_ff(sfd, "lilyfonts/gonville-%d.svg" % size)
-            run_ff(sfd, "lilyfonts/gonville-%d.woff" % size)
-
-            #run_ff(sfd, "lilyfonts-old/otf/emmentaler-%d.otf" % size, fontname="Emmentaler-%d" % size, tableprefix=prefix)
-            #run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.svg" % size, fontname="Emmentaler-%d" % size)
-            #run_ff(sfd, "lilyfonts-old/svg/emmentaler-%d.woff" % size, fontname="Emmentaler-%d" % size)
+                scheduler.trace(main_gids, finish_main_font)
 
     # Now do most of that all over again for the specialist brace
     # font, if we're doing that. (The "-lilymain" option doesn't
@@ -1170,42 +2079,84 @@ def lilypond_output(args, do_main_font=True, do_brace_font=True):
     # the PS outlines via potrace, once for each glyph we're
     # actually using.
     if do_brace_font:
-        outlines = {}
         bracelist = []
         gidlist = []
         bracerange = range(0, 576, 25) if args.fastbrace else range(576)
-        for i in bracerange:
-            char = GlyphContext()
-            scaledbrace(char, 525 * (151./150)**i)
-            gid = "brace%d" % i
-            gidlist.append(gid)
-            setattr(font, gid, char)
-
-        pool = multiprocessing.Pool(args.jobs)
-        outlines = dict(pool.imap_unordered(get_ps_path_map_function, gidlist))
-
-        for i, gid in enumerate(gidlist):
-            x0, y0, x1, y1 = outlines[gid][0]
-            yh = (y0+y1)/2.0
-            bracelist.append((gid, gid, 0xe100+i, x1, yh, x1, yh))
-
-        prefix = "lilysrc/gonville-brace"
-        sfd = prefix + ".sfd"
-
-        writesfd(prefix, "Gonville-Brace", "UnicodeBmp", 65537, outlines, bracelist)
-        writetables(prefix, 20, "gonvillebrace", outlines, bracelist, 1)
-
-        run_ff(sfd, "lilyfonts/gonville-brace.otf", tableprefix=prefix)
-        run_ff(sfd, "lilyfonts/gonville-brace.svg")
-        run_ff(sfd, "lilyfonts/gonville-brace.woff")
+        codes = {"brace%d" % i: 0xe100+n for n, i in enumerate(bracerange)}
+        selected = select_glyphs(args, codes)
+        nselected += len(selected)
+        with buildprofile.phase("construct", "braces"):
+            for i in bracerange:
+                gid = "brace%d" % i
+                if gid in selected:
+                    gidlist.append(gid)
+                    setattr(font, gid, brace_glyph(i))
+
+        brace_files = ["lilyfonts/gonville-brace.otf",
+                       "lilyfonts/gonville-brace.svg",
+                       "lilyfonts/gonville-brace.woff",
+                       "lilyfonts-old/otf/emmentaler-brace.otf",
+                       "lilyfonts-old/svg/emmentaler-brace.svg",
+                       "lilyfonts-old/svg/emmentaler-brace.woff"]
+        brace_fps = {}
+        if cache is not None:
+            brace_fps = glyph_fingerprints(gidlist, args.jobs)
+        runs = []
+        if args.interpolate_braces:
+            runs = list(brace_runs([int(gid[5:]) for gid in gidlist]))
+        # So that no later build takes an interpolated brace for a
+        # traced one, it's saved under a fingerprint of its own.
+        for k0, k1, check, others in (runs if brace_fps else ()):
+            parents = ["brace%d" % k for k in (k0, k1, check)]
+            for i in others:
+                gid = "brace%d" % i
+                brace_fps[gid] = buildmanifest.fingerprint(
+                    brace_fps[gid], [brace_fps[p] for p in parents], args.tolerance)
+        brace_fp = None
+        stale_braces = True
+        if manifest is not None:
+            brace_fp = buildmanifest.fingerprint(
+                [brace_fps[gid] for gid in gidlist], verstring, script)
+            sfd = "lilysrc/gonville-brace.sfd"
+            if manifest.unchanged(sfd, brace_fp, [sfd] + brace_files):
+                print("%s is up to date" % sfd)
+                stale_braces = False
+
+        def finish_brace_font(outlines):
+            for gid in gidlist:
+                x0, y0, x1, y1 = outlines[gid][0]
+                yh = (y0+y1)/2.0
+                bracelist.append((gid, gid, codes[gid], x1, yh, x1, yh))
+
+            prefix = "lilysrc/gonville-brace" + partial
+            sfd = prefix + ".sfd"
 
-        run_ff(sfd, "lilyfonts-old/otf/emmentaler-brace.otf", fontname="Emmentaler-Brace", tableprefix=prefix)
-        run_ff(sfd, "lilyfonts-old/svg/emmentaler-brace.svg", fontname="Emmentaler-Brace")
-        run_ff(sfd, "lilyfonts-old/svg/emmentaler-brace.woff", fontname="Emmentaler-Brace")
+            writesfd(prefix, "Gonville-Brace", "UnicodeBmp", 65537, outlines, bracelist)
+            if args.only:
+                return
+            writetables(prefix, 20, "gonvillebrace", outlines, bracelist, 1)
+
+            scheduler.call(generate, brace_fp, sfd, *brace_files)
+
+            symlink("emmentaler-brace.otf", "lilyfonts-old/otf/aybabtu.otf")
+            symlink("emmentaler-brace.svg", "lilyfonts-old/svg/aybabtu.svg")
+            symlink("emmentaler-brace.svg", "lilyfonts-old/svg/aybabtu.woff")
+
+        if stale_braces and gidlist:
+            interpolator = BraceInterpolator(args.tolerance)
+            for k0, k1, check, others in runs:
+                parents = ["brace%d" % k for k in (k0, k1, check)]
+                for i in others:
+                    scheduler.derive("brace%d" % i, parents,
+                                     interpolator.derivation(i, k0, k1, check))
+            if cache is not None:
+                trace_cached(gidlist, brace_fps, finish_brace_font, True)
+            else:
+                scheduler.trace(gidlist, finish_brace_font)
 
-        symlink("emmentaler-brace.otf", "lilyfonts-old/otf/aybabtu.otf")
-        symlink("emmentaler-brace.svg", "lilyfonts-old/svg/aybabtu.svg")
-        symlink("emmentaler-brace.svg", "lilyfonts-old/svg/aybabtu.woff")
+    if not nselected:
+        sys.exit("no glyphs match --only")
+    scheduler.run()
 
 def lilypond_output_main(args):
     return lilypond_output(args, do_brace_font=False)
@@ -1414,10 +2365,13 @@ def simple_output(args):
     for i in range(0x7f, 0xa1):
         codes[i] = None # avoid these code points
 
-    pool = multiprocessing.Pool(args.jobs)
     gidlist = [t[0] if type(t) == tuple else t
                for t in glyphlist]
-    outlines = dict(pool.imap_unordered(get_ps_path_map_function, gidlist))
+    selected = select_glyphs(args, gidlist)
+    if not selected:
+        sys.exit("no glyphs match --only")
+    outlines = get_ps_paths([gid for gid in gidlist if gid in selected],
+                            args.jobs)
 
     for i in range(len(glyphlist)):
         gid = glyphlist[i]
@@ -1431,6 +2385,8 @@ def simple_output(args):
             assert code < 0x100
             thiscode = code
         codes[thiscode] = gid
+        if gid not in selected:
+            continue
 
         char = getattr(font, gid)
 
@@ -1457,6 +2413,14 @@ def simple_output(args):
 
         glyphlist[i] = (gid, gid, thiscode, xo, yo, None, None, None, None, props)
 
+    if args.only:
+        # Every glyph is still given its code point above, so that the
+        # selected ones keep the codes they have in the full font.
+        glyphlist = [glyphlist[i] for i in range(len(glyphlist))
+                     if gidlist[i] in selected]
+        writesfd("gonville-simple-partial", "Gonville-Simple", "UnicodeBmp",
+                 65537, outlines, glyphlist)
+        return
     writesfd("gonville-simple", "Gonville-Simple", "UnicodeBmp", 65537, outlines, glyphlist)
     check_call_devnull(["fontforge", "-lang=ff", "-c",
                         "Open($1); CorrectDirection(); Generate($2)",
@@ -1532,6 +2496,32 @@ def lilypond_list_our_glyphs(args):
     for name in names:
         print(name)
 
+def report_memory():
+    # Print the peak Python allocation in the parent during each phase
+    # of the build, and the glyphs which needed the most memory in the
+    # workers.
+    print("Peak memory allocated by phase:")
+    overall = memusage.traced_peak()
+    for p in buildprofile.phases:
+        if "peak_bytes" in p:
+            print("  %-12s %-28s %12s" % (p["phase"], p["detail"] or "",
+                                         memusage.format_size(p["peak_bytes"])))
+            overall = max(overall, p["peak_bytes"])
+    print("  %-41s %12s" % ("overall", memusage.format_size(overall)))
+    used = [(stats["memory"], gid) for gid, stats in buildprofile.glyphs.items()
+            if "memory" in stats]
+    if used:
+        print("Most memory needed by a glyph in the workers "
+              "(peak RSS of worker):")
+        for n, gid in sorted(used, reverse=True)[:10]:
+            print("  %-41s %12s (%s)" % (gid, memusage.format_size(n),
+                  memusage.format_size(buildprofile.glyphs[gid]["peak_rss"])))
+
+# The modes which build enough glyphs to be worth loading them from
+# the bundle.
+bulk_actions = (lilypond_output, lilypond_output_main, lilypond_output_brace,
+                mus_output, simple_output)
+
 def main():
     parser = argparse.ArgumentParser(description='')
     parser.add_argument(
@@ -1580,18 +2570,125 @@ def main():
     group.add_argument(
         "--simple", action="store_const", dest="action", const=simple_output,
         help="Generate a simple font file you could use in running text.")
+    group.add_argument(
+        "--compile", action="store_const", dest="action",
+        const=compile_glyphs,
+        help="Construct every glyph and save them in a bundle which later "
+        "runs load instead, until font.py or the settings from --tune "
+        "change.")
+    group.add_argument(
+        "--tune", action="store_const", dest="action", const=tune_glyphs,
+        help="Find the cheapest trace_res and curve_res for each glyph "
+        "(or a comma-separated list of them) which trace to within "
+        "--tolerance of a high-resolution reference, and record them "
+        "for later builds to use.")
     parser.add_argument("argument", nargs="?",
                         help="glyph to use in test modes")
+    parser.add_argument("--only", action="append", metavar="PATTERN",
+                        help="Only build the glyphs whose names match "
+                        "PATTERN (e.g. 'flat*'), and those they depend on, "
+                        "writing a partial .sfd (or, with --mus, a proof "
+                        "sheet preview.ps). May be repeated.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="In the Lilypond modes, only rebuild the fonts "
+                        "whose glyphs, glyph list entries, version string "
+                        "or script.ff have changed since the last build, "
+                        "and only retrace the glyphs that have changed.")
+    parser.add_argument("--resume", action="store_true",
+                        help="In the Lilypond modes, reuse the brace outlines "
+                        "saved by an earlier, interrupted build with "
+                        "--resume or --incremental rather than tracing them "
+                        "again, and save the rest as they're traced.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write a JSON record of the time spent on each "
+                        "stage of each glyph, and on each phase of the "
+                        "build, to FILE.")
+    parser.add_argument("--timeline", metavar="FILE",
+                        help="Write a Chrome trace-event timeline of the "
+                        "build to FILE, for viewing in Perfetto.")
+    parser.add_argument("--memory", action="store_true",
+                        help="Report the peak memory used by each phase of "
+                        "the build, and by the hungriest glyphs.")
+    parser.add_argument("--max-memory", metavar="SIZE",
+                        help="Limit how many glyphs are traced at once so "
+                        "that between them they need no more than about "
+                        "SIZE (e.g. 2G) of memory.")
     parser.add_argument("--fastbrace", action="store_true",
                         help="Only build a small fraction of the brace sizes, "
                         "to speed up dev builds.")
+    parser.add_argument("--interpolate-braces", action="store_true",
+                        help="In the Lilypond modes, trace only a few dozen "
+                        "sizes of brace and interpolate the rest between "
+                        "them, checking one in each run against its trace.")
+    parser.add_argument("--tracer", choices=["potrace", "builtin"],
+                        default="potrace", dest="trace_backend",
+                        help="How to turn glyph drawings into outlines: "
+                        "Ghostscript and potrace (the default), or the "
+                        "slower pure-Python renderer and tracer which "
+                        "need neither.")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="Maximum distance in font units by which "
+                        "--tune may let a glyph's outline move, or "
+                        "--interpolate-braces an interpolated brace's.")
+    parser.add_argument("--untuned", action="store_true",
+                        help="Ignore the settings recorded by --tune "
+                        "(and so the bundle made by --compile too).")
+    parser.add_argument("--no-bundle", action="store_true",
+                        help="Construct every glyph from font.py even if "
+                        "--compile has made a bundle.")
+    parser.add_argument("--start-method", choices=["fork", "spawn", "forkserver"],
+                        help="How to start worker processes (default: the "
+                        "platform's). Except with fork, each glyph is sent "
+                        "to the workers by value.")
+    parser.add_argument("--tool-limit", action="append", default=[],
+                        metavar="PROGRAM=N",
+                        help="Run at most N copies of fontforge, or of "
+                        "the --svgfilter program, at once. May be "
+                        "repeated. (gs and potrace run one pipeline per "
+                        "worker, so --jobs limits those.)")
     parser.set_defaults(verstring="version unavailable")
     args = parser.parse_args()
 
-    global verstring
+    global verstring, trace_backend, tuning, tool_limits, memory_budget
+    global start_method
     verstring = args.verstring
-
+    trace_backend = args.trace_backend
+    start_method = args.start_method
+    for limit in args.tool_limit:
+        program, _, n = limit.partition("=")
+        if not n.isdigit() or int(n) < 1:
+            parser.error("--tool-limit expects PROGRAM=N, not '%s'" % limit)
+        if program in worker_tools:
+            parser.error("--tool-limit can't limit %s: each worker runs one "
+                         "at a time, so use --jobs" % program)
+        tool_limits[program] = int(n)
+    if args.max_memory is not None:
+        try:
+            memory_budget = memusage.parse_size(args.max_memory)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.memory:
+        memusage.start_tracing()
+    if not args.untuned and args.action != tune_glyphs:
+        tuning = load_tuning()
+    if args.action in bulk_actions and not (args.no_bundle or args.untuned):
+        # The bundle's glyphs have the --tune settings built in. A
+        # build of just a few glyphs uses it if it's current, but isn't
+        # worth compiling it again for.
+        load_bundle(args.jobs, recompile=not args.only)
+
+    start = time.perf_counter()
     args.action(args)
+    if args.profile is not None:
+        for gid, stats in buildprofile.glyphs.items():
+            if gid in construction_time:
+                stats["construction"] = construction_time[gid]
+        buildprofile.save(args.profile, {
+            "argv": sys.argv[1:], "seconds": time.perf_counter() - start})
+    if args.timeline is not None:
+        buildprofile.save_timeline(args.timeline)
+    if args.memory:
+        report_memory()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,148 @@
+# Interpolating between the outlines of one shape traced at two
+# different sizes, for the brace font (see glyphs.py).
+#
+# Two traced outlines never have the same segments as each other, so
+# they can't be blended as they stand. compatible() refits a traced
+# outline to a fixed layout of cubic segments. It divides the outline
+# at four landmarks, which for a brace are the top and bottom tips and
+# the leftmost point of each side between them, and each of the four
+# pieces into the same number of segments at the same fractions of its
+# length. Those fractions bunch up towards the landmarks, where the
+# outline turns most sharply. Each segment's inner control points are
+# then fitted to the outline by least squares, keeping the tangent
+# continuous where two segments meet (except at the landmarks, which
+# may be corners). Any two outlines refitted this way correspond point
+# for point, so blend() can interpolate their coordinates.
+
+import math
+from array import array
+from outline import Outline
+from fidelity import flatten
+
+def landmarks(pts):
+    # Indices into a closed polygon, which starts at its topmost point
+    # and has that point repeated at the end, of the landmarks: the
+    # start, the leftmost point of the first side, the bottommost
+    # point, the leftmost point of the second side, and the end.
+    n = len(pts) - 1
+    bottom = min(range(n), key=lambda j: (pts[j][1], j))
+    left1 = min(range(0, bottom+1), key=lambda j: (pts[j][0], j))
+    left2 = min(range(bottom, n+1), key=lambda j: (pts[j][0], j))
+    return [0, left1, bottom, left2, n]
+
+class Polyline:
+    # A polygon measured by arc length.
+    def __init__(self, pts):
+        self.pts = pts
+        self.lengths = [0.0]
+        for (x0, y0), (x1, y1) in zip(pts, pts[1:]):
+            self.lengths.append(self.lengths[-1] + math.hypot(x1-x0, y1-y0))
+
+    def index(self, s):
+        # The index of the vertex at or just before arc length s.
+        lengths = self.lengths
+        lo, hi = 0, len(lengths) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if lengths[mid] <= s:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def point(self, s):
+        s = min(max(s, 0.0), self.lengths[-1])
+        j = self.index(s)
+        if j == len(self.pts) - 1:
+            return self.pts[j]
+        (x0, y0), (x1, y1) = self.pts[j], self.pts[j+1]
+        d = self.lengths[j+1] - self.lengths[j]
+        f = (s - self.lengths[j]) / d if d else 0.0
+        return x0 + (x1-x0)*f, y0 + (y1-y0)*f
+
+    def direction(self, s0, s1):
+        (x0, y0), (x1, y1) = self.point(s0), self.point(s1)
+        d = math.hypot(x1-x0, y1-y0)
+        return ((x1-x0)/d, (y1-y0)/d) if d else (0.0, 0.0)
+
+def fractions(segments):
+    # Where the segments of each piece end, as fractions of its length:
+    # spaced evenly in angle round a semicircle, so that they're closer
+    # together at both ends.
+    return [(1 - math.cos(math.pi * k / segments)) / 2
+            for k in range(segments + 1)]
+
+def fit(line, s0, s1, t0, t1):
+    # The control points of a cubic from arc length s0 to s1 along a
+    # Polyline, leaving in direction t0 and arriving from direction
+    # t1, which best fits the vertices between (Schneider's method,
+    # with the vertices parameterised by arc length).
+    x0, y0 = line.point(s0)
+    x3, y3 = line.point(s1)
+    chord = math.hypot(x3-x0, y3-y0)
+    c00 = c01 = c11 = r0 = r1 = 0.0
+    for j in range(line.index(s0) + 1, line.index(s1) + 1):
+        u = (line.lengths[j] - s0) / (s1 - s0)
+        if not 0 < u < 1:
+            continue
+        mu = 1 - u
+        b0, b1, b2, b3 = mu*mu*mu, 3*mu*mu*u, 3*mu*u*u, u*u*u
+        a0x, a0y = t0[0]*b1, t0[1]*b1
+        a1x, a1y = -t1[0]*b2, -t1[1]*b2
+        x, y = line.pts[j]
+        ex = x - (x0*(b0+b1) + x3*(b2+b3))
+        ey = y - (y0*(b0+b1) + y3*(b2+b3))
+        c00 += a0x*a0x + a0y*a0y
+        c01 += a0x*a1x + a0y*a1y
+        c11 += a1x*a1x + a1y*a1y
+        r0 += ex*a0x + ey*a0y
+        r1 += ex*a1x + ey*a1y
+    # Solve for how far along each tangent the control points go,
+    # falling back to a third of the chord if the fit is degenerate.
+    det = c00*c11 - c01*c01
+    alpha0 = alpha1 = chord / 3
+    if det > 1e-12 * c00 * c11:
+        a0 = (r0*c11 - r1*c01) / det
+        a1 = (c00*r1 - c01*r0) / det
+        if a0 > 1e-3*chord and a1 > 1e-3*chord:
+            alpha0, alpha1 = a0, a1
+    return (x0, y0, x0 + t0[0]*alpha0, y0 + t0[1]*alpha0,
+            x3 - t1[0]*alpha1, y3 - t1[1]*alpha1, x3, y3)
+
+def compatible(path, segments, step):
+    # Refit an outline to 4*segments cubics as described above, first
+    # flattening it to vertices about 'step' apart. Returns None if
+    # the outline isn't a single contour.
+    polys = flatten(path, step)
+    if len(polys) != 1:
+        return None
+    pts = polys[0]
+    if pts[-1] == pts[0]:
+        pts = pts[:-1]
+    top = max(range(len(pts)), key=lambda j: (pts[j][1], -j))
+    pts = pts[top:] + pts[:top+1]
+    line = Polyline(pts)
+    marks = [line.lengths[j] for j in landmarks(pts)]
+    out = Outline()
+    for m0, m1 in zip(marks, marks[1:]):
+        ends = [m0 + (m1-m0)*f for f in fractions(segments)]
+        for k in range(segments):
+            s0, s1 = ends[k], ends[k+1]
+            # The tangent at each end is the direction of the outline
+            # over a short stretch across it, or just on the inside at
+            # a landmark.
+            h = (s1 - s0) / 8
+            t0 = line.direction(s0 if k == 0 else s0 - h, s0 + h)
+            t1 = line.direction(s1 - h, s1 if k == segments-1 else s1 + h)
+            c = fit(line, s0, s1, t0, t1)
+            if not len(out):
+                out.moveto(c[0], c[1])
+            out.curveto(*c)
+    out.closepath()
+    return out
+
+def blend(path0, path1, w):
+    # Interpolate between two outlines from compatible() with the same
+    # number of segments, w of the way from path0 to path1.
+    coords = array("d", [a + (b-a)*w for a, b in zip(path0.coords, path1.coords)])
+    return Outline(array("B", path0.ops), coords)
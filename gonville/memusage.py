@@ -0,0 +1,85 @@
+# Memory accounting for the build.
+#
+# Worker processes measure their own resident set size around each
+# task: on Linux the kernel's high-water mark for a process can be
+# reset, so peak() after reset_peak() gives the most memory the task
+# itself had resident at once. Elsewhere we fall back to getrusage's
+# lifetime peak, which only ever goes up.
+#
+# In the parent, tracemalloc (if --memory started it) gives the peak
+# Python allocation during each phase of the build; buildprofile
+# records it alongside the phase's time.
+
+import os
+import re
+import resource
+import tracemalloc
+
+def rss():
+    # Current resident set size in bytes, or None if we can't tell.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak():
+    # Peak resident set size in bytes since the last reset_peak().
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Task:
+    # Measure how much memory a task needed beyond what its process
+    # already had: 'used' is the peak RSS during the task less the RSS
+    # at its start.
+    def __enter__(self):
+        reset_peak()
+        self.start = rss() or 0
+        return self
+
+    def __exit__(self, *exc):
+        self.peak = peak()
+        self.used = max(0, self.peak - self.start)
+
+def parse_size(s):
+    # Parse a size such as '1500M' or '2G' into bytes.
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)[bB]?\s*$', s)
+    if m is None:
+        raise ValueError("can't understand size '%s'" % s)
+    return int(float(m.group(1)) *
+               1024 ** " KMG".index(m.group(2).upper() or " "))
+
+def format_size(n):
+    for unit in ("bytes", "KB", "MB"):
+        if n < 1024:
+            return "%d %s" % (n, unit) if unit == "bytes" else "%.1f %s" % (n, unit)
+        n /= 1024.0
+    return "%.1f GB" % n
+
+def start_tracing():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def stop_tracing():
+    # For worker processes, which inherit tracemalloc from the parent
+    # but measure themselves by RSS instead, and would otherwise run
+    # several times slower.
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def traced_peak():
+    # Peak Python allocation since tracemalloc's peak was last reset.
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
@@ -0,0 +1,195 @@
+# Declarative nib descriptors.
+#
+# A curve's nib can be a constant (a radius, or a (radius, angle,
+# fdist, bdist) chisel tuple), a function c,x,y,t,theta returning one
+# of those at each point, or one of the descriptor objects here. A
+# descriptor says what most of the nib functions in font.py say, but
+# as data: it works out the nib at a whole list of points along the
+# curve at once (and doesn't ask for the curve's direction at each one
+# unless it needs it), compares and hashes by value, and can be
+# pickled (see glyphir.py), none of which a lambda can do. Anything
+# the descriptors can't express can still be written as a function.
+#
+# Each descriptor's evaluate() is written to do exactly the arithmetic
+# of the lambda it replaces, so that glyphs come out bit-for-bit the
+# same.
+
+from math import sin, cos, atan2, sqrt
+
+FUNCTIONS = {"sin": sin, "cos": cos}
+
+def curve_key(curve):
+    # Identify a curve by its geometry, for hashing descriptors which
+    # refer to other curves.
+    return (type(curve).__name__, curve.__dict__.get("inparams"),
+            curve.__dict__.get("params"))
+
+class Nib:
+    # Each descriptor defines evaluate(c, ts, points, thetas): the nib
+    # at each of the parameter values ts along curve c, where the curve
+    # passes through points and is heading in directions thetas (None
+    # unless needs_theta).
+
+    # Whether evaluate() needs the direction of the curve at each point.
+    needs_theta = False
+
+    def at(self, c, x, y, t, theta):
+        # The nib at a single point, called like a nib function.
+        return self.evaluate(c, [t], [(x, y)], [theta])[0]
+
+    def key(self):
+        return ()
+
+    def lowered(self, lower_curve):
+        # A picklable equivalent, with any curves referred to replaced
+        # by lower_curve(curve).
+        return self
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + self.key())
+
+    def __repr__(self):
+        return "%s%r" % (type(self).__name__, self.key())
+
+class Constant(Nib):
+    def __init__(self, nib):
+        self.nib = nib
+
+    def evaluate(self, c, ts, points, thetas):
+        return [self.nib] * len(ts)
+
+    def key(self):
+        return (self.nib,)
+
+class Angle(Nib):
+    # A round nib whose radius depends on the direction of the curve:
+    # base + amplitude * fn(theta - direction)**power, where fn is
+    # "sin" or "cos" (optionally taken as an absolute value), and
+    # direction is either fixed or a pair (d0, d1) varying linearly
+    # along the curve. For example, a broad pen held at angle d is
+    # Angle(17, 11, "cos", d).
+    needs_theta = True
+
+    def __init__(self, base, amplitude, fn="cos", direction=0, power=1,
+                 absolute=False):
+        self.base, self.amplitude, self.fn = base, amplitude, fn
+        self.direction, self.power, self.absolute = direction, power, absolute
+
+    def evaluate(self, c, ts, points, thetas):
+        f = FUNCTIONS[self.fn]
+        base, amplitude, power = self.base, self.amplitude, self.power
+        if type(self.direction) == tuple:
+            d0, d1 = self.direction
+            angles = [theta - (d0 + (d1-d0)*t) for t, theta in zip(ts, thetas)]
+        else:
+            d = self.direction
+            angles = [theta - d for theta in thetas]
+        if self.absolute:
+            values = [abs(f(a)) for a in angles]
+        else:
+            values = [f(a) for a in angles]
+        if power == 1:
+            return [base + amplitude*v for v in values]
+        return [base + amplitude*v**power for v in values]
+
+    def key(self):
+        return (self.base, self.amplitude, self.fn, self.direction,
+                self.power, self.absolute)
+
+class Profile(Nib):
+    # A round nib whose radius varies along the curve:
+    # base + amplitude * fn(scale*t)**power, where fn is "sin", "cos"
+    # or None for t itself, e.g. Profile(4, 25, "cos", pi/2, 2) for a
+    # stroke which thins out smoothly towards its far end.
+    def __init__(self, base, amplitude, fn=None, scale=1, power=1):
+        self.base, self.amplitude, self.fn = base, amplitude, fn
+        self.scale, self.power = scale, power
+
+    def evaluate(self, c, ts, points, thetas):
+        base, amplitude, scale, power = \
+            self.base, self.amplitude, self.scale, self.power
+        if self.fn is None:
+            values = ts if scale == 1 else [scale*t for t in ts]
+        else:
+            f = FUNCTIONS[self.fn]
+            values = [f(scale*t) for t in ts]
+        if power == 1:
+            return [base + amplitude*v for v in values]
+        return [base + amplitude*v**power for v in values]
+
+    def key(self):
+        return (self.base, self.amplitude, self.fn, self.scale, self.power)
+
+def chisel(x, y, x1, y1, radius):
+    # A chisel nib from (x,y) on the curve to (x1,y1).
+    angle = atan2(y-y1, x1-x)
+    dist = sqrt((y-y1)**2 + (x1-x)**2)
+    return radius, angle, dist, 0
+
+class PointToPoint(Nib):
+    # A chisel nib with one end on the curve and the other at a fixed
+    # point, as ptp_nib in font.py.
+    def __init__(self, x1, y1, radius):
+        self.x1, self.y1, self.radius = x1, y1, radius
+
+    def evaluate(self, c, ts, points, thetas):
+        x1, y1, radius = self.x1, self.y1, self.radius
+        return [chisel(x, y, x1, y1, radius) for x, y in points]
+
+    def key(self):
+        return (self.x1, self.y1, self.radius)
+
+class FollowCurve(Nib):
+    # A chisel nib with one end on the curve and the other following
+    # a different curve, or chain of curves: this curve is the i-th of
+    # n which between them follow the whole of the chain.
+    def __init__(self, curves, i, n, radius):
+        self.curves, self.i, self.n, self.radius = list(curves), i, n, radius
+
+    def evaluate(self, c, ts, points, thetas):
+        curves, i, n, radius = self.curves, self.i, self.n, self.radius
+        nibs = []
+        for t, (x, y) in zip(ts, points):
+            tt = (t + i) * len(curves) / n
+            ti = int(tt)
+            if ti == len(curves):
+                ti = ti - 1
+            x1, y1 = curves[ti].compute_point(tt-ti)
+            nibs.append(chisel(x, y, x1, y1, radius))
+        return nibs
+
+    def key(self):
+        return (tuple(curve_key(curve) for curve in self.curves),
+                self.i, self.n, self.radius)
+
+    def lowered(self, lower_curve):
+        return FollowCurve([lower_curve(curve) for curve in self.curves],
+                           self.i, self.n, self.radius)
+
+def sample_ts(ts, trange):
+    # The sample parameters ts, which run from 0 to 1, cut down to the
+    # range of a truncated curve (see Curve.truncated): its two ends
+    # and the ones in between, so that it draws exactly the strokes
+    # the whole curve would, as far as it goes.
+    t0, t1 = trange
+    if (t0, t1) == (0, 1):
+        return ts
+    return [t0] + [t for t in ts if t0 < t < t1] + [t1]
+
+def strokes(points, nibs):
+    # The PostScript drawing a curve through the given points with the
+    # given nib at each one.
+    out = []
+    for (x, y), nib in zip(points, nibs):
+        if type(nib) == tuple:
+            radius, angle, fdist, bdist = nib
+            c = cos(angle)
+            s = -sin(angle)
+            out.append("newpath %g %g moveto %g %g lineto %g setlinewidth stroke\n" %
+                       (x+c*fdist, y+s*fdist, x-c*bdist, y-s*bdist, 2*radius))
+        elif nib != 0:
+            out.append("newpath %g %g %g 0 360 arc fill\n" % (x, y, nib))
+    return "".join(out)
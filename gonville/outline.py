@@ -0,0 +1,209 @@
+# Compact storage for glyph outlines recovered from the tracing step.
+#
+# A traced outline used to be a Python list of tuples such as
+# ('c', x0,y0, x1,y1, x2,y2, x3,y3), which costs a tuple and nine
+# boxed objects per segment. With hundreds of glyphs (and 576
+# braces) held in the parent process at once, that adds up. An
+# Outline instead keeps one byte of opcode per segment and packs all
+# the coordinates into a single flat array of doubles.
+
+import math
+from array import array
+
+# Opcodes, and the number of coordinates each one carries. As in the
+# old tuple format, a line segment stores both of its endpoints and a
+# curve stores all four of its control points, so that consumers can
+# look at any segment without tracking the current point.
+MOVETO, LINETO, CURVETO, CLOSEPATH = range(4)
+NCOORDS = (2, 4, 8, 0)
+
+class Outline:
+    __slots__ = ("ops", "coords")
+
+    def __init__(self, ops=None, coords=None):
+        self.ops = array("B") if ops is None else ops
+        self.coords = array("d") if coords is None else coords
+
+    def moveto(self, x, y):
+        self.ops.append(MOVETO)
+        self.coords.extend((x, y))
+
+    def lineto(self, x0, y0, x1, y1):
+        self.ops.append(LINETO)
+        self.coords.extend((x0, y0, x1, y1))
+
+    def curveto(self, x0, y0, x1, y1, x2, y2, x3, y3):
+        self.ops.append(CURVETO)
+        self.coords.extend((x0, y0, x1, y1, x2, y2, x3, y3))
+
+    def closepath(self):
+        self.ops.append(CLOSEPATH)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        # Yields (opcode, coordinates) for each segment in turn.
+        coords = self.coords
+        i = 0
+        for op in self.ops:
+            n = NCOORDS[op]
+            yield op, coords[i:i+n]
+            i += n
+
+    def endpoints(self):
+        # Return the indices into self.coords of the x coordinate of
+        # the final point of every segment that has one.
+        ends = []
+        i = 0
+        for op in self.ops:
+            n = NCOORDS[op]
+            if n:
+                ends.append(i + n - 2)
+            i += n
+        return ends
+
+    def bbox(self):
+        # Bounding box of the segment endpoints. That's enough to
+        # bound the whole outline, because break_curves has already
+        # split every curve at its turning points in x and y.
+        coords = self.coords
+        ends = self.endpoints()
+        if not ends:
+            return None, None, None, None
+        xs = [coords[i] for i in ends]
+        ys = [coords[i+1] for i in ends]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def transform(self, matrix):
+        # Return a copy of the outline with a PostScript-style affine
+        # matrix [a,b,c,d,e,f] applied to every point at once.
+        a, b, c, d, e, f = matrix
+        xs = self.coords[0::2]
+        ys = self.coords[1::2]
+        coords = array("d", bytes(len(self.coords) * 8))
+        coords[0::2] = array("d", [a*x+c*y+e for x, y in zip(xs, ys)])
+        coords[1::2] = array("d", [b*x+d*y+f for x, y in zip(xs, ys)])
+        return Outline(array("B", self.ops), coords)
+
+    def reversed(self):
+        # Return a copy of the outline with every contour running the
+        # other way round, as after transforming it by a reflection.
+        out = Outline()
+        contour = []
+        def finish(closed):
+            if contour:
+                op, c = contour[-1]
+                out.moveto(c[-2], c[-1])
+                for op, c in reversed(contour[1:]):
+                    if op == LINETO:
+                        out.lineto(c[2], c[3], c[0], c[1])
+                    else:
+                        out.curveto(c[6], c[7], c[4], c[5], c[2], c[3], c[0], c[1])
+                if closed:
+                    out.closepath()
+            del contour[:]
+        for op, c in self:
+            if op == CLOSEPATH:
+                finish(True)
+            else:
+                if op == MOVETO:
+                    finish(False)
+                contour.append((op, c))
+        finish(False)
+        return out
+
+def bezfn(x0, x1, x2, x3, t):
+    return x0*(1-t)**3 + 3*x1*(1-t)**2*t + 3*x2*(1-t)*t**2 + x3*t**3
+
+def break_curves(outline):
+    # Return a copy of the outline in which every cubic has been
+    # split at its stationary points in x and y that lie in [0,1],
+    # so that each resulting piece is monotonic in both coordinates.
+    # (This is what makes the endpoint-only bbox above valid.)
+    #
+    # A single coordinate of a Bezier curve has the equation
+    #
+    #  x = x0 (1-t)^3 + 3 x1 (1-t)^2 t + 3 x2 (1-t) t^2 + x3 t^3
+    #    = x0 (1-3t+3t^2-t^3) + 3 x1 (t-2t^2+t^3) + 3 x2 (t^2-t^3) + x3 t^3
+    #    = t^3 (x3-3x2+3x1-x0) + t^2 (3x2-6x1+3x0) + t (3x1-3x0) + x0
+    #
+    # and hence its derivative is at^2+bt+c where
+    #  a = 3(x3-3x2+3x1-x0)
+    #  b = 6(x2-2x1+x0)
+    #  c = 3(x1-x0)
+    #
+    # Rather than handling one curve at a time as it comes out of
+    # the parser, we find the breakpoints for every cubic in the
+    # outline together, one coordinate axis at a time, and then
+    # rebuild the outline in a single pass.
+    ops, coords = outline.ops, outline.coords
+    starts = []
+    i = 0
+    for op in ops:
+        if op == CURVETO:
+            starts.append(i)
+        i += NCOORDS[op]
+
+    # Breakpoints are (t, axis) pairs. axis is 0 for the ends of the
+    # curve, or 1 or 2 if the curve is stationary in x or y there, in
+    # which case the adjacent control point is snapped onto the axis
+    # afterwards to remove rounding error.
+    breakpts = [[(0,0),(1,0)] for s in starts]
+    for axis in (1, 2):
+        k = axis - 1
+        c0 = [coords[s+k] for s in starts]
+        c1 = [coords[s+k+2] for s in starts]
+        c2 = [coords[s+k+4] for s in starts]
+        c3 = [coords[s+k+6] for s in starts]
+        A = [3*(p3-3*p2+3*p1-p0) for p0, p1, p2, p3 in zip(c0, c1, c2, c3)]
+        B = [6*(p2-2*p1+p0) for p0, p1, p2 in zip(c0, c1, c2)]
+        C = [3*(p1-p0) for p0, p1 in zip(c0, c1)]
+        for bp, a, b, c in zip(breakpts, A, B, C):
+            if a == 0:
+                if b != 0:
+                    bp.append((-c/b,axis))
+            else:
+                disc = b*b-4*a*c
+                if disc >= 0:
+                    rdisc = math.sqrt(disc)
+                    bp.append(((-b + rdisc)/(2*a),axis))
+                    bp.append(((-b - rdisc)/(2*a),axis))
+
+    out = Outline()
+    i = 0
+    curve = 0
+    for op in ops:
+        n = NCOORDS[op]
+        if op != CURVETO:
+            out.ops.append(op)
+            out.coords.extend(coords[i:i+n])
+            i += n
+            continue
+        x0, y0, x1, y1, x2, y2, x3, y3 = coords[i:i+8]
+        i += n
+        bp = breakpts[curve]
+        curve += 1
+        bp.sort()
+        for j in range(len(bp)-1):
+            (t0, axis0) = bp[j]
+            (t1, axis1) = bp[j+1]
+            if 0 <= t0 and t0 < t1 and t1 <= 1:
+                nx0 = bezfn(x0,x1,x2,x3,t0)
+                ny0 = bezfn(y0,y1,y2,y3,t0)
+                nx3 = bezfn(x0,x1,x2,x3,t1)
+                ny3 = bezfn(y0,y1,y2,y3,t1)
+                nx1 = nx0 + (t1-t0) * ((x3-3*x2+3*x1-x0)*t0**2 + 2*(x2-2*x1+x0)*t0 + (x1-x0))
+                ny1 = ny0 + (t1-t0) * ((y3-3*y2+3*y1-y0)*t0**2 + 2*(y2-2*y1+y0)*t0 + (y1-y0))
+                nx2 = nx3 - (t1-t0) * ((x3-3*x2+3*x1-x0)*t1**2 + 2*(x2-2*x1+x0)*t1 + (x1-x0))
+                ny2 = ny3 - (t1-t0) * ((y3-3*y2+3*y1-y0)*t1**2 + 2*(y2-2*y1+y0)*t1 + (y1-y0))
+                if axis0 == 1:
+                    nx1 = nx0
+                elif axis0 == 2:
+                    ny1 = ny0
+                if axis1 == 1:
+                    nx2 = nx3
+                elif axis1 == 2:
+                    ny2 = ny3
+                out.curveto(nx0,ny0,nx1,ny1,nx2,ny2,nx3,ny3)
+    return out
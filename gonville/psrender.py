@@ -0,0 +1,746 @@
+# Minimal PostScript rasteriser for glyph drawings.
+#
+# The normal build pipes every glyph's PostScript into Ghostscript
+# to get a bitmap for potrace. This module implements just enough of
+# the PostScript language to render the output of
+# GlyphContext.makeps() in-process instead: the path construction
+# and painting operators, coordinate transforms, gsave/grestore,
+# clipping, and the handful of stack and procedure operators that
+# the glyph definitions in font.py happen to use. Anything else
+# raises PSError, so that an unsupported glyph fails loudly rather
+# than being rendered wrongly.
+#
+# Pixels are painted if their centre lies inside the shape, and
+# shapes are filled using the nonzero winding rule.
+
+import math
+import re
+
+class PSError(Exception):
+    pass
+
+class Bitmap:
+    # One byte per pixel, 1 for black and 0 for white. Rows are
+    # stored bottom-up, so that pixel (x,y) covers the square
+    # [x,x+1] x [y,y+1] in device coordinates, exactly as PostScript
+    # device space has its origin at the bottom left.
+    __slots__ = ("width", "height", "data")
+
+    def __init__(self, width, height, data=None):
+        self.width = width
+        self.height = height
+        if data is None:
+            data = bytearray(width * height)
+        self.data = data
+
+    def row(self, y):
+        return self.data[y*self.width:(y+1)*self.width]
+
+def matmul(m1, m2):
+    # Product of two PostScript matrices [a b c d e f], with m1
+    # applied first.
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1*a2 + b1*c2, a1*b2 + b1*d2,
+            c1*a2 + d1*c2, c1*b2 + d1*d2,
+            e1*a2 + f1*c2 + e2, e1*b2 + f1*d2 + f2)
+
+def matinv(m):
+    a, b, c, d, e, f = m
+    det = a*d - b*c
+    ia, ib, ic, id = d/det, -b/det, -c/det, a/det
+    return (ia, ib, ic, id, -(e*ia + f*ic), -(e*ib + f*id))
+
+def apply(m, x, y):
+    a, b, c, d, e, f = m
+    return a*x + c*y + e, b*x + d*y + f
+
+def similarity_scale(m):
+    # If m maps circles to circles, return its scale factor;
+    # otherwise None.
+    a, b, c, d, e, f = m
+    s1 = a*a + b*b
+    s2 = c*c + d*d
+    if abs(s1 - s2) > 1e-9 * max(s1, s2) or abs(a*c + b*d) > 1e-9 * max(s1, s2):
+        return None
+    return math.sqrt(s1)
+
+def arc_points(cx, cy, r, ang1, ang2, m):
+    # Flatten an arc given in user space into device-space points,
+    # finely enough that the error stays well below a pixel.
+    sweep = ang2 - ang1
+    a, b, c, d, e, f = m
+    rdev = r * math.sqrt(max(a*a + b*b, c*c + d*d))
+    if rdev > 0.2:
+        step = 2 * math.acos(1 - 0.1 / rdev)
+    else:
+        step = math.pi / 2
+    n = max(2, int(math.ceil(abs(math.radians(sweep)) / step)))
+    pts = []
+    for i in range(n+1):
+        t = math.radians(ang1 + sweep * i / n)
+        pts.append(apply(m, cx + r*math.cos(t), cy + r*math.sin(t)))
+    return pts
+
+def polygon_spans(polys, height):
+    # Scan-convert a set of closed device-space polygons with the
+    # nonzero winding rule. Yields (row, x0, x1) for every horizontal
+    # run of pixels [x0,x1) whose centres are inside.
+    edges = []
+    for poly in polys:
+        n = len(poly)
+        for i in range(n):
+            x0, y0 = poly[i]
+            x1, y1 = poly[(i+1) % n]
+            if y0 == y1:
+                continue
+            wind = 1 if y1 > y0 else -1
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            j0 = max(int(math.ceil(y0 - 0.5)), 0)
+            j1 = min(int(math.ceil(y1 - 0.5)), height)
+            if j0 >= j1:
+                continue
+            dxdy = (x1-x0) / (y1-y0)
+            edges.append((j0, j1, x0 + (j0 + 0.5 - y0) * dxdy, dxdy, wind))
+    if not edges:
+        return
+    edges.sort(key=lambda e: e[0])
+    active = []
+    ei = 0
+    nedges = len(edges)
+    j = edges[0][0]
+    while ei < nedges or active:
+        if not active and edges[ei][0] > j:
+            j = edges[ei][0]
+        while ei < nedges and edges[ei][0] == j:
+            j0, j1, x, dxdy, wind = edges[ei]
+            active.append([j1, x, dxdy, wind])
+            ei += 1
+        crossings = sorted((e[1], e[3]) for e in active)
+        winding = 0
+        for x, wind in crossings:
+            if winding == 0:
+                xstart = x
+            winding += wind
+            if winding == 0:
+                x0 = int(math.ceil(xstart - 0.5))
+                x1 = int(math.ceil(x - 0.5))
+                if x0 < x1:
+                    yield j, x0, x1
+        j += 1
+        for e in active:
+            e[1] += e[2]
+        active = [e for e in active if e[0] > j]
+
+def disc_spans(cx, cy, r, height):
+    # Scan-convert a device-space circle directly, which is a great
+    # deal cheaper than going via polygon_spans for the many round
+    # nib impressions making up a typical glyph.
+    j0 = max(int(math.ceil(cy - r - 0.5)), 0)
+    j1 = min(int(math.ceil(cy + r - 0.5)), height)
+    r2 = r*r
+    for j in range(j0, j1):
+        dy = j + 0.5 - cy
+        h = r2 - dy*dy
+        if h <= 0:
+            continue
+        h = math.sqrt(h)
+        x0 = int(math.ceil(cx - h - 0.5))
+        x1 = int(math.ceil(cx + h - 0.5))
+        if x0 < x1:
+            yield j, x0, x1
+
+def convex_hull(pts):
+    # Andrew's monotone chain; returns the hull anticlockwise.
+    pts = sorted(set(pts))
+    if len(pts) < 3:
+        return pts
+    def half(seq):
+        h = []
+        for p in seq:
+            while len(h) >= 2 and ((h[-1][0]-h[-2][0])*(p[1]-h[-2][1]) -
+                                   (h[-1][1]-h[-2][1])*(p[0]-h[-2][0])) <= 0:
+                h.pop()
+            h.append(p)
+        return h
+    lower = half(pts)
+    upper = half(reversed(pts))
+    return lower[:-1] + upper[:-1]
+
+# Tolerance, in pixels, to which a run of nib impressions may be
+# approximated by the convex hulls of a subset of them.
+NIB_TOLERANCE = 0.2
+
+def nib_hull_ok(nibs, i, j):
+    # Decide whether the nib impressions nibs[i..j] (each a round-
+    # capped line (px,py)-(qx,qy) of radius r in device space) can be
+    # painted as the convex hull of the first and last. That's true
+    # if everything in between is, to within NIB_TOLERANCE, a linear
+    # interpolation of the two ends, and the ends don't cross over
+    # each other (in which case the swept area would be a bow-tie
+    # rather than the convex quadrilateral between them).
+    pxi, pyi, qxi, qyi, ri = nibs[i]
+    pxj, pyj, qxj, qyj, rj = nibs[j]
+    tol = NIB_TOLERANCE
+    span = float(j - i)
+    for k in range(i+1, j):
+        s = (k - i) / span
+        px, py, qx, qy, r = nibs[k]
+        dr = abs(r - (ri + s*(rj-ri)))
+        if (abs(px - (pxi + s*(pxj-pxi))) + abs(py - (pyi + s*(pyj-pyi))) + dr > tol or
+            abs(qx - (qxi + s*(qxj-qxi))) + abs(qy - (qyi + s*(qyj-qyi))) + dr > tol):
+            return False
+    quad = ((pxi, pyi), (pxj, pyj), (qxj, qyj), (qxi, qyi))
+    sign = 0
+    for m in range(4):
+        (ax, ay), (bx, by), (cx, cy) = quad[m], quad[(m+1)%4], quad[(m+2)%4]
+        z = (bx-ax)*(cy-by) - (by-ay)*(cx-bx)
+        if abs(z) <= tol * (abs(cx-ax) + abs(cy-ay)):
+            continue
+        if sign and (z > 0) != (sign > 0):
+            return False
+        sign = z
+    return True
+
+def nib_step_ok(a, b):
+    # Adjacent impressions can only be joined up if they're close
+    # enough together that the scallops between them in the true
+    # union would be smaller than the tolerance anyway.
+    r = min(a[4], b[4])
+    limit = 8 * r * NIB_TOLERANCE
+    return ((a[0]-b[0])**2 + (a[1]-b[1])**2 <= limit and
+            (a[2]-b[2])**2 + (a[3]-b[3])**2 <= limit)
+
+def spans_to_rows(spans):
+    # Collect spans into a dict mapping each row to a sorted list of
+    # disjoint intervals, as used for the clipping region.
+    rows = {}
+    for j, x0, x1 in spans:
+        rows.setdefault(j, []).append((x0, x1))
+    for j, runs in rows.items():
+        runs.sort()
+        merged = []
+        for x0, x1 in runs:
+            if merged and x0 <= merged[-1][1]:
+                if x1 > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], x1)
+            else:
+                merged.append((x0, x1))
+        rows[j] = merged
+    return rows
+
+def intersect_runs(r1, r2):
+    out = []
+    i = k = 0
+    while i < len(r1) and k < len(r2):
+        a = max(r1[i][0], r2[k][0])
+        b = min(r1[i][1], r2[k][1])
+        if a < b:
+            out.append((a, b))
+        if r1[i][1] < r2[k][1]:
+            i += 1
+        else:
+            k += 1
+    return out
+
+class Proc(list):
+    # An executable array, i.e. a PostScript procedure body.
+    pass
+
+class Circle:
+    # A subpath which is exactly one full circle in device space.
+    # Kept symbolic so that fill can use disc_spans on it.
+    __slots__ = ("cx", "cy", "r")
+    def __init__(self, cx, cy, r):
+        self.cx, self.cy, self.r = cx, cy, r
+
+class GState:
+    def __init__(self, ctm):
+        self.ctm = ctm
+        self.path = [] # list of subpaths: Circle, or [closed, points]
+        self.linewidth = 1.0
+        self.linecap = 0
+        self.linejoin = 0
+        self.gray = 0.0
+        self.clip = None # None, or rows as returned by spans_to_rows
+
+    def copy(self):
+        gs = GState(self.ctm)
+        gs.path = [sp if isinstance(sp, Circle) else [sp[0], list(sp[1])]
+                   for sp in self.path]
+        gs.linewidth = self.linewidth
+        gs.linecap = self.linecap
+        gs.linejoin = self.linejoin
+        gs.gray = self.gray
+        gs.clip = self.clip
+        return gs
+
+token_re = re.compile(r'%[^\n]*|[\[\]{}]|/?[^\s\[\]{}()/%]+')
+
+def tokenise(text):
+    # Turn PostScript source into a flat list of tokens, with
+    # procedure bodies gathered into nested Proc lists.
+    stack = [Proc()]
+    for tok in token_re.findall(text):
+        if tok[0] == "%":
+            continue
+        if tok == "{":
+            stack.append(Proc())
+        elif tok == "}":
+            proc = stack.pop()
+            stack[-1].append(proc)
+        else:
+            try:
+                stack[-1].append(float(tok))
+            except ValueError:
+                stack[-1].append(tok)
+    if len(stack) != 1:
+        raise PSError("unbalanced braces")
+    return stack[0]
+
+class Renderer:
+    def __init__(self, bitmap, res):
+        self.bitmap = bitmap
+        self.gs = GState((res, 0, 0, res, 0, 0))
+        self.gstack = []
+        self.stack = []
+        self.dict = {}
+        self.currentpoint = None
+        # Pending nib impressions, and the (gray, clip) they're to be
+        # painted with. See add_nib.
+        self.nibs = []
+        self.nibstate = None
+        w = bitmap.width
+        self.ones = b"\x01" * w
+        self.zeros = bytes(w)
+
+    # ---- painting ----
+
+    def paint(self, spans, state=None):
+        bm = self.bitmap
+        w, h, data = bm.width, bm.height, bm.data
+        gray, clip = state or (self.gs.gray, self.gs.clip)
+        fill = self.ones if gray < 0.5 else self.zeros
+        for j, x0, x1 in spans:
+            if j < 0 or j >= h:
+                continue
+            if x0 < 0:
+                x0 = 0
+            if x1 > w:
+                x1 = w
+            if clip is None:
+                if x0 < x1:
+                    data[j*w+x0:j*w+x1] = fill[:x1-x0]
+            else:
+                for a, b in clip.get(j, ()):
+                    a = max(a, x0)
+                    b = min(b, x1)
+                    if a < b:
+                        data[j*w+a:j*w+b] = fill[:b-a]
+
+    def add_nib(self, px, py, qx, qy, r):
+        # makeps draws each curve as hundreds of closely spaced round
+        # dots or round-capped chisel strokes. Painting every one of
+        # those separately is by far the most expensive part of
+        # rendering, so instead we queue them up and paint each run
+        # of them as a much smaller number of convex hulls.
+        state = (self.gs.gray, self.gs.clip)
+        if self.nibs and state != self.nibstate:
+            self.flush_nibs()
+        self.nibstate = state
+        self.nibs.append((px, py, qx, qy, r))
+
+    def flush_nibs(self):
+        nibs = self.nibs
+        if not nibs:
+            return
+        self.nibs = []
+        h = self.bitmap.height
+        n = len(nibs)
+        # runend[i] is the last impression reachable from i without
+        # a jump that nib_step_ok rules out.
+        runend = [n-1] * n
+        for k in range(n-2, -1, -1):
+            runend[k] = runend[k+1] if nib_step_ok(nibs[k], nibs[k+1]) else k
+        i = 0
+        while True:
+            # Find how far the run starting at i can be extended, by
+            # galloping and then bisecting (every candidate actually
+            # used is checked in full, so this can only cost us a
+            # few missed merges, never correctness).
+            lim = min(runend[i], i + 256)
+            j, step = i, 1
+            while j+step <= lim and nib_hull_ok(nibs, i, j+step):
+                j += step
+                step *= 2
+            while step > 1:
+                step //= 2
+                if j+step <= lim and nib_hull_ok(nibs, i, j+step):
+                    j += step
+            a, b = nibs[i], nibs[j]
+            if a[:2] == a[2:4] and (i == j or b[:4] == a[:4]) and a[4] == b[4]:
+                spans = disc_spans(a[0], a[1], a[4], h)
+            else:
+                pts = []
+                for cx, cy, r in set([(a[0], a[1], a[4]), (a[2], a[3], a[4]),
+                                      (b[0], b[1], b[4]), (b[2], b[3], b[4])]):
+                    pts.extend(arc_points(cx, cy, r, 0, 360, (1, 0, 0, 1, 0, 0))[:-1])
+                spans = polygon_spans([convex_hull(pts)], h)
+            self.paint(spans, self.nibstate)
+            if j == n-1:
+                break
+            i = j if j > i else j+1
+
+    def path_polygons(self, path):
+        polys = []
+        for sp in path:
+            if isinstance(sp, Circle):
+                polys.append(arc_points(sp.cx, sp.cy, sp.r, 0, 360,
+                                        (1, 0, 0, 1, 0, 0))[:-1])
+            elif len(sp[1]) > 1:
+                polys.append(sp[1])
+        return polys
+
+    def path_spans(self, path):
+        h = self.bitmap.height
+        if all(isinstance(sp, Circle) for sp in path) and len(path) == 1:
+            return disc_spans(path[0].cx, path[0].cy, path[0].r, h)
+        return polygon_spans(self.path_polygons(path), h)
+
+    def fill(self):
+        path = self.gs.path
+        if len(path) == 1 and isinstance(path[0], Circle):
+            c = path[0]
+            self.add_nib(c.cx, c.cy, c.cx, c.cy, c.r)
+            self.newpath()
+            return
+        self.flush_nibs()
+        self.paint(self.path_spans(self.gs.path))
+        self.newpath()
+
+    def clip(self):
+        self.flush_nibs()
+        rows = spans_to_rows(self.path_spans(self.gs.path))
+        old = self.gs.clip
+        if old is not None:
+            rows = dict((j, intersect_runs(runs, old[j]))
+                        for j, runs in rows.items() if j in old)
+        self.gs.clip = rows
+
+    def stroke(self):
+        # Stroke each subpath by painting the union of a quadrilateral
+        # per segment plus the caps and joins. The geometry is worked
+        # out in user space, so that non-uniform scaling is honoured.
+        gs = self.gs
+        ctm = gs.ctm
+        inv = matinv(ctm)
+        hw = gs.linewidth / 2.0
+        h = self.bitmap.height
+        sim = similarity_scale(ctm)
+        if (sim is not None and gs.linecap == 1 and len(gs.path) == 1 and
+            not isinstance(gs.path[0], Circle) and not gs.path[0][0] and
+            len(gs.path[0][1]) <= 2):
+            # A single round-capped line: a chisel nib impression.
+            pts = gs.path[0][1]
+            (px, py), (qx, qy) = pts[0], pts[-1]
+            self.add_nib(px, py, qx, qy, hw * sim)
+            self.newpath()
+            return
+        self.flush_nibs()
+
+        def dot(x, y):
+            if sim is not None:
+                cx, cy = apply(ctm, x, y)
+                self.paint(disc_spans(cx, cy, hw * sim, h))
+            else:
+                self.paint(polygon_spans([arc_points(x, y, hw, 0, 360, ctm)[:-1]], h))
+
+        def poly(pts):
+            self.paint(polygon_spans([[apply(ctm, x, y) for x, y in pts]], h))
+
+        for sp in gs.path:
+            if isinstance(sp, Circle):
+                closed = True
+                pts = arc_points(sp.cx, sp.cy, sp.r, 0, 360, (1, 0, 0, 1, 0, 0))[:-1]
+            else:
+                closed, pts = sp
+            pts = [apply(inv, x, y) for x, y in pts]
+            # Discard repeated points.
+            upts = pts[:1]
+            for p in pts[1:]:
+                if p != upts[-1]:
+                    upts.append(p)
+            if closed and len(upts) > 1 and upts[0] == upts[-1]:
+                upts.pop()
+            if len(upts) == 1:
+                if gs.linecap == 1 and not closed:
+                    dot(*upts[0])
+                continue
+            nseg = len(upts) if closed else len(upts) - 1
+            dirs = []
+            for i in range(nseg):
+                x0, y0 = upts[i]
+                x1, y1 = upts[(i+1) % len(upts)]
+                d = math.hypot(x1-x0, y1-y0)
+                dirs.append(((x1-x0)/d, (y1-y0)/d))
+            for i in range(nseg):
+                x0, y0 = upts[i]
+                x1, y1 = upts[(i+1) % len(upts)]
+                dx, dy = dirs[i]
+                nx, ny = -dy*hw, dx*hw
+                if gs.linecap == 2 and not closed:
+                    if i == 0:
+                        x0, y0 = x0 - dx*hw, y0 - dy*hw
+                    if i == nseg-1:
+                        x1, y1 = x1 + dx*hw, y1 + dy*hw
+                poly([(x0+nx, y0+ny), (x1+nx, y1+ny), (x1-nx, y1-ny), (x0-nx, y0-ny)])
+            # Joins.
+            joins = range(nseg) if closed else range(1, nseg)
+            for i in joins:
+                x, y = upts[i]
+                (dx0, dy0), (dx1, dy1) = dirs[i-1], dirs[i]
+                cross = dx0*dy1 - dy0*dx1
+                if gs.linejoin == 1:
+                    dot(x, y)
+                    continue
+                if cross == 0:
+                    continue
+                # The outside of the turn is on the right of the
+                # path for a left turn, and vice versa.
+                side = -1 if cross > 0 else 1
+                n0 = (-dy0*hw*side, dx0*hw*side)
+                n1 = (-dy1*hw*side, dx1*hw*side)
+                p0 = (x+n0[0], y+n0[1])
+                p1 = (x+n1[0], y+n1[1])
+                cosa = dx0*dx1 + dy0*dy1
+                # Miter length ratio is 1/sin(phi/2), phi being the
+                # angle between the segments; the default limit is 10.
+                if gs.linejoin == 0 and (1 - cosa) > 2.0 / 100:
+                    tx, ty = n0[0] + n1[0], n0[1] + n1[1]
+                    tl = math.hypot(tx, ty)
+                    mlen = hw * hw / (tl / 2) if tl else 0
+                    poly([(x, y), p0, (x + tx/tl*mlen, y + ty/tl*mlen), p1])
+                else:
+                    poly([(x, y), p0, p1])
+            if not closed and gs.linecap == 1:
+                dot(*upts[0])
+                dot(*upts[-1])
+        self.newpath()
+
+    # ---- path construction ----
+
+    def newpath(self):
+        self.gs.path = []
+        self.currentpoint = None
+
+    def moveto(self, x, y):
+        self.currentpoint = (x, y)
+        self.gs.path.append([False, [(x, y)]])
+
+    def lineto(self, x, y):
+        if self.currentpoint is None:
+            raise PSError("lineto with no current point")
+        sp = self.gs.path[-1]
+        if isinstance(sp, Circle) or sp[0]:
+            self.gs.path.append([False, [self.currentpoint]])
+        self.gs.path[-1][1].append((x, y))
+        self.currentpoint = (x, y)
+
+    def closepath(self):
+        if self.gs.path and not isinstance(self.gs.path[-1], Circle):
+            sp = self.gs.path[-1]
+            sp[0] = True
+            self.currentpoint = sp[1][0]
+
+    def arc(self, cx, cy, r, ang1, ang2, negative):
+        if negative:
+            while ang2 > ang1:
+                ang2 -= 360
+        else:
+            while ang2 < ang1:
+                ang2 += 360
+        ctm = self.gs.ctm
+        sim = similarity_scale(ctm)
+        if (self.currentpoint is None and abs(ang2 - ang1) >= 360
+            and sim is not None):
+            dcx, dcy = apply(ctm, cx, cy)
+            self.gs.path.append(Circle(dcx, dcy, r * sim))
+            self.currentpoint = apply(ctm, cx + r*math.cos(math.radians(ang2)),
+                                      cy + r*math.sin(math.radians(ang2)))
+            return
+        pts = arc_points(cx, cy, r, ang1, ang2, ctm)
+        if self.currentpoint is None:
+            self.moveto(*pts[0])
+        else:
+            self.lineto(*pts[0])
+        for p in pts[1:]:
+            self.lineto(*p)
+
+    # ---- interpreter ----
+
+    def pop(self, n=1):
+        if len(self.stack) < n:
+            raise PSError("stack underflow")
+        if n == 1:
+            return self.stack.pop()
+        vals = self.stack[-n:]
+        del self.stack[-n:]
+        return vals
+
+    def run(self, text):
+        self.execute(tokenise(text))
+
+    def execute(self, tokens):
+        for tok in tokens:
+            if isinstance(tok, (float, Proc)):
+                self.stack.append(tok)
+            elif tok[0] == "/":
+                self.stack.append(tok[1:])
+            elif tok == "[":
+                self.stack.append(tok)
+            elif tok == "]":
+                i = len(self.stack) - 1
+                while i >= 0 and not (isinstance(self.stack[i], str) and self.stack[i] == "["):
+                    i -= 1
+                if i < 0:
+                    raise PSError("unmatched ]")
+                arr = self.stack[i+1:]
+                del self.stack[i:]
+                self.stack.append(arr)
+            elif tok in self.dict:
+                val = self.dict[tok]
+                if isinstance(val, Proc):
+                    self.execute(val)
+                else:
+                    self.stack.append(val)
+            else:
+                op = getattr(self, "op_" + tok, None)
+                if op is None:
+                    raise PSError("unsupported PostScript operator '%s'" % tok)
+                op()
+
+    def user(self, x, y):
+        return apply(self.gs.ctm, x, y)
+
+    def op_def(self):
+        key, val = self.pop(2)
+        self.dict[key] = val
+    def op_repeat(self):
+        n, proc = self.pop(2)
+        for i in range(int(n)):
+            self.execute(proc)
+    def op_dup(self):
+        self.stack.append(self.stack[-1])
+    def op_exch(self):
+        a, b = self.pop(2)
+        self.stack.extend((b, a))
+    def op_pop(self):
+        self.pop()
+    def op_index(self):
+        n = int(self.pop())
+        self.stack.append(self.stack[-1-n])
+    def op_roll(self):
+        n, j = self.pop(2)
+        n, j = int(n), int(j)
+        if n:
+            vals = self.pop(n) if n > 1 else [self.pop()]
+            j %= n
+            self.stack.extend(vals[n-j:] + vals[:n-j])
+    def op_add(self):
+        a, b = self.pop(2)
+        self.stack.append(a + b)
+    def op_sub(self):
+        a, b = self.pop(2)
+        self.stack.append(a - b)
+    def op_mul(self):
+        a, b = self.pop(2)
+        self.stack.append(a * b)
+    def op_div(self):
+        a, b = self.pop(2)
+        self.stack.append(a / b)
+    def op_neg(self):
+        self.stack.append(-self.pop())
+
+    def op_matrix(self):
+        self.stack.append([1.0, 0.0, 0.0, 1.0, 0.0, 0.0])
+    def op_currentmatrix(self):
+        m = self.pop()
+        m[:] = self.gs.ctm
+        self.stack.append(m)
+    def op_setmatrix(self):
+        self.gs.ctm = tuple(self.pop())
+    def op_concat(self):
+        self.gs.ctm = matmul(tuple(self.pop()), self.gs.ctm)
+    def op_translate(self):
+        x, y = self.pop(2)
+        self.gs.ctm = matmul((1, 0, 0, 1, x, y), self.gs.ctm)
+    def op_scale(self):
+        x, y = self.pop(2)
+        self.gs.ctm = matmul((x, 0, 0, y, 0, 0), self.gs.ctm)
+    def op_rotate(self):
+        a = math.radians(self.pop())
+        c, s = math.cos(a), math.sin(a)
+        self.gs.ctm = matmul((c, s, -s, c, 0, 0), self.gs.ctm)
+
+    def op_gsave(self):
+        self.gstack.append((self.gs, self.currentpoint))
+        self.gs = self.gs.copy()
+    def op_grestore(self):
+        if self.gstack:
+            self.gs, self.currentpoint = self.gstack.pop()
+
+    def op_newpath(self):
+        self.newpath()
+    def op_moveto(self):
+        self.moveto(*self.user(*self.pop(2)))
+    def op_lineto(self):
+        self.lineto(*self.user(*self.pop(2)))
+    def op_rmoveto(self):
+        dx, dy = self.pop(2)
+        x, y = apply(matinv(self.gs.ctm), *self.currentpoint)
+        self.moveto(*self.user(x+dx, y+dy))
+    def op_rlineto(self):
+        dx, dy = self.pop(2)
+        x, y = apply(matinv(self.gs.ctm), *self.currentpoint)
+        self.lineto(*self.user(x+dx, y+dy))
+    def op_closepath(self):
+        self.closepath()
+    def op_arc(self):
+        self.arc(*self.pop(5), negative=False)
+    def op_arcn(self):
+        self.arc(*self.pop(5), negative=True)
+    def op_currentpoint(self):
+        self.stack.extend(apply(matinv(self.gs.ctm), *self.currentpoint))
+
+    def op_fill(self):
+        self.fill()
+    def op_stroke(self):
+        self.stroke()
+    def op_clip(self):
+        self.clip()
+    def op_setlinewidth(self):
+        self.gs.linewidth = self.pop()
+    def op_setlinecap(self):
+        self.gs.linecap = int(self.pop())
+    def op_setlinejoin(self):
+        self.gs.linejoin = int(self.pop())
+    def op_setgray(self):
+        self.gs.gray = self.pop()
+    def op_showpage(self):
+        self.flush_nibs()
+
+def render(char, bitmap=None, ps=None):
+    # Render a glyph exactly as get_ps_path would ask Ghostscript to,
+    # returning a Bitmap of canvas_size scaled up by trace_res. The
+    # caller may supply the PostScript it would send, if it has it.
+    xsize, ysize = char.canvas_size
+    res = char.trace_res
+    if bitmap is None:
+        bitmap = Bitmap(xsize*res, ysize*res)
+    if ps is None:
+        ps = "0 %d translate 1 -1 scale\n" % ysize + char.makeps() + "showpage"
+    r = Renderer(bitmap, res)
+    r.run(ps)
+    r.flush_nibs()
+    return bitmap
@@ -0,0 +1,68 @@
+# Checks that 'glyphs.py --compile' makes the same bundle every time
+# from the same sources and --tune settings, however its workers
+# happen to divide up the glyphs. Each compile runs in a fresh
+# process, writing to a temporary bundle rather than the real one.
+#
+# Run with 'python3 -m unittest discover gonville/tests'.
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+SOURCE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE)
+
+import glyphbundle
+
+COMPILE = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import glyphs, glyphbundle
+glyphs.bundle_file, glyphs.tuning_file = sys.argv[2], sys.argv[3]
+glyphs.tuning = glyphs.load_tuning()
+glyphs.compile_bundle(2, "test")
+bundle = glyphbundle.open_bundle(glyphs.bundle_file, "test")
+for name in sorted(bundle.glyphs):
+    print(name, bundle.load(name).fingerprint())
+"""
+
+# appoggiatura is drawn by acciaccatura, which isn't tuned itself,
+# and which the workers get to first.
+TUNING = {"appoggiatura": {"trace_res": 3, "curve_res": 501}}
+
+class BundleTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.tuning = os.path.join(self.dir, "tuning.json")
+        with open(self.tuning, "w") as f:
+            json.dump(TUNING, f)
+
+    def compile(self, n):
+        bundle = os.path.join(self.dir, "glyphs%d.bundle" % n)
+        result = subprocess.run(
+            [sys.executable, "-c", COMPILE, SOURCE, bundle, self.tuning],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        return dict(line.split() for line in result.stdout.splitlines())
+
+    def test_deterministic(self):
+        first = self.compile(1)
+        second = self.compile(2)
+        self.assertEqual(first, second)
+
+    def test_embedded_glyphs_tuned(self):
+        self.compile(1)
+        bundle = glyphbundle.open_bundle(
+            os.path.join(self.dir, "glyphs1.bundle"), "test")
+        glyph = bundle.load("acciaccatura")
+        self.assertEqual([e.curve_res for e in glyph.extra
+                          if getattr(e, "name", None) == "appoggiatura"], [501])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+# Checks of the outline comparisons in fidelity.py.
+#
+# Run with 'python3 -m unittest discover gonville/tests'.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fidelity
+from outline import Outline
+
+def square(x, y, side):
+    path = Outline()
+    path.moveto(x, y)
+    path.lineto(x, y, x + side, y)
+    path.lineto(x + side, y, x + side, y + side)
+    path.lineto(x + side, y + side, x, y + side)
+    path.lineto(x, y + side, x, y)
+    path.closepath()
+    return path
+
+class AreaDifferenceTest(unittest.TestCase):
+    def test_same(self):
+        diff, area = fidelity.area_difference(square(0, 0, 10), square(0, 0, 10), 0.5)
+        self.assertEqual(diff, 0)
+        self.assertAlmostEqual(area, 100, delta=5)
+
+    def test_both_empty(self):
+        self.assertEqual(fidelity.area_difference(Outline(), Outline(), 0.5),
+                         (0.0, 0.0))
+
+    def test_one_empty(self):
+        # A trace which has lost the whole glyph is as far off as it
+        # can be, whichever side it's on.
+        diff, area = fidelity.area_difference(square(0, 0, 10), Outline(), 0.5)
+        self.assertAlmostEqual(diff, 100, delta=5)
+        self.assertEqual(diff, area)
+        diff, area = fidelity.area_difference(Outline(), square(0, 0, 10), 0.5)
+        self.assertAlmostEqual(diff, 100, delta=5)
+        self.assertEqual(area, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# Checks that an --incremental build with nothing left to do finishes
+# cleanly. FontForge is replaced by a script which just copies the
+# .sfd to each output file, so this needs neither it nor Ghostscript
+# and potrace.
+#
+# Run with 'python3 -m unittest discover gonville/tests'.
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+SOURCE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_FONTFORGE = """#!/bin/sh
+shift 3
+infile="$1"; shift
+for outfile in "$@"; do cp "$infile" "$outfile"; done
+"""
+
+class IncrementalBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        bindir = os.path.join(self.dir, "bin")
+        os.mkdir(bindir)
+        fontforge = os.path.join(bindir, "fontforge")
+        with open(fontforge, "w") as f:
+            f.write(FAKE_FONTFORGE)
+        os.chmod(fontforge, 0o755)
+        self.env = dict(os.environ, PATH=bindir + os.pathsep + os.environ["PATH"])
+        self.build = os.path.join(self.dir, "build")
+        os.mkdir(self.build)
+        shutil.copy(os.path.join(SOURCE, "script.ff"), self.build)
+
+    def lilymain(self, *args):
+        return subprocess.run(
+            [sys.executable, os.path.join(SOURCE, "glyphs.py"), "--lilymain",
+             "--incremental", "--tracer", "builtin", "-j", "1"] + list(args),
+            cwd=self.build, env=self.env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+
+    def test_up_to_date(self):
+        first = self.lilymain()
+        self.assertEqual(first.returncode, 0, first.stdout)
+        second = self.lilymain()
+        self.assertEqual(second.returncode, 0, second.stdout)
+        self.assertIn("gonville-23.sfd is up to date", second.stdout)
+
+    def test_all_cached(self):
+        # A change to script.ff means the font has to be regenerated,
+        # but every outline can come from the cache.
+        first = self.lilymain()
+        self.assertEqual(first.returncode, 0, first.stdout)
+        with open(os.path.join(self.build, "script.ff"), "a") as f:
+            f.write("\n")
+        second = self.lilymain()
+        self.assertEqual(second.returncode, 0, second.stdout)
+        self.assertRegex(second.stdout, r"(\d+) of \1 glyphs already traced")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+# Runs the external programs a build needs (gs, potrace, FontForge,
+# and any --svgfilter) as asyncio subprocesses. The build's own
+# scheduler keeps one event loop, and one ToolRunner, for FontForge and
+# the --svgfilter, so that it can keep many of them going at once
+# without a thread or process to babysit each one. Each worker process
+# runs its gs|potrace pipelines one at a time through a ToolRunner of
+# its own (see pipeline() below), so how many of those run at once is
+# just the number of workers.
+#
+# Within a ToolRunner, each program has its own limit on how many
+# copies may run at once,
+# so that, say, a slow FontForge run can't be starved by a flood of
+# short potrace jobs, nor the other way round. Standard error of every
+# process is read as it's produced (so a chatty program can't fill the
+# pipe and stall) and printed only if the program fails. Cancelling a
+# job kills whatever processes it had running.
+
+import os
+import sys
+import signal
+import asyncio
+import threading
+import subprocess
+import time
+
+class ToolRunner:
+    def __init__(self, limits={}, default=1, times=None):
+        # 'limits' maps a program name (the basename of argv[0]) to
+        # the number of copies allowed to run at once; anything not
+        # mentioned gets 'default'. If 'times' is a dict, the seconds
+        # each program spent running are added up in it by name.
+        self.limits = dict(limits)
+        self.default = default
+        self.semaphores = {}
+        self.times = times
+
+    def semaphore(self, tool):
+        if tool not in self.semaphores:
+            self.semaphores[tool] = asyncio.Semaphore(
+                self.limits.get(tool, self.default))
+        return self.semaphores[tool]
+
+    async def run(self, command, input=None, output=False):
+        # Run one command, returning its standard output as bytes if
+        # 'output' is set, and otherwise discarding it.
+        return await self.pipeline([command], input, output)
+
+    async def pipeline(self, commands, input=None, output=True):
+        # Run a list of commands with the output of each feeding the
+        # input of the next, like a shell pipeline. 'input' (bytes) is
+        # written to the first; the last one's output is returned if
+        # 'output' is set. Raises CalledProcessError if any of them
+        # fails.
+        tools = sorted(set(os.path.basename(c[0]) for c in commands))
+        # Take the semaphores in a fixed order, so that two pipelines
+        # can't each be holding one the other is waiting for.
+        for i, tool in enumerate(tools):
+            try:
+                await self.semaphore(tool).acquire()
+            except BaseException:
+                for held in tools[:i]:
+                    self.semaphore(held).release()
+                raise
+        try:
+            return await self._pipeline(commands, input, output)
+        finally:
+            for tool in tools:
+                self.semaphore(tool).release()
+
+    async def _pipeline(self, commands, input, output):
+        procs = []
+        errors = []
+        readers = []
+        waiters = []
+        fds = []
+        try:
+            for i, command in enumerate(commands):
+                if i == 0:
+                    stdin = subprocess.PIPE if input is not None else subprocess.DEVNULL
+                else:
+                    stdin = fds.pop(0)
+                if i < len(commands) - 1:
+                    r, w = os.pipe()
+                    fds.extend([r, w])
+                    stdout = w
+                else:
+                    stdout = subprocess.PIPE if output else subprocess.DEVNULL
+                proc = await asyncio.create_subprocess_exec(
+                    *command, stdin=stdin, stdout=stdout,
+                    stderr=subprocess.PIPE)
+                # The child has its own copies of the pipe ends now.
+                if i > 0:
+                    os.close(stdin)
+                if i < len(commands) - 1:
+                    fds.remove(stdout)
+                    os.close(stdout)
+                procs.append(proc)
+                waiters.append(asyncio.ensure_future(
+                    self.wait(proc, os.path.basename(command[0]))))
+                lines = []
+                errors.append(lines)
+                readers.append(asyncio.ensure_future(
+                    collect(proc.stderr, lines)))
+
+            if input is not None:
+                writer = asyncio.ensure_future(feed(procs[0].stdin, input))
+            else:
+                writer = None
+            data = await procs[-1].stdout.read() if output else None
+            if writer is not None:
+                await writer
+            await asyncio.gather(*readers)
+            await asyncio.gather(*waiters)
+        except BaseException:
+            # Including cancellation: don't leave anything running.
+            for proc in procs:
+                if proc.returncode is None:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+            for proc in procs:
+                await asyncio.shield(proc.wait())
+            for task in readers + waiters:
+                task.cancel()
+            raise
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        for i, (command, proc, lines) in enumerate(zip(commands, procs, errors)):
+            # As in a shell, a command stopped by SIGPIPE because the
+            # next one stopped reading isn't an error in itself.
+            if proc.returncode != 0 and not (i < len(procs) - 1 and
+                                             proc.returncode == -signal.SIGPIPE):
+                stderr = b"".join(lines)
+                sys.stderr.write(stderr.decode("UTF-8", "replace"))
+                raise subprocess.CalledProcessError(
+                    proc.returncode, command, stderr=stderr)
+        return data
+
+    async def wait(self, proc, tool):
+        # Wait for a process to finish, noting how long it ran for.
+        start = time.perf_counter()
+        await proc.wait()
+        if self.times is not None:
+            self.times[tool] = (self.times.get(tool, 0) +
+                                time.perf_counter() - start)
+
+async def collect(stream, lines):
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        lines.append(line)
+
+async def feed(stream, data):
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass # the program quit early; its exit status will say why
+    stream.close()
+
+def run(command, input=None, output=False):
+    # Run a single command synchronously, for callers with no event
+    # loop of their own.
+    return asyncio.run(ToolRunner().run(command, input, output))
+
+def pipeline(commands, input=None, output=True, times=None):
+    # Run one pipeline synchronously, on an event loop of its own.
+    return asyncio.run(ToolRunner(times=times).pipeline(commands, input, output))
+
+class LoopThread:
+    # An event loop running on a thread of its own, to which ordinary
+    # synchronous code can hand coroutines.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name="tools", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        # Start running a coroutine, returning a concurrent.futures.Future
+        # for its result.
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        # Cancel anything still running, wait for it to clean up (i.e.
+        # for its processes to be killed), and stop the loop.
+        async def cancel_all():
+            tasks = [t for t in asyncio.all_tasks()
+                     if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.submit(cancel_all()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,426 @@
+# Pure-Python bitmap tracer, as an alternative to potrace.
+#
+# Takes a psrender.Bitmap and returns an Outline in the same
+# coordinate system get_ps_path has always produced from potrace's
+# output, i.e. 40 units to the PostScript point, measured up and
+# right from the lower left corner of the canvas.
+#
+# The method is a simplified version of what potrace does. We walk
+# the cracks between black and white pixels to get each boundary as
+# a closed lattice polygon; smooth off the pixel staircase by taking
+# the midpoints of its edges; look for sharp
+# corners; and then fit cubic Beziers to the smooth stretches between
+# corners using the least-squares method from Philip Schneider's
+# 'An Algorithm for Automatically Fitting Digitized Curves' (Graphics
+# Gems, 1990).
+
+import math
+from outline import Outline
+
+# Boundaries enclosing no more than this many pixels are discarded,
+# as potrace does by default.
+TURDSIZE = 2
+# Maximum distance, in pixels, between the fitted curves and the
+# smoothed boundary.
+TOLERANCE = 0.5
+# A point of the smoothed boundary is a corner if the direction of
+# the boundary turns by more than CORNER_ANGLE across a distance of
+# CORNER_SPAN pixels either side of it.
+CORNER_SPAN = 3.0
+CORNER_ANGLE = math.radians(55)
+# Two boundary edges at least this many pixels long meeting at right
+# angles are taken to be a real corner rather than part of a staircase.
+CORNER_EDGE = 4
+# Distance, in pixels, over which to estimate the direction of the
+# boundary at the ends of each curve.
+TANGENT_SPAN = 10.0
+
+def bitmap_runs(bitmap):
+    # Return a list giving, for each row of the bitmap, the (x0,x1)
+    # extents of its runs of black pixels. The bitmap's data may be
+    # a bytearray or the mmap of a shared buffer; both can be searched
+    # in place, so we never copy any of it.
+    w = bitmap.width
+    data = bitmap.data
+    runs = []
+    for y in range(bitmap.height):
+        start, end = y*w, (y+1)*w
+        row = []
+        pos = data.find(b"\x01", start, end)
+        while pos >= 0:
+            stop = data.find(b"\x00", pos, end)
+            if stop < 0:
+                stop = end
+            row.append((pos - start, stop - start))
+            pos = data.find(b"\x01", stop, end)
+        runs.append(row)
+    return runs
+
+def interval_difference(a, b):
+    # The parts of the sorted disjoint intervals in a which aren't
+    # covered by any of those in b.
+    out = []
+    k = 0
+    nb = len(b)
+    for x0, x1 in a:
+        while k < nb and b[k][1] <= x0:
+            k += 1
+        cur = x0
+        kk = k
+        while kk < nb and b[kk][0] < x1:
+            if b[kk][0] > cur:
+                out.append((cur, b[kk][0]))
+            cur = max(cur, b[kk][1])
+            kk += 1
+        if cur < x1:
+            out.append((cur, x1))
+    return out
+
+def crack_edges(runs):
+    # Build the directed graph of boundary edges between black and
+    # white pixels, oriented so that black is always on the left.
+    # Vertical edges are one pixel long; horizontal ones run the full
+    # length of each stretch where a row differs from the one below.
+    edges = {}
+    prev = []
+    for y in range(len(runs) + 1):
+        cur = runs[y] if y < len(runs) else []
+        for x0, x1 in cur:
+            edges.setdefault((x0, y+1), []).append((x0, y))
+            edges.setdefault((x1, y), []).append((x1, y+1))
+        for x0, x1 in interval_difference(cur, prev):
+            edges.setdefault((x0, y), []).append((x1, y))
+        for x0, x1 in interval_difference(prev, cur):
+            edges.setdefault((x1, y), []).append((x0, y))
+        prev = cur
+    return edges
+
+def sign(v):
+    return (v > 0) - (v < 0)
+
+def trace_contours(edges):
+    # Chain the edges into closed lattice polygons, keeping only the
+    # vertices at which the direction changes. Where two black pixels
+    # meet at a corner we always turn left, so that they end up in
+    # the same boundary.
+    contours = []
+    for start in list(edges):
+        while edges.get(start):
+            pts = [start]
+            cur = start
+            d = None
+            while True:
+                outs = edges[cur]
+                if len(outs) == 1 or d is None:
+                    nxt = outs.pop()
+                else:
+                    best = None
+                    for m, cand in enumerate(outs):
+                        ex = sign(cand[0] - cur[0])
+                        ey = sign(cand[1] - cur[1])
+                        turn = d[0]*ey - d[1]*ex
+                        if best is None or turn > best[0]:
+                            best = (turn, m)
+                    nxt = outs.pop(best[1])
+                if not outs:
+                    del edges[cur]
+                nd = (sign(nxt[0] - cur[0]), sign(nxt[1] - cur[1]))
+                if nd == d:
+                    pts[-1] = nxt
+                else:
+                    pts.append(nxt)
+                cur = nxt
+                d = nd
+                if cur == start:
+                    break
+            # The closing vertex duplicates the starting one; and the
+            # starting vertex may be in the middle of a straight edge.
+            pts.pop()
+            if len(pts) > 2:
+                contours.append(remove_collinear(pts))
+    return contours
+
+def remove_collinear(pts):
+    out = []
+    n = len(pts)
+    for i in range(n):
+        (ax, ay), (bx, by), (cx, cy) = pts[i-1], pts[i], pts[(i+1) % n]
+        if (bx-ax)*(cy-by) != (by-ay)*(cx-bx):
+            out.append(pts[i])
+    return out
+
+def polygon_area(pts):
+    area = 0
+    for i in range(len(pts)):
+        (x0, y0), (x1, y1) = pts[i-1], pts[i]
+        area += x0*y1 - x1*y0
+    return area / 2.0
+
+def smooth(poly):
+    # Replace the lattice polygon by the midpoints of its edges, which
+    # puts the points of a pixel staircase on the line it approximates.
+    # Where two long edges meet, though, that would cut off what is
+    # probably a genuine corner, so there we keep the vertex itself.
+    # Then fill in extra points along the long stretches, so that the
+    # curve fitter always has something to hold on to.
+    n = len(poly)
+    lengths = [abs(poly[(i+1) % n][0] - poly[i][0]) + abs(poly[(i+1) % n][1] - poly[i][1])
+               for i in range(n)]
+    mids = []
+    for i in range(n):
+        (x0, y0), (x1, y1) = poly[i], poly[(i+1) % n]
+        if lengths[i] >= CORNER_EDGE and lengths[i-1] >= CORNER_EDGE:
+            mids.append((x0, y0))
+        mids.append(((x0 + x1) / 2.0, (y0 + y1) / 2.0))
+    out = []
+    for i in range(len(mids)):
+        (x0, y0), (x1, y1) = mids[i-1], mids[i]
+        k = int(math.hypot(x1-x0, y1-y0) // 2)
+        for m in range(1, k):
+            out.append((x0 + (x1-x0)*m/k, y0 + (y1-y0)*m/k))
+        out.append((x1, y1))
+    return out
+
+def find_corners(pts):
+    # Return the indices of the corners of a closed smoothed boundary.
+    n = len(pts)
+    arc = [0.0] * (n+1)
+    for i in range(n):
+        (x0, y0), (x1, y1) = pts[i], pts[(i+1) % n]
+        arc[i+1] = arc[i] + math.hypot(x1-x0, y1-y0)
+    total = arc[n]
+    if total < 4 * CORNER_SPAN:
+        return []
+    # For each point find the angle turned between the points
+    # CORNER_SPAN behind it and CORNER_SPAN ahead of it, using two
+    # pointers that chase round the loop.
+    angles = [0.0] * n
+    ahead = 0
+    behind = 0
+    for i in range(n):
+        while arc_dist(arc, total, i, ahead % n) < CORNER_SPAN:
+            ahead += 1
+        while behind < i + n and arc_dist(arc, total, (behind + 1) % n, i) >= CORNER_SPAN:
+            behind += 1
+        (ax, ay), (bx, by), (cx, cy) = pts[behind % n], pts[i], pts[ahead % n]
+        a1 = math.atan2(by-ay, bx-ax)
+        a2 = math.atan2(cy-by, cx-bx)
+        turn = abs((a2 - a1 + math.pi) % (2*math.pi) - math.pi)
+        angles[i] = turn
+    # Keep the local maxima that exceed the threshold.
+    corners = []
+    for i in range(n):
+        if angles[i] <= CORNER_ANGLE:
+            continue
+        j = i - 1
+        ok = True
+        while ok and arc_dist(arc, total, j % n, i) < CORNER_SPAN:
+            if angles[j % n] > angles[i] or (angles[j % n] == angles[i] and j % n < i):
+                ok = False
+            j -= 1
+        j = i + 1
+        while ok and arc_dist(arc, total, i, j % n) < CORNER_SPAN:
+            if angles[j % n] > angles[i] or (angles[j % n] == angles[i] and j % n < i):
+                ok = False
+            j += 1
+        if ok:
+            corners.append(i)
+    return corners
+
+def arc_dist(arc, total, i, j):
+    # Distance travelled forwards round the loop from point i to j.
+    d = arc[j] - arc[i]
+    return d if d >= 0 else d + total
+
+def normalise(x, y):
+    d = math.hypot(x, y)
+    if d == 0:
+        return 0.0, 0.0
+    return x/d, y/d
+
+def tangent(pts, i, ahead, behind):
+    # Unit tangent at pts[i], estimated from the chord between the
+    # points up to the given arc distances ahead of and behind it.
+    # (Using only the immediate neighbours would let the pixel
+    # staircase throw it off badly.)
+    def walk(step, dist):
+        j = i
+        travelled = 0.0
+        while dist > 0 and 0 <= j + step < len(pts):
+            travelled += math.hypot(pts[j+step][0] - pts[j][0],
+                                    pts[j+step][1] - pts[j][1])
+            if travelled > dist and j != i:
+                break
+            j += step
+        return pts[j]
+    (ax, ay), (bx, by) = walk(-1, behind), walk(1, ahead)
+    return normalise(bx - ax, by - ay)
+
+def piece_length(pts):
+    return sum(math.hypot(pts[i][0] - pts[i-1][0], pts[i][1] - pts[i-1][1])
+               for i in range(1, len(pts)))
+
+def bezier_point(b, t):
+    mt = 1 - t
+    b0, b1, b2, b3 = mt*mt*mt, 3*mt*mt*t, 3*mt*t*t, t*t*t
+    return (b0*b[0] + b1*b[2] + b2*b[4] + b3*b[6],
+            b0*b[1] + b1*b[3] + b2*b[5] + b3*b[7])
+
+def chord_params(pts):
+    u = [0.0]
+    for i in range(1, len(pts)):
+        u.append(u[-1] + math.hypot(pts[i][0]-pts[i-1][0], pts[i][1]-pts[i-1][1]))
+    total = u[-1]
+    return [v / total for v in u]
+
+def generate_bezier(pts, u, t1, t2):
+    # Least-squares fit of the two inner control points, given the
+    # end points and the directions of the end tangents.
+    p0x, p0y = pts[0]
+    p3x, p3y = pts[-1]
+    c00 = c01 = c11 = x0 = x1 = 0.0
+    for (px, py), t in zip(pts, u):
+        mt = 1 - t
+        b0, b1, b2, b3 = mt*mt*mt, 3*mt*mt*t, 3*mt*t*t, t*t*t
+        a1x, a1y = t1[0]*b1, t1[1]*b1
+        a2x, a2y = t2[0]*b2, t2[1]*b2
+        c00 += a1x*a1x + a1y*a1y
+        c01 += a1x*a2x + a1y*a2y
+        c11 += a2x*a2x + a2y*a2y
+        tx = px - (p0x*(b0+b1) + p3x*(b2+b3))
+        ty = py - (p0y*(b0+b1) + p3y*(b2+b3))
+        x0 += a1x*tx + a1y*ty
+        x1 += a2x*tx + a2y*ty
+    det = c00*c11 - c01*c01
+    seg = math.hypot(p3x-p0x, p3y-p0y)
+    if abs(det) > 1e-12:
+        al = (x0*c11 - x1*c01) / det
+        ar = (c00*x1 - c01*x0) / det
+    else:
+        al = ar = 0.0
+    if al < 1e-6*seg or ar < 1e-6*seg:
+        al = ar = seg / 3.0
+    return (p0x, p0y, p0x + t1[0]*al, p0y + t1[1]*al,
+            p3x + t2[0]*ar, p3y + t2[1]*ar, p3x, p3y)
+
+def max_error(pts, b, u):
+    worst = 0.0
+    split = len(pts) // 2
+    for i in range(1, len(pts)-1):
+        x, y = bezier_point(b, u[i])
+        d = (x - pts[i][0])**2 + (y - pts[i][1])**2
+        if d > worst:
+            worst = d
+            split = i
+    return worst, split
+
+def reparameterise(pts, b, u):
+    # One Newton-Raphson step towards the parameter of the nearest
+    # point on the curve to each data point.
+    out = []
+    d1 = [3*(b[2]-b[0]), 3*(b[3]-b[1]), 3*(b[4]-b[2]), 3*(b[5]-b[3]),
+          3*(b[6]-b[4]), 3*(b[7]-b[5])]
+    d2 = [2*(d1[2]-d1[0]), 2*(d1[3]-d1[1]), 2*(d1[4]-d1[2]), 2*(d1[5]-d1[3])]
+    for (px, py), t in zip(pts, u):
+        mt = 1 - t
+        qx, qy = bezier_point(b, t)
+        q1x = mt*mt*d1[0] + 2*mt*t*d1[2] + t*t*d1[4]
+        q1y = mt*mt*d1[1] + 2*mt*t*d1[3] + t*t*d1[5]
+        q2x = mt*d2[0] + t*d2[2]
+        q2y = mt*d2[1] + t*d2[3]
+        num = (qx-px)*q1x + (qy-py)*q1y
+        den = q1x*q1x + q1y*q1y + (qx-px)*q2x + (qy-py)*q2y
+        if den != 0:
+            t = min(max(t - num/den, 0.0), 1.0)
+        out.append(t)
+    return out
+
+def is_straight(pts, tol2):
+    (x0, y0), (x1, y1) = pts[0], pts[-1]
+    dx, dy = x1-x0, y1-y0
+    l2 = dx*dx + dy*dy
+    if l2 == 0:
+        return False
+    for px, py in pts[1:-1]:
+        c = (px-x0)*dy - (py-y0)*dx
+        if c*c > tol2 * l2:
+            return False
+    return True
+
+def fit_cubic(pts, t1, t2, tol2, out):
+    # Append to out a list of segments approximating pts: either
+    # (x0,y0,x1,y1) straight lines or 8-tuples of Bezier control
+    # points. t1 and t2 are unit tangents pointing into the curve at
+    # each end.
+    if len(pts) == 2 or is_straight(pts, tol2):
+        out.append(pts[0] + pts[-1])
+        return
+    u = chord_params(pts)
+    b = generate_bezier(pts, u, t1, t2)
+    err, split = max_error(pts, b, u)
+    if err < tol2:
+        out.append(b)
+        return
+    if err < 16 * tol2:
+        for it in range(4):
+            u = reparameterise(pts, b, u)
+            b = generate_bezier(pts, u, t1, t2)
+            err, split = max_error(pts, b, u)
+            if err < tol2:
+                out.append(b)
+                return
+    split = min(max(split, 1), len(pts)-2)
+    tc = tangent(pts, split, TANGENT_SPAN, TANGENT_SPAN)
+    tc = (-tc[0], -tc[1])
+    fit_cubic(pts[:split+1], t1, tc, tol2, out)
+    fit_cubic(pts[split:], (-tc[0], -tc[1]), t2, tol2, out)
+
+def fit_contour(pts):
+    # Fit a closed smoothed boundary, returning its list of segments.
+    n = len(pts)
+    tol2 = TOLERANCE * TOLERANCE
+    corners = find_corners(pts)
+    segs = []
+    if not corners:
+        # No corners, so split the loop in two at a pair of points
+        # where we make the tangents match up.
+        cuts = [0, n // 2]
+        ring = pts[n//2:] + pts + pts[:n//2]
+        tangents = [tangent(ring, c + n - n//2, TANGENT_SPAN, TANGENT_SPAN)
+                    for c in cuts]
+        for k in range(2):
+            a, b = cuts[k], cuts[(k+1) % 2]
+            piece = pts[a:] + pts[:b+1] if b <= a else pts[a:b+1]
+            ta, tb = tangents[k], tangents[(k+1) % 2]
+            fit_cubic(piece, ta, (-tb[0], -tb[1]), tol2, segs)
+        return segs
+    for k in range(len(corners)):
+        a, b = corners[k], corners[(k+1) % len(corners)]
+        piece = pts[a:] + pts[:b+1] if b <= a else pts[a:b+1]
+        if len(piece) < 2:
+            continue
+        span = min(TANGENT_SPAN, piece_length(piece) / 3)
+        t1 = tangent(piece, 0, span, 0)
+        t2 = tangent(piece, len(piece)-1, 0, span)
+        t2 = (-t2[0], -t2[1])
+        fit_cubic(piece, t1, t2, tol2, segs)
+    return segs
+
+def trace(bitmap, res):
+    # Trace a bitmap rendered at res pixels to the PostScript point.
+    path = Outline()
+    scale = 40.0 / res
+    for poly in trace_contours(crack_edges(bitmap_runs(bitmap))):
+        if abs(polygon_area(poly)) <= TURDSIZE:
+            continue
+        segs = fit_contour(smooth(poly))
+        if not segs:
+            continue
+        path.moveto(segs[0][0]*scale, segs[0][1]*scale)
+        for s in segs:
+            if len(s) == 4:
+                path.lineto(*[v*scale for v in s])
+            else:
+                path.curveto(*[v*scale for v in s])
+        path.closepath()
+    return path